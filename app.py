@@ -1,9 +1,25 @@
 from flask import Flask
 from models import db, init_models
+from models.routing import READONLY_BIND, init_routing, readonly_uri
+from models.migrate import upgrade_schema
 from controllers.main import main_bp
 from controllers.auth import auth_bp
 from controllers.admin import admin_bp
 from controllers.user import user_bp
+from controllers.assets import assets_bp
+from controllers.api import api_bp
+from services.rollups import init_rollups
+from services.catalog import init_catalog
+from services.recommendations import init_recommendations
+from services.series import init_series
+from services.submissions import init_submissions
+from services.jobs import init_jobs
+from services.sharding import init_sharding, shard_binds
+from services.assets import init_assets
+from services.compression import init_compression
+from services.profiling import init_profiling
+from services.fragments import init_fragments
+from commands import register_commands
 from utils import create_admin
 import os
 
@@ -12,16 +28,52 @@ def create_app():
     
     # Configuration
     app.config['SECRET_KEY'] = '3d7a44959689295302db6b362b049ed1c2ef3daeab84a5c0d878ea999f8f7a7a'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quiz_master.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('QUIZMASTER_DATABASE_URI', 'sqlite:///quiz_master.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    app.config['SQLALCHEMY_BINDS'] = {}
+    
+    # Read-only bind for reporting queries: a replica if configured,
+    # otherwise read-only connections to the same SQLite file
+    readonly_database_uri = os.environ.get('QUIZMASTER_READONLY_DATABASE_URI') or \
+        readonly_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+    if readonly_database_uri:
+        app.config['SQLALCHEMY_BINDS'][READONLY_BIND] = readonly_database_uri
+    
+    # Cold store for attempts moved out of the score table by `flask archive run`
+    app.config['SQLALCHEMY_BINDS']['archive'] = os.environ.get(
+        'QUIZMASTER_ARCHIVE_DATABASE_URI', 'sqlite:///quiz_master_archive.db')
+    app.config['QUIZMASTER_ARCHIVE_AFTER_DAYS'] = int(os.environ.get('QUIZMASTER_ARCHIVE_AFTER_DAYS', 365))
+    
+    # Recency weighting of the recommended-practice panel
+    app.config['QUIZMASTER_RECOMMEND_HALF_LIFE_DAYS'] = float(os.environ.get('QUIZMASTER_RECOMMEND_HALF_LIFE_DAYS', 30))
+    
+    # Per-user score timelines behind the progress charts
+    app.config['QUIZMASTER_SERIES_DIR'] = os.environ.get('QUIZMASTER_SERIES_DIR')
+    
+    # Optionally spread score data over N SQLite files by user
+    app.config['QUIZMASTER_SCORE_SHARDS'] = int(os.environ.get('QUIZMASTER_SCORE_SHARDS', 0))
+    app.config['SQLALCHEMY_BINDS'].update(
+        shard_binds(app.config['SQLALCHEMY_DATABASE_URI'], app.config['QUIZMASTER_SCORE_SHARDS']))
+    
+    # Subtrees with more dependent rows than this are deleted in chunks
+    app.config['QUIZMASTER_CHUNKED_DELETE_THRESHOLD'] = int(os.environ.get('QUIZMASTER_CHUNKED_DELETE_THRESHOLD', 50000))
+    
     # Initialize database
     db.init_app(app)
     
     # Initialize models
     with app.app_context():
         init_models()
+        init_routing(db)
+        init_rollups()
+        init_catalog()
+        init_recommendations()
+        init_series()
+        init_submissions()
         db.create_all()
+        upgrade_schema()
+        init_sharding()
         create_admin()
     
     # Register blueprints
@@ -29,9 +81,54 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(user_bp)
+    app.register_blueprint(assets_bp)
+    app.register_blueprint(api_bp)
+    
+    # Fingerprinted static files and gzip for large HTML/JSON responses
+    init_assets(app)
+    app.config['QUIZMASTER_GZIP_MIN_SIZE'] = int(os.environ.get('QUIZMASTER_GZIP_MIN_SIZE', 1024))
+    init_compression(app)
+    
+    # Quiz caches warmed ahead of each quiz's date, checked every 15 minutes by default
+    app.config['QUIZMASTER_WARMUP_INTERVAL_MINUTES'] = int(os.environ.get('QUIZMASTER_WARMUP_INTERVAL_MINUTES', 15))
+    app.config['QUIZMASTER_WARMUP_LEAD_MINUTES'] = int(os.environ.get('QUIZMASTER_WARMUP_LEAD_MINUTES', 60))
+    init_fragments(app)
+    
+    # Live hosted quizzes, served by live_server.py and reached at QUIZMASTER_LIVE_URL
+    # (same-origin /live behind the proxy, or a full URL to the live server)
+    app.config['QUIZMASTER_LIVE_URL'] = os.environ.get('QUIZMASTER_LIVE_URL', '/live')
+    app.config['QUIZMASTER_LIVE_BIND'] = os.environ.get('QUIZMASTER_LIVE_BIND', '127.0.0.1:8001')
+    app.config['QUIZMASTER_LIVE_TICK'] = float(os.environ.get('QUIZMASTER_LIVE_TICK', 0.25))
+    app.config['QUIZMASTER_LIVE_BROKER'] = os.environ.get('QUIZMASTER_LIVE_BROKER', 'services.pubsub:LocalBroker')
+    app.config['QUIZMASTER_LIVE_ALLOWED_ORIGINS'] = [
+        origin for origin in os.environ.get('QUIZMASTER_LIVE_ALLOWED_ORIGINS', '').split(',') if origin]
+    
+    # Online backups of the SQLite files; hourly with QUIZMASTER_BACKUP_INTERVAL_MINUTES=60
+    app.config['QUIZMASTER_BACKUP_DIR'] = os.environ.get('QUIZMASTER_BACKUP_DIR')
+    app.config['QUIZMASTER_BACKUP_INTERVAL_MINUTES'] = int(os.environ.get('QUIZMASTER_BACKUP_INTERVAL_MINUTES', 0))
+    app.config['QUIZMASTER_BACKUP_KEEP'] = int(os.environ.get('QUIZMASTER_BACKUP_KEEP', 48))
+    app.config['QUIZMASTER_BACKUP_STEP_PAGES'] = int(os.environ.get('QUIZMASTER_BACKUP_STEP_PAGES', 256))
+    app.config['QUIZMASTER_BACKUP_STEP_SLEEP'] = float(os.environ.get('QUIZMASTER_BACKUP_STEP_SLEEP', 0.01))
+    
+    # Opt-in request profiling; admins arm captures from /admin/profiling
+    app.config['QUIZMASTER_PROFILING'] = os.environ.get('QUIZMASTER_PROFILING', '').lower() in ('1', 'true', 'yes')
+    app.config['QUIZMASTER_PROFILE_DIR'] = os.environ.get('QUIZMASTER_PROFILE_DIR')
+    app.config['QUIZMASTER_PROFILE_SAMPLE_RATE'] = float(os.environ.get('QUIZMASTER_PROFILE_SAMPLE_RATE', 0))
+    app.config['QUIZMASTER_PROFILE_MODE'] = os.environ.get('QUIZMASTER_PROFILE_MODE', 'cprofile')
+    app.config['QUIZMASTER_PROFILE_KEEP'] = int(os.environ.get('QUIZMASTER_PROFILE_KEEP', 200))
+    init_profiling(app)
+    
+    # Background jobs for heavy admin operations
+    app.config['QUIZMASTER_JOB_CONCURRENCY'] = int(os.environ.get('QUIZMASTER_JOB_CONCURRENCY', 2))
+    init_jobs(app)
+    
+    # Register maintenance commands
+    register_commands(app)
     
     return app
 
 if __name__ == '__main__':
+    from services.health import warm_up
     app = create_app()
+    warm_up(app)
     app.run(debug=True)
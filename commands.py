@@ -0,0 +1,161 @@
+"""
+Maintenance commands, run through the Flask CLI, e.g.
+
+    flask --app app rollups backfill --since 2024-01-01
+"""
+
+import click
+from datetime import datetime, timedelta
+from flask.cli import AppGroup
+from flask import current_app
+from services import archive, assets, backup, catalog, recommendations, rollups, series, warmup
+
+def parse_day(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise click.BadParameter('expected YYYY-MM-DD')
+
+rollups_cli = AppGroup('rollups', help='Maintain the daily analytics rollup tables.')
+
+@rollups_cli.command('backfill')
+@click.option('--since', callback=parse_day, help='First day to rebuild (default: start of history).')
+@click.option('--until', callback=parse_day, help='Last day to rebuild (default: today).')
+def rollups_backfill(since, until):
+    """Rebuild rollups from raw scores and registrations"""
+    written = rollups.backfill(since, until)
+    click.echo(f'Rebuilt rollups: {written} rows written')
+
+@rollups_cli.command('compact')
+def rollups_compact():
+    """Purge closed-day markers and rollups for deleted content"""
+    removed = rollups.compact()
+    click.echo(f'Compacted rollups: {removed} rows removed')
+
+assets_cli = AppGroup('assets', help='Build fingerprinted, precompressed static files.')
+
+@assets_cli.command('build')
+def assets_build():
+    """Hash and gzip everything under static/ into instance/assets"""
+    manifest = assets.build(current_app)
+    for logical, hashed in sorted(manifest.items()):
+        click.echo(f'{logical} -> {hashed}')
+
+archive_cli = AppGroup('archive', help='Move old quiz attempts to the cold archive.')
+
+@archive_cli.command('run')
+@click.option('--older-than-days', type=int,
+              help='Archive attempts older than this (default: QUIZMASTER_ARCHIVE_AFTER_DAYS).')
+def archive_run(older_than_days):
+    """Move old attempts from the score table into the archive database"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days) if older_than_days is not None else None
+    moved = archive.archive_scores(cutoff)
+    click.echo(f'Archived {moved} attempts')
+
+@archive_cli.command('purge')
+def archive_purge():
+    """Drop archived attempts at quizzes that no longer exist"""
+    dropped = archive.purge_deleted_quizzes()
+    click.echo(f'Dropped {dropped} archived attempts')
+
+recommendations_cli = AppGroup('recommendations', help='Maintain the recommended-practice table.')
+
+@recommendations_cli.command('rebuild')
+def recommendations_rebuild():
+    """Recompute every student's chapter weaknesses from their scores"""
+    written = recommendations.rebuild()
+    click.echo(f'Rebuilt recommendations: {written} rows written')
+
+series_cli = AppGroup('series', help='Maintain the per-user score timelines.')
+
+@series_cli.command('reset')
+def series_reset():
+    """Drop every timeline file; each is rebuilt from the scores when next viewed"""
+    removed = series.reset()
+    click.echo(f'Removed {removed} score series')
+
+backup_cli = AppGroup('backup', help='Take, check and restore online database backups.')
+
+@backup_cli.command('run')
+def backup_run():
+    """Back up every database without stopping the site"""
+    def report(percent, message):
+        click.echo(f'\r{int(percent):3d}% {message}'.ljust(70), nl=False)
+
+    try:
+        taken = backup.run(progress=report)
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'\nBacked up {len(taken.databases)} databases to {taken.directory} '
+               f'({taken.size} bytes, {taken.seconds:.1f}s)')
+
+@backup_cli.command('list')
+def backup_list():
+    """Show the completed backups, newest first"""
+    for taken in backup.runs():
+        click.echo(f'{taken.stamp}  {len(taken.databases)} databases  {taken.size:>12} bytes  {taken.seconds:.1f}s')
+
+@backup_cli.command('verify')
+@click.argument('stamp', required=False)
+def backup_verify(stamp):
+    """Check checksums and integrity of a backup (default: the newest)"""
+    try:
+        taken = backup.find(stamp)
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    results = backup.verify(taken)
+    for name, problem in results:
+        click.echo(f'{name}: {problem or "ok"}')
+    if any(problem for _, problem in results):
+        raise click.ClickException(f'backup {taken.stamp} is damaged')
+
+@backup_cli.command('restore')
+@click.argument('stamp')
+@click.confirmation_option(prompt='Stop every app and live server process first. Replace the databases?')
+def backup_restore(stamp):
+    """Put a verified backup back in place of the live databases"""
+    try:
+        restored = backup.restore(backup.find(stamp))
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Restored {", ".join(restored)} from {stamp}')
+
+warmup_cli = AppGroup('warmup', help='Warm caches ahead of upcoming quizzes.')
+
+@warmup_cli.command('status')
+@click.option('--days', default=warmup.REPORT_DAYS, show_default=True, help='How far ahead to look.')
+def warmup_status(days):
+    """Show the warm-up state of upcoming quizzes"""
+    for status in warmup.report(days):
+        warmed = status.warmup.warmed_at.strftime('%Y-%m-%d %H:%M') if status.warmup else '-'
+        due = status.due_at.strftime('%Y-%m-%d %H:%M') if status.due_at else '-'
+        click.echo(f'quiz {status.quiz.id:<6} {status.quiz.date_of_quiz}  from {due:<16}  '
+                   f'{status.state:<9}  warmed {warmed}')
+
+@warmup_cli.command('run')
+@click.argument('quiz_ids', nargs=-1, type=int)
+def warmup_run(quiz_ids):
+    """Warm the given quizzes now (default: every quiz that is due and not warm)"""
+    tree = catalog.current()
+    quizzes = [tree.quiz(quiz_id) for quiz_id in quiz_ids if tree.quiz(quiz_id)] if quiz_ids else warmup.pending(tree)
+    skipped = [quiz for quiz in quizzes if not warmup.steps_of(quiz)]
+    for quiz in skipped:
+        click.echo(f'quiz {quiz.id}: no warm-up steps selected, skipped')
+    quizzes = [quiz for quiz in quizzes if quiz not in skipped]
+    for quiz in quizzes:
+        run = warmup.warm(quiz, tree)
+        click.echo(f'quiz {quiz.id}: {run.rows} rows, {run.fragments} fragments, {run.seconds:.2f}s'
+                   + (f' ({run.error})' if run.error else ''))
+    click.echo(f'Warmed {len(quizzes)} quizzes; workers fill their own caches on their next poll')
+
+def register_commands(app):
+    """Attach all maintenance command groups to the app"""
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(recommendations_cli)
+    app.cli.add_command(series_cli)
+    app.cli.add_command(backup_cli)
+    app.cli.add_command(warmup_cli)
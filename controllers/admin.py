@@ -1,6 +1,6 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort, current_app
 from datetime import datetime, date
-from sqlalchemy import func, extract
+import time
 from models import db
 from models.user import User
 from models.subject import Subject
@@ -8,6 +8,9 @@ from models.chapter import Chapter
 from models.quiz import Quiz
 from models.question import Question
 from models.score import Score
+from models.job import Job
+from models.routing import read_only
+from services import archive, catalog, cloning, deletion, exports, fragments, jobs, metrics, profiling, question_bank, rollups, series, sharding, warmup
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -29,6 +32,7 @@ def admin_required(f):
 
 @admin_bp.route('/dashboard')
 @admin_required
+@read_only
 def dashboard():
     # Get statistics
     total_users = User.query.filter_by(is_admin=False).count()
@@ -36,11 +40,31 @@ def dashboard():
     total_quizzes = Quiz.query.count()
     total_questions = Question.query.count()
     
-    # Get user registration data for the last 6 months
-    user_registration_data = get_user_registration_data()
+    # Chart window, defaults to the last 6 months by month
+    start, end = rollups.default_range()
+    try:
+        if request.args.get('start'):
+            start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        if request.args.get('end'):
+            end = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+    except ValueError:
+        flash('Invalid date format', 'error')
+        start, end = rollups.default_range()
+    if start > end:
+        start, end = end, start
+    
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in rollups.GRANULARITIES:
+        granularity = 'month'
+    
+    # Get user registration data for the selected window
+    user_registration_data = get_user_registration_data(start, end, granularity)
     
     # Get quiz attempts data by subject
-    quiz_attempts_data = get_quiz_attempts_data()
+    quiz_attempts_data = get_quiz_attempts_data(start, end)
+    
+    # Get quiz attempts over time
+    attempts_over_time_data = rollups.attempt_series(start, end, granularity)
     
     return render_template('admin/dashboard.html', 
                          total_users=total_users,
@@ -48,63 +72,27 @@ def dashboard():
                          total_quizzes=total_quizzes,
                          total_questions=total_questions,
                          user_registration_data=user_registration_data,
-                         quiz_attempts_data=quiz_attempts_data)
+                         quiz_attempts_data=quiz_attempts_data,
+                         attempts_over_time_data=attempts_over_time_data,
+                         start=start,
+                         end=end,
+                         granularity=granularity,
+                         granularities=rollups.GRANULARITIES)
 
-def get_user_registration_data():
-    """Get user registration data for the last 6 months"""
-    from datetime import datetime, timedelta
-    import calendar
-    
-    # Get current date and calculate 6 months back
-    now = datetime.now()
-    months_data = []
-    
-    for i in range(5, -1, -1):  # Last 6 months including current
-        # Calculate the month
-        month = now.month - i
-        year = now.year
-        
-        if month <= 0:
-            month += 12
-            year -= 1
-            
-        # Get month name
-        month_name = calendar.month_abbr[month]
-        
-        # Count users registered in this month
-        user_count = User.query.filter(
-            extract('month', User.created_at) == month,
-            extract('year', User.created_at) == year,
-            User.is_admin == False
-        ).count()
-        
-        months_data.append({
-            'label': month_name,
-            'count': user_count
-        })
-    
-    return months_data
-
-def get_quiz_attempts_data():
-    """Get quiz attempts data by subject"""
-    # Get quiz attempts grouped by subject
-    quiz_attempts = db.session.query(
-        Subject.name,
-        func.count(Score.id).label('attempts')
-    ).join(
-        Chapter, Subject.id == Chapter.subject_id
-    ).join(
-        Quiz, Chapter.id == Quiz.chapter_id
-    ).join(
-        Score, Quiz.id == Score.quiz_id
-    ).group_by(Subject.id, Subject.name).all()
+def get_user_registration_data(start, end, granularity='month'):
+    """Get user registrations per day/week/month from the daily rollups"""
+    return rollups.registration_series(start, end, granularity)
+
+def get_quiz_attempts_data(start, end):
+    """Get quiz attempts data by subject from the daily rollups"""
+    quiz_attempts = rollups.attempts_by_subject(start, end)
     
     # If no data, provide some sample subjects
     if not quiz_attempts:
         subjects = Subject.query.limit(5).all()
         return [{'label': subject.name, 'count': 0} for subject in subjects]
     
-    return [{'label': attempt.name, 'count': attempt.attempts} for attempt in quiz_attempts]
+    return quiz_attempts
 
 # Subject management routes
 @admin_bp.route('/subjects')
@@ -147,18 +135,20 @@ def edit_subject(subject_id):
 @admin_bp.route('/subjects/<int:subject_id>/delete', methods=['POST'])
 @admin_required
 def delete_subject(subject_id):
-    subject = Subject.query.get_or_404(subject_id)
-    db.session.delete(subject)
-    db.session.commit()
+    Subject.query.get_or_404(subject_id)
     
-    flash('Subject deleted successfully!', 'success')
+    # Chapters, quizzes, questions and scores go via ON DELETE CASCADE
+    if deletion.delete_subtree('subject', subject_id) == 'scheduled':
+        flash('Subject is being deleted in the background. This may take a few minutes.', 'info')
+    else:
+        flash('Subject deleted successfully!', 'success')
     return redirect(url_for('admin.subjects'))
 
 # Chapter management routes
 @admin_bp.route('/chapters')
 @admin_required
 def chapters():
-    chapters = Chapter.query.join(Subject).all()
+    chapters = catalog.current().chapters
     return render_template('admin/chapters.html', chapters=chapters)
 
 @admin_bp.route('/chapters/add', methods=['GET', 'POST'])
@@ -176,7 +166,7 @@ def add_chapter():
         flash('Chapter added successfully!', 'success')
         return redirect(url_for('admin.chapters'))
     
-    subjects = Subject.query.all()
+    subjects = catalog.current().subjects
     return render_template('admin/add_chapter.html', subjects=subjects)
 
 @admin_bp.route('/chapters/<int:chapter_id>/edit', methods=['GET', 'POST'])
@@ -193,17 +183,18 @@ def edit_chapter(chapter_id):
         flash('Chapter updated successfully!', 'success')
         return redirect(url_for('admin.chapters'))
     
-    subjects = Subject.query.all()
+    subjects = catalog.current().subjects
     return render_template('admin/edit_chapter.html', chapter=chapter, subjects=subjects)
 
 @admin_bp.route('/chapters/<int:chapter_id>/delete', methods=['POST'])
 @admin_required
 def delete_chapter(chapter_id):
-    chapter = Chapter.query.get_or_404(chapter_id)
-    db.session.delete(chapter)
-    db.session.commit()
+    Chapter.query.get_or_404(chapter_id)
     
-    flash('Chapter deleted successfully!', 'success')
+    if deletion.delete_subtree('chapter', chapter_id) == 'scheduled':
+        flash('Chapter is being deleted in the background. This may take a few minutes.', 'info')
+    else:
+        flash('Chapter deleted successfully!', 'success')
     return redirect(url_for('admin.chapters'))
 
 @admin_bp.route('/chapters/<int:chapter_id>/quizzes')
@@ -217,7 +208,7 @@ def chapter_quizzes(chapter_id):
 @admin_bp.route('/quizzes')
 @admin_required
 def quizzes():
-    quizzes = Quiz.query.join(Chapter).join(Subject).all()
+    quizzes = catalog.current().quizzes
     return render_template('admin/quizzes.html', quizzes=quizzes)
 
 @admin_bp.route('/quizzes/add', methods=['GET', 'POST'])
@@ -229,20 +220,30 @@ def add_quiz():
         time_duration = int(request.form['time_duration'])
         remarks = request.form.get('remarks', '')
         
+        try:
+            draw_count, draw_tags = parse_draw_settings(request.form)
+        except ValueError:
+            flash('Tag quotas must look like "algebra:3, geometry:2"', 'error')
+            chapters = catalog.current().chapters
+            return render_template('admin/add_quiz.html', chapters=chapters, **warmup_form_args())
+        
         quiz = Quiz(
             chapter_id=chapter_id,
             date_of_quiz=date_of_quiz,
             time_duration=time_duration,
-            remarks=remarks
+            remarks=remarks,
+            draw_count=draw_count,
+            draw_tags=draw_tags
         )
+        quiz.warmup_minutes, quiz.warmup_steps = parse_warmup_settings(request.form)
         db.session.add(quiz)
         db.session.commit()
         
         flash('Quiz created successfully!', 'success')
         return redirect(url_for('admin.quiz_questions', quiz_id=quiz.id))
     
-    chapters = Chapter.query.join(Subject).all()
-    return render_template('admin/add_quiz.html', chapters=chapters)
+    chapters = catalog.current().chapters
+    return render_template('admin/add_quiz.html', chapters=chapters, **warmup_form_args())
 
 @admin_bp.route('/quizzes/<int:quiz_id>/edit', methods=['GET', 'POST'])
 @admin_required
@@ -254,13 +255,43 @@ def edit_quiz(quiz_id):
         quiz.date_of_quiz = datetime.strptime(request.form['date_of_quiz'], '%Y-%m-%d').date()
         quiz.time_duration = int(request.form['time_duration'])
         quiz.remarks = request.form.get('remarks', '')
+        quiz.warmup_minutes, quiz.warmup_steps = parse_warmup_settings(request.form)
+        
+        try:
+            quiz.draw_count, quiz.draw_tags = parse_draw_settings(request.form)
+        except ValueError:
+            flash('Tag quotas must look like "algebra:3, geometry:2"', 'error')
+            chapters = catalog.current().chapters
+            return render_template('admin/edit_quiz.html', quiz=quiz, chapters=chapters,
+                                   draw_tags_text=request.form.get('draw_tags', ''), **warmup_form_args(quiz))
         
         db.session.commit()
         flash('Quiz updated successfully!', 'success')
         return redirect(url_for('admin.chapter_quizzes', chapter_id=quiz.chapter_id))
     
-    chapters = Chapter.query.join(Subject).all()
-    return render_template('admin/edit_quiz.html', quiz=quiz, chapters=chapters)
+    chapters = catalog.current().chapters
+    return render_template('admin/edit_quiz.html', quiz=quiz, chapters=chapters,
+                           draw_tags_text=question_bank.format_quotas(quiz), **warmup_form_args(quiz))
+
+def parse_draw_settings(form):
+    """(draw_count, draw_tags JSON) from the quiz form; blank count means a fixed quiz"""
+    draw_count = int(form['draw_count']) if form.get('draw_count') else None
+    if draw_count is not None and draw_count < 1:
+        raise ValueError(draw_count)
+    quotas = question_bank.parse_quotas(form.get('draw_tags')) if draw_count else None
+    return draw_count, question_bank.quotas_to_json(quotas)
+
+def parse_warmup_settings(form):
+    """(warmup_minutes, warmup_steps) from the quiz form; a blank lead means the default"""
+    minutes = form.get('warmup_minutes', type=int)
+    return (max(minutes, 0) if minutes is not None else None), warmup.steps_to_text(form.getlist('warmup_steps'))
+
+def warmup_form_args(quiz=None):
+    return {
+        'warmup_steps': warmup.STEPS,
+        'quiz_warmup_steps': warmup.steps_of(quiz) if quiz else warmup.STEPS,
+        'default_warmup_minutes': current_app.config.get('QUIZMASTER_WARMUP_LEAD_MINUTES', warmup.DEFAULT_LEAD_MINUTES),
+    }
 
 @admin_bp.route('/quizzes/<int:quiz_id>/delete', methods=['POST'])
 @admin_required
@@ -271,12 +302,11 @@ def delete_quiz(quiz_id):
     print(f"Found quiz: {quiz}, chapter_id: {chapter_id}")
     
     try:
-        # Cascade delete will handle questions and scores automatically
-        db.session.delete(quiz)
-        db.session.commit()
-        print(f"Quiz {quiz_id} deleted successfully")
-        
-        flash('Quiz deleted successfully!', 'success')
+        # ON DELETE CASCADE removes questions and scores in the database
+        if deletion.delete_subtree('quiz', quiz_id) == 'scheduled':
+            flash('Quiz is being deleted in the background. This may take a few minutes.', 'info')
+        else:
+            flash('Quiz deleted successfully!', 'success')
     except Exception as e:
         print(f"Error deleting quiz {quiz_id}: {str(e)}")
         db.session.rollback()
@@ -284,6 +314,100 @@ def delete_quiz(quiz_id):
     
     return redirect(url_for('admin.chapter_quizzes', chapter_id=chapter_id))
 
+# Cloning and rescheduling routes
+def parse_schedule(form):
+    """(start_date, shift_days, time_duration) from the clone/reschedule
+    form; each is None when left blank"""
+    start_date = datetime.strptime(form['start_date'], '%Y-%m-%d').date() if form.get('start_date') else None
+    shift_days = int(form['shift_days']) if form.get('shift_days') else None
+    time_duration = int(form['time_duration']) if form.get('time_duration') else None
+    if time_duration is not None and time_duration < 1:
+        raise ValueError(time_duration)
+    return start_date, shift_days, time_duration
+
+def clone_summary(counts):
+    return ', '.join(f'{count} {name}' for name, count in counts.items())
+
+@admin_bp.route('/subjects/<int:subject_id>/clone', methods=['GET', 'POST'])
+@admin_required
+def clone_subject(subject_id):
+    subject = Subject.query.get_or_404(subject_id)
+
+    def copy(name, schedule):
+        _, counts = cloning.clone_subject(subject_id, name, *schedule)
+        return counts, url_for('admin.subjects')
+    return clone_form('subject', subject, copy)
+
+@admin_bp.route('/chapters/<int:chapter_id>/clone', methods=['GET', 'POST'])
+@admin_required
+def clone_chapter(chapter_id):
+    chapter = Chapter.query.get_or_404(chapter_id)
+
+    def copy(name, schedule):
+        subject = Subject.query.get_or_404(request.form.get('subject_id', chapter.subject_id, type=int))
+        new_id, counts = cloning.clone_chapter(chapter_id, subject.id, name, *schedule)
+        return counts, url_for('admin.chapter_quizzes', chapter_id=new_id)
+    return clone_form('chapter', chapter, copy)
+
+@admin_bp.route('/quizzes/<int:quiz_id>/clone', methods=['GET', 'POST'])
+@admin_required
+def clone_quiz(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+
+    def copy(name, schedule):
+        chapter = Chapter.query.get_or_404(request.form.get('chapter_id', quiz.chapter_id, type=int))
+        # A bank quiz draws from the bank of the chapter it is copied into
+        moved = quiz.is_bank_draw and chapter.id != quiz.chapter_id
+        problem = question_bank.shortfall(quiz, chapter) if moved else None
+        if problem:
+            raise ValueError(f'Cannot copy this quiz into {chapter.name}: {problem}.')
+        new_id, counts = cloning.clone_quiz(quiz_id, chapter.id, *schedule)
+        return counts, url_for('admin.edit_quiz', quiz_id=new_id)
+    return clone_form('quiz', quiz, copy)
+
+def clone_form(kind, source, copy):
+    """Shared GET/POST handling of the clone pages; copy(name, schedule)
+    returns (counts, url to go to next), or raises ValueError with the
+    reason the copy cannot be made"""
+    if request.method == 'POST':
+        try:
+            schedule = parse_schedule(request.form)
+        except ValueError:
+            flash('Enter a valid start date, day shift and duration.', 'error')
+        else:
+            try:
+                counts, target = copy(request.form.get('name', '').strip() or None, schedule)
+            except ValueError as e:
+                flash(str(e), 'error')
+            else:
+                flash(f'Copied {clone_summary(counts)}.', 'success')
+                return redirect(target)
+
+    return render_template('admin/clone.html', kind=kind, source=source, tree=catalog.current())
+
+@admin_bp.route('/quizzes/reschedule', methods=['POST'])
+@admin_required
+def reschedule_quizzes():
+    quiz_ids = request.form.getlist('quiz_ids', type=int)
+    try:
+        schedule = parse_schedule(request.form)
+    except ValueError:
+        flash('Enter a valid start date, day shift and duration.', 'error')
+        return redirect(url_for('admin.quizzes'))
+    if not quiz_ids:
+        flash('Select the quizzes to reschedule.', 'error')
+        return redirect(url_for('admin.quizzes'))
+
+    changed = cloning.reschedule(quiz_ids, *schedule)
+    flash(f'Rescheduled {changed} quiz(zes).', 'success')
+    return redirect(url_for('admin.quizzes'))
+
+@admin_bp.route('/quizzes/<int:quiz_id>/live')
+@admin_required
+def host_live(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    return render_template('admin/live_host.html', quiz=quiz, live_url=current_app.config['QUIZMASTER_LIVE_URL'])
+
 @admin_bp.route('/quizzes/<int:quiz_id>/questions')
 @admin_required
 def quiz_questions(quiz_id):
@@ -320,14 +444,97 @@ def add_question(quiz_id):
         flash('Question added successfully!', 'success')
         return redirect(url_for('admin.quiz_questions', quiz_id=quiz_id))
     
-    return render_template('admin/add_question.html', quiz=quiz)
+    return render_template('admin/add_question.html', chapter=quiz.chapter, bank=False,
+                           back_url=url_for('admin.quiz_questions', quiz_id=quiz_id))
+
+# Question bank routes
+BANK_PAGE_SIZE = 50
+
+@admin_bp.route('/chapters/<int:chapter_id>/bank')
+@admin_required
+def chapter_bank(chapter_id):
+    chapter = Chapter.query.get_or_404(chapter_id)
+    page = request.args.get('page', 1, type=int)
+    tag = request.args.get('tag') or None
+    
+    query = Question.query.filter_by(chapter_id=chapter_id, quiz_id=None)
+    if tag:
+        query = query.filter_by(tag=tag)
+    questions = query.order_by(Question.id.desc()).paginate(page=page, per_page=BANK_PAGE_SIZE, error_out=False)
+    
+    # Tag counts from the cached id arrays, no extra scan
+    strata = question_bank.bank_ids(chapter)
+    tag_counts = sorted((name, len(ids)) for name, ids in strata.items() if name is not None)
+    
+    return render_template('admin/chapter_bank.html', chapter=chapter, questions=questions,
+                           tag=tag, tag_counts=tag_counts, bank_size=len(strata[None]))
+
+@admin_bp.route('/chapters/<int:chapter_id>/bank/add', methods=['GET', 'POST'])
+@admin_required
+def add_bank_question(chapter_id):
+    chapter = Chapter.query.get_or_404(chapter_id)
+    
+    if request.method == 'POST':
+        question = Question(
+            chapter_id=chapter_id,
+            tag=request.form.get('tag', '').strip() or None,
+            question_statement=request.form['question_statement'],
+            option1=request.form['option1'],
+            option2=request.form['option2'],
+            option3=request.form['option3'],
+            option4=request.form['option4'],
+            correct_option=int(request.form['correct_option'])
+        )
+        
+        db.session.add(question)
+        question_bank.bump_bank_version(chapter_id)
+        db.session.commit()
+        
+        flash('Question added to the bank!', 'success')
+        return redirect(url_for('admin.chapter_bank', chapter_id=chapter_id))
+    
+    return render_template('admin/add_question.html', chapter=chapter, bank=True,
+                           back_url=url_for('admin.chapter_bank', chapter_id=chapter_id))
+
+@admin_bp.route('/chapters/<int:chapter_id>/bank/<int:question_id>/delete', methods=['POST'])
+@admin_required
+def delete_bank_question(chapter_id, question_id):
+    question = Question.query.filter_by(id=question_id, chapter_id=chapter_id, quiz_id=None).first_or_404()
+    
+    db.session.delete(question)
+    question_bank.bump_bank_version(chapter_id)
+    db.session.commit()
+    
+    flash('Question removed from the bank!', 'success')
+    return redirect(url_for('admin.chapter_bank', chapter_id=chapter_id))
 
 # User management routes
 @admin_bp.route('/users')
 @admin_required
+@read_only
 def users():
     users = User.query.filter_by(is_admin=False).all()
-    return render_template('admin/users.html', users=users)
+    totals = archive.archived_totals()
+    for rows in sharding.fan_out(get_user_attempt_stats):
+        for user_id, attempts, scored, questions in rows:
+            cold = totals.get(user_id, (0, 0, 0))
+            totals[user_id] = (attempts + cold[0], scored + cold[1], questions + cold[2])
+    stats = {
+        user_id: {'attempts': attempts, 'average': scored / questions * 100 if questions else 0}
+        for user_id, (attempts, scored, questions) in totals.items()
+    }
+    active_users = [user for user in users if user.id in stats]
+    return render_template('admin/users.html', users=users, stats=stats, active_users=active_users)
+
+@read_only
+def get_user_attempt_stats():
+    """(user_id, attempts, total scored, total questions) per user with attempts"""
+    return db.session.query(
+        Score.user_id,
+        db.func.count(Score.id),
+        db.func.sum(Score.total_scored),
+        db.func.sum(Score.total_questions)
+    ).group_by(Score.user_id).all()
 
 @admin_bp.route('/users/<int:user_id>/toggle_status', methods=['POST'])
 @admin_required
@@ -343,25 +550,172 @@ def toggle_user_status(user_id):
 @admin_required
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
+    full_name = user.full_name
     
     try:
-        # Delete user's scores first
-        Score.query.filter_by(user_id=user_id).delete()
-        
-        # Delete the user
-        db.session.delete(user)
-        db.session.commit()
-        
-        flash(f'User {user.full_name} deleted successfully!', 'success')
+        # The user's scores go via ON DELETE CASCADE
+        if deletion.delete_subtree('user', user_id) == 'scheduled':
+            flash(f'User {full_name} is being deleted in the background.', 'info')
+        else:
+            flash(f'User {full_name} deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error deleting user: {str(e)}', 'error')
     
     return redirect(url_for('admin.users'))
 
+SCORES_PAGE_SIZE = 50
+
 @admin_bp.route('/users/<int:user_id>/scores')
 @admin_required
+@read_only
 def user_scores(user_id):
     user = User.query.get_or_404(user_id)
-    scores = Score.query.filter_by(user_id=user_id).join(Quiz).join(Chapter).join(Subject).all()
-    return render_template('admin/user_scores.html', user=user, scores=scores)
+    page = request.args.get('page', 1, type=int)
+    with sharding.for_user(user_id):
+        scores = archive.history(user_id, page=page, per_page=SCORES_PAGE_SIZE)
+        stats = archive.user_stats(user_id)
+        return render_template('admin/user_scores.html', user=user, scores=scores, stats=stats)
+
+@admin_bp.route('/users/<int:user_id>/progress')
+@admin_required
+@read_only
+def user_progress(user_id):
+    """Downsampled score timeline for the progress chart"""
+    User.query.get_or_404(user_id)
+    with sharding.for_user(user_id):
+        return jsonify(series.chart(user_id, subject_id=request.args.get('subject_id', type=int),
+                                    points=request.args.get('points', series.DEFAULT_POINTS, type=int)))
+
+@admin_bp.route('/metrics')
+@admin_required
+def metrics_snapshot():
+    """This worker's in-process counters and timings"""
+    return jsonify(metrics.snapshot())
+
+# Warm-up routes
+@admin_bp.route('/warmup')
+@admin_required
+def warmup_status():
+    days = min(max(request.args.get('days', warmup.REPORT_DAYS, type=int), 0), 90)
+    return render_template('admin/warmup.html', statuses=warmup.report(days), days=days,
+                           fragments_cached=fragments.cached(),
+                           interval=current_app.config.get('QUIZMASTER_WARMUP_INTERVAL_MINUTES', 0))
+
+@admin_bp.route('/warmup/<int:quiz_id>', methods=['POST'])
+@admin_required
+def warm_quiz(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    if not warmup.steps_of(quiz):
+        flash(f'Quiz #{quiz_id} has no warm-up steps selected.', 'warning')
+        return redirect(url_for('admin.warmup_status'))
+    jobs.submit('warmup', {'quiz_ids': [quiz_id]}, created_by=session['user_id'])
+    flash(f'Warm-up of quiz #{quiz_id} started.', 'success')
+    return redirect(url_for('admin.warmup_status'))
+
+# Profiling routes
+@admin_bp.route('/profiling')
+@admin_required
+def profiling_status():
+    return render_template('admin/profiling.html',
+                           enabled=current_app.config.get('QUIZMASTER_PROFILING', False),
+                           rules=profiling.armed_rules(),
+                           captures=profiling.captures(),
+                           modes=profiling.MODES,
+                           now=time.time())
+
+@admin_bp.route('/profiling/arm', methods=['POST'])
+@admin_required
+def arm_profiling():
+    try:
+        profiling.arm(
+            mode=request.form.get('mode', 'cprofile'),
+            sample_rate=float(request.form.get('sample_rate') or 0) / 100,
+            route=request.form.get('route', '').strip() or None,
+            user_id=int(request.form['user_id']) if request.form.get('user_id') else None,
+            minutes=int(request.form.get('minutes') or profiling.DEFAULT_ARM_MINUTES)
+        )
+    except ValueError as e:
+        flash(f'Could not arm profiling: {e}', 'error')
+        return redirect(url_for('admin.profiling_status'))
+    
+    flash('Profiling armed in every worker.', 'success')
+    return redirect(url_for('admin.profiling_status'))
+
+@admin_bp.route('/profiling/disarm', methods=['POST'])
+@admin_required
+def disarm_profiling():
+    profiling.disarm()
+    flash('Profiling disarmed.', 'success')
+    return redirect(url_for('admin.profiling_status'))
+
+@admin_bp.route('/profiling/captures/<filename>')
+@admin_required
+def profiling_capture(filename):
+    path = profiling.capture_path(filename)
+    if path is None:
+        abort(404)
+    
+    if request.args.get('view') and filename.endswith('.prof'):
+        sort = 'tottime' if request.args.get('sort') == 'tottime' else 'cumulative'
+        return render_template('admin/profile_summary.html', filename=filename, sort=sort,
+                               summary=profiling.summary(path, sort=sort))
+    return send_file(path, as_attachment=True, mimetype='application/octet-stream')
+
+# Background job routes
+JOB_ACTIONS = {
+    'export_scores': 'Score export started.',
+    'recompute_statistics': 'Statistics recomputation started.',
+    'rebuild_recommendations': 'Practice recommendations rebuild started.',
+    'backup': 'Database backup started.',
+    'warmup': 'Cache warm-up of due quizzes started.',
+}
+
+@admin_bp.route('/jobs')
+@admin_required
+def jobs_list():
+    recent_jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return render_template('admin/jobs.html', jobs=recent_jobs)
+
+@admin_bp.route('/jobs/status')
+@admin_required
+def jobs_status():
+    recent_jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return jsonify(jobs=[job.to_dict() for job in recent_jobs])
+
+@admin_bp.route('/jobs/start/<kind>', methods=['POST'])
+@admin_required
+def start_job(kind):
+    if kind not in JOB_ACTIONS:
+        abort(404)
+    
+    jobs.submit(kind, created_by=session['user_id'])
+    flash(JOB_ACTIONS[kind], 'success')
+    return redirect(url_for('admin.jobs_list'))
+
+@admin_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_job(job_id):
+    if jobs.cancel(job_id):
+        flash('Cancellation requested.', 'success')
+    else:
+        flash('Job has already finished.', 'error')
+    return redirect(url_for('admin.jobs_list'))
+
+@admin_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@admin_required
+def retry_job(job_id):
+    if jobs.retry(job_id):
+        flash('Job queued again.', 'success')
+    else:
+        flash('Only failed or cancelled jobs can be retried.', 'error')
+    return redirect(url_for('admin.jobs_list'))
+
+@admin_bp.route('/jobs/<int:job_id>/download')
+@admin_required
+def download_job_result(job_id):
+    job = Job.query.get_or_404(job_id)
+    result = job.result or {}
+    if job.status != 'succeeded' or 'filename' not in result:
+        abort(404)
+    return send_file(exports.export_path(result['filename']), as_attachment=True)
@@ -0,0 +1,337 @@
+"""
+Versioned JSON API for mobile and kiosk clients.
+
+Clients authenticate with `Authorization: Bearer <token>` (from POST
+/api/v1/tokens) and never get a cookie session. Lists of questions and
+scores are sent as arrays of rows with a "fields" header instead of
+repeating keys in every object, and answers come back as a plain array
+in question order.
+"""
+
+import json
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Blueprint, current_app, g, request, abort
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+from werkzeug.security import check_password_hash
+from models import db
+from models.user import User
+from models.quiz import Quiz
+from models.score import Score
+from models.routing import read_only
+from services import api_auth, archive, catalog, grading, metrics, question_bank, sharding, submissions
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+QUESTION_FIELDS = ('statement', 'options')
+SCORE_FIELDS = ['id', 'quiz_id', 'scored', 'total', 'attempted_at']
+MAX_BATCH_SIZE = 100
+SCORES_PAGE_SIZE = 100
+
+def json_response(payload, status=200):
+    """A compact JSON response, without Flask's debug-mode indentation"""
+    body = json.dumps(payload, separators=(',', ':'), default=str)
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+def conditional(payload):
+    """JSON response with a weak ETag; 304 if the client's copy is current.
+
+    Weak, because gzip may change the bytes on the wire but not the content.
+    """
+    response = json_response(payload)
+    response.add_etag(weak=True)
+    return response.make_conditional(request)
+
+@api_bp.errorhandler(HTTPException)
+def handle_http_error(e):
+    return json_response({'error': e.description}, e.code)
+
+def token_required(f):
+    """Authenticate the bearer token; the user is available as g.api_user"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        api_token = api_auth.authenticate(token.strip()) if scheme.lower() == 'bearer' else None
+        if api_token is None:
+            metrics.incr('api.auth_failed')
+            abort(401, description='missing or invalid token')
+        g.api_token = api_token
+        g.api_user = api_token.user
+        with sharding.for_user(g.api_user.id):
+            return f(*args, **kwargs)
+    return decorated_function
+
+def json_body():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, description='expected a JSON object')
+    return data
+
+# Tokens
+
+@api_bp.route('/tokens', methods=['POST'])
+def create_token():
+    data = json_body()
+    user = User.query.filter_by(username=data.get('username')).first()
+    if not user or not check_password_hash(user.password_hash, data.get('password') or ''):
+        abort(401, description='invalid username or password')
+    if user.is_admin:
+        abort(403, description='the API is for student accounts')
+
+    token = api_auth.issue_token(user, name=data.get('name'))
+    return json_response({
+        'token': token,
+        'user': {'id': user.id, 'username': user.username, 'full_name': user.full_name},
+    }, 201)
+
+@api_bp.route('/tokens/current', methods=['DELETE'])
+@token_required
+def revoke_token():
+    api_auth.revoke(g.api_token)
+    return '', 204
+
+# Catalog
+
+@api_bp.route('/catalog')
+@token_required
+@read_only
+def catalog_tree():
+    """Subject -> chapter -> quiz tree, from the worker's cached catalog"""
+    subjects = [{
+        'id': subject.id,
+        'name': subject.name,
+        'description': subject.description,
+        'chapters': [{
+            'id': chapter.id,
+            'name': chapter.name,
+            'description': chapter.description,
+            'quizzes': [{
+                'id': quiz.id,
+                'date': quiz.date_of_quiz.isoformat(),
+                'duration': quiz.time_duration,
+                'questions': quiz.question_count,
+                'remarks': quiz.remarks,
+            } for quiz in sorted(chapter.quizzes, key=lambda quiz: (quiz.date_of_quiz, quiz.id))],
+        } for chapter in subject.chapters],
+    } for subject in catalog.current().subjects]
+
+    return conditional({'subjects': subjects})
+
+# Quiz delivery and submission
+
+def parse_fields():
+    """Question fields requested with ?fields=statement,options (default: all)"""
+    requested = request.args.get('fields')
+    if requested is None:
+        return list(QUESTION_FIELDS)
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = set(fields) - set(QUESTION_FIELDS)
+    if unknown:
+        abort(400, description=f'unknown fields: {", ".join(sorted(unknown))}')
+    return [name for name in QUESTION_FIELDS if name in fields]
+
+def question_row(question, fields):
+    row = [question.id]
+    if 'statement' in fields:
+        row.append(question.question_statement)
+    if 'options' in fields:
+        row.append([question.option1, question.option2, question.option3, question.option4])
+    return row
+
+@api_bp.route('/quizzes/<int:quiz_id>')
+@token_required
+def quiz_payload(quiz_id):
+    """Start an attempt, or re-fetch one by passing ?attempt=<token>.
+
+    Re-fetching returns the same questions in the same order, so it
+    supports If-None-Match. A question deleted since the attempt started
+    keeps its place as [id, null, ...] and is not graded.
+    """
+    quiz = Quiz.query.get_or_404(quiz_id)
+    fields = parse_fields()
+
+    if 'attempt' in request.args:
+        try:
+            attempt_token = request.args['attempt']
+            attempt = api_auth.load_attempt(attempt_token, g.api_user.id, quiz_id)
+            question_ids = attempt_question_ids(quiz, attempt)
+        except api_auth.InvalidAttempt as e:
+            abort(400, description=str(e))
+    else:
+        seed = question_bank.new_seed()
+        version, question_ids = question_bank.draw(quiz, seed)
+        attempt_token = api_auth.sign_attempt(g.api_user.id, quiz, seed, version)
+
+    questions = question_bank.load_drawn(question_ids)
+    if not any(questions):
+        abort(404, description='the questions of this attempt were removed' if 'attempt' in request.args
+              else 'this quiz has no questions yet')
+
+    metrics.incr('api.quiz_payloads')
+    return conditional({
+        'quiz': {
+            'id': quiz.id,
+            'chapter_id': quiz.chapter_id,
+            'date': quiz.date_of_quiz.isoformat(),
+            'duration': quiz.time_duration,
+        },
+        'attempt': attempt_token,
+        'fields': ['id'] + fields,
+        'questions': [question_row(question, fields) if question is not None else [question_id] + [None] * len(fields)
+                      for question_id, question in zip(question_ids, questions)],
+    })
+
+def attempt_question_ids(quiz, attempt):
+    """The ids an attempt was shown, redrawn from its seed and draw version"""
+    try:
+        return question_bank.draw_question_ids(quiz, attempt['s'], attempt['v'])
+    except question_bank.DrawUnavailable:
+        raise api_auth.InvalidAttempt('the questions of this attempt are no longer available')
+
+def record_submission(quiz_id, data):
+    """Grade one submission and add its Score to the session (not committed).
+
+    Returns (score, bank_changed, duplicate); a repeat of an attempt that
+    was already recorded returns that score, ungraded and unwritten.
+    Raises InvalidAttempt or ValueError.
+    """
+    quiz = db.session.get(Quiz, quiz_id) if isinstance(quiz_id, int) else None
+    if quiz is None:
+        raise ValueError('quiz not found')
+
+    attempt = api_auth.load_attempt(data.get('attempt'), g.api_user.id, quiz_id)
+    bank_changed = quiz.is_bank_draw and attempt['v'] != quiz.chapter.bank_version
+    token = submissions.token_for_attempt(data['attempt'])
+    original = submissions.find(token, g.api_user.id)
+    if original is not None:
+        return original, bank_changed, True
+
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        raise ValueError('answers must be an array in question order')
+
+    # Answers line up with the questions shown; ones deleted since are not graded
+    questions = question_bank.load_drawn(attempt_question_ids(quiz, attempt))
+    if len(answers) > len(questions):
+        raise ValueError(f'got {len(answers)} answers for {len(questions)} questions')
+    total_scored, total_questions = grading.grade_drawn(questions, answers)
+    if not total_questions:
+        raise ValueError('the questions of this attempt were removed')
+
+    # Offline attempts keep the time they were taken, within the attempt's lifetime
+    attempted_at = datetime.utcnow()
+    if data.get('submitted_at'):
+        try:
+            submitted_at = datetime.fromisoformat(data['submitted_at'])
+        except (TypeError, ValueError):
+            raise ValueError('submitted_at must be an ISO 8601 timestamp')
+        if submitted_at.tzinfo:
+            submitted_at = submitted_at.astimezone(timezone.utc).replace(tzinfo=None)
+        attempted_at = max(attempt['t'], min(submitted_at, attempted_at))
+
+    score = Score(
+        quiz_id=quiz_id,
+        user_id=g.api_user.id,
+        time_stamp_of_attempt=attempted_at,
+        total_scored=total_scored,
+        total_questions=total_questions,
+        seed=attempt['s'],
+        submission_token=token
+    )
+    db.session.add(score)
+    return score, bank_changed, False
+
+def submission_result(score, bank_changed, duplicate):
+    return {
+        'score_id': score.id,
+        'scored': score.total_scored,
+        'total': score.total_questions,
+        'bank_changed': bank_changed,
+        'duplicate': duplicate,
+    }
+
+@api_bp.route('/quizzes/<int:quiz_id>/submissions', methods=['POST'])
+@token_required
+def submit(quiz_id):
+    Quiz.query.get_or_404(quiz_id)
+    try:
+        score, bank_changed, duplicate = record_submission(quiz_id, json_body())
+    except (api_auth.InvalidAttempt, ValueError) as e:
+        abort(400, description=str(e))
+    if duplicate:
+        submissions.count_duplicates()
+    else:
+        try:
+            score, duplicate = submissions.commit(score)
+        except ValueError as e:
+            abort(400, description=str(e))
+    if duplicate:
+        return json_response(submission_result(score, bank_changed, True))
+
+    metrics.incr('api.submissions')
+    return json_response(submission_result(score, bank_changed, False), 201)
+
+@api_bp.route('/submissions/batch', methods=['POST'])
+@token_required
+def submit_batch():
+    """Submit attempts taken offline, all in one transaction.
+
+    Each item is {quiz_id, attempt, answers, submitted_at?}; results come
+    back in the same order, with an error for items that were rejected.
+    Attempts already recorded (a retried sync) come back as duplicates.
+    """
+    items = json_body().get('submissions')
+    if not isinstance(items, list) or not items:
+        abort(400, description='submissions must be a non-empty array')
+    if len(items) > MAX_BATCH_SIZE:
+        abort(400, description=f'at most {MAX_BATCH_SIZE} submissions per batch')
+
+    for retry in (False, True):
+        recorded = []
+        # Nothing is written until the commit, so a copy that another
+        # worker committed meanwhile can only surface there
+        with db.session.no_autoflush:
+            for item in items:
+                try:
+                    if not isinstance(item, dict):
+                        raise ValueError('each submission must be an object')
+                    recorded.append(record_submission(item.get('quiz_id'), item))
+                except (api_auth.InvalidAttempt, ValueError) as e:
+                    recorded.append(str(e))
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            # A copy of one of these attempts committed first; the second
+            # pass finds it and answers it as a duplicate
+            db.session.rollback()
+            if retry:
+                raise
+
+    results = [
+        {'error': entry} if isinstance(entry, str) else submission_result(*entry)
+        for entry in recorded
+    ]
+    duplicates = sum(1 for entry in recorded if not isinstance(entry, str) and entry[2])
+    submissions.count_duplicates(duplicates)
+    metrics.incr('api.submissions', sum(1 for entry in recorded if not isinstance(entry, str)) - duplicates)
+    metrics.incr('api.batches')
+    return json_response({'results': results})
+
+# History
+
+@api_bp.route('/scores')
+@token_required
+@read_only
+def scores():
+    """The user's attempts, newest first, a page at a time (?page=N)"""
+    history = archive.history(g.api_user.id, page=request.args.get('page', 1, type=int),
+                              per_page=SCORES_PAGE_SIZE)
+    return conditional({
+        'fields': SCORE_FIELDS,
+        'scores': [[score.id, score.quiz_id, score.total_scored, score.total_questions,
+                    score.time_stamp_of_attempt.isoformat()] for score in history.items],
+        'page': history.page,
+        'pages': history.pages,
+    })
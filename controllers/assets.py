@@ -0,0 +1,27 @@
+import mimetypes
+import os
+from flask import Blueprint, abort, current_app, request, send_file
+from services import assets
+
+assets_bp = Blueprint('assets', __name__, url_prefix='/assets')
+
+# Fingerprinted names change with content, so they never need revalidation
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+@assets_bp.route('/<path:filename>')
+def serve(filename):
+    if not assets.is_fingerprinted(filename):
+        abort(404)
+
+    path = os.path.join(assets.build_dir(current_app), filename)
+    gzipped = path + '.gz'
+    use_gzip = request.accept_encodings['gzip'] > 0 and os.path.exists(gzipped)
+
+    response = send_file(gzipped if use_gzip else path,
+                         mimetype=mimetypes.guess_type(filename)[0], max_age=CACHE_MAX_AGE, conditional=True)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
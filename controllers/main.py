@@ -1,9 +1,22 @@
-from flask import Blueprint
+from flask import Blueprint, jsonify
 
 main_bp = Blueprint('main', __name__)
 
 from flask import render_template
+from services.health import is_ready
 
 @main_bp.route('/')
 def index():
     return render_template('index.html')
+
+@main_bp.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify(status='ok')
+
+@main_bp.route('/readyz')
+def readyz():
+    """Readiness: only healthy once this worker has warmed up"""
+    if not is_ready():
+        return jsonify(status='warming up'), 503
+    return jsonify(status='ready')
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort, current_app, jsonify
 from datetime import datetime
 from models import db
 from models.user import User
@@ -7,9 +7,13 @@ from models.chapter import Chapter
 from models.quiz import Quiz
 from models.question import Question
 from models.score import Score
+from models.routing import read_only
+from services import archive, catalog, grading, question_bank, recommendations, series, sharding, submissions
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
 
+SCORES_PAGE_SIZE = 20
+
 def is_logged_in():
     return 'user_id' in session
 
@@ -22,28 +26,35 @@ def user_required(f):
         if not is_logged_in() or is_admin():
             flash('Access denied', 'error')
             return redirect(url_for('auth.login'))
-        return f(*args, **kwargs)
+        with sharding.for_user(session['user_id']):
+            return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
 @user_bp.route('/dashboard')
 @user_required
+@read_only
 def dashboard():
     # Get available subjects
-    subjects = Subject.query.all()
+    subjects = catalog.current().subjects
     
     # Get recent quiz attempts
-    recent_scores = Score.query.filter_by(user_id=session['user_id']).order_by(Score.time_stamp_of_attempt.desc()).limit(5).all()
+    recent_scores = archive.history(session['user_id'], per_page=5).items
+    
+    # Weakest chapters first, from the precomputed per-chapter accuracy
+    practice = recommendations.for_user(session['user_id'])
     
-    return render_template('user/dashboard.html', subjects=subjects, recent_scores=recent_scores)
+    return render_template('user/dashboard.html', subjects=subjects, recent_scores=recent_scores,
+                           practice=practice)
 
 @user_bp.route('/subject/<int:subject_id>')
 @user_required
 def subject_chapters(subject_id):
-    subject = Subject.query.get_or_404(subject_id)
-    chapters = Chapter.query.filter_by(subject_id=subject_id).all()
+    subject = catalog.current().subject(subject_id)
+    if subject is None:
+        abort(404)
     
-    return render_template('user/subject_chapters.html', subject=subject, chapters=chapters)
+    return render_template('user/subject_chapters.html', subject=subject, chapters=subject.chapters)
 
 @user_bp.route('/chapter/<int:chapter_id>/quizzes')
 @user_required
@@ -53,53 +64,101 @@ def chapter_quizzes(chapter_id):
     
     return render_template('user/chapter_quizzes.html', chapter=chapter, quizzes=quizzes)
 
+@user_bp.route('/live')
+@user_required
+def live():
+    code = request.args.get('code', '').strip().upper()
+    if not code:
+        flash('Enter the code your instructor shared.', 'warning')
+        return redirect(url_for('user.dashboard'))
+    
+    return render_template('user/live.html', code=code, live_url=current_app.config['QUIZMASTER_LIVE_URL'])
+
 @user_bp.route('/quiz/<int:quiz_id>/start')
 @user_required
 def start_quiz(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
-    questions = Question.query.filter_by(quiz_id=quiz_id).all()
+    
+    # The seed picks this attempt's questions (bank quizzes) and their order
+    seed = question_bank.new_seed()
+    version, question_ids = question_bank.draw(quiz, seed)
+    questions = question_bank.load_questions(question_ids)
     
     if not questions:
         flash('This quiz has no questions yet.', 'warning')
         return redirect(url_for('user.dashboard'))
     
-    # Store quiz start time in session
+    # Store quiz start time and what it takes to redraw the questions in session
     session['quiz_start_time'] = datetime.utcnow().isoformat()
     session['quiz_id'] = quiz_id
+    session['quiz_seed'] = seed
+    session['quiz_draw_version'] = version
     
-    return render_template('user/take_quiz.html', quiz=quiz, questions=questions)
+    # Submitting the attempt twice returns the first result instead of a second Score
+    return render_template('user/take_quiz.html', quiz=quiz, questions=questions,
+                           submission_token=submissions.new_token())
 
 @user_bp.route('/quiz/<int:quiz_id>/submit', methods=['POST'])
 @user_required
 def submit_quiz(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
-    questions = Question.query.filter_by(quiz_id=quiz_id).all()
     
-    # Calculate score
-    total_questions = len(questions)
-    total_scored = 0
+    # A repeat of an attempt already graded (double submit, retry) gets its result
+    token = request.form.get('submission_token') or None
+    original = submissions.find(token, session['user_id'])
+    if original is not None:
+        submissions.count_duplicates()
+        return redirect(url_for('user.quiz_result', score_id=original.id))
+    
+    # Grade exactly the questions this attempt was shown, redrawn from its seed
+    in_session = session.get('quiz_id') == quiz_id and 'quiz_draw_version' in session
+    seed = session.get('quiz_seed') if in_session else None
+    try:
+        if in_session:
+            question_ids = question_bank.draw_question_ids(quiz, seed, session['quiz_draw_version'])
+        elif quiz.is_bank_draw:
+            raise question_bank.DrawUnavailable()
+        else:
+            question_ids = question_bank.draw_question_ids(quiz, 0)
+    except question_bank.DrawUnavailable:
+        flash('Your quiz session has expired. Please start the quiz again.', 'error')
+        return redirect(url_for('user.chapter_quizzes', chapter_id=quiz.chapter_id))
     
-    for question in questions:
-        user_answer = request.form.get(f'question_{question.id}')
-        if user_answer and int(user_answer) == question.correct_option:
-            total_scored += 1
+    # Calculate score
+    questions = question_bank.load_drawn(question_ids)
+    total_scored, total_questions = grading.grade_drawn(
+        questions, [request.form.get(f'question_{question_id}') for question_id in question_ids])
+    if not total_questions:
+        flash('The questions of this quiz were removed during your attempt.', 'error')
+        return redirect(url_for('user.chapter_quizzes', chapter_id=quiz.chapter_id))
+    if total_questions < len(question_ids):
+        flash('Some questions were removed during your attempt and were not graded.', 'warning')
     
     # Save score
     score = Score(
         quiz_id=quiz_id,
         user_id=session['user_id'],
         total_scored=total_scored,
-        total_questions=total_questions
+        total_questions=total_questions,
+        seed=seed,
+        submission_token=token
     )
     db.session.add(score)
-    db.session.commit()
+    try:
+        recorded, duplicate = submissions.commit(score)
+    except ValueError:
+        abort(400)
+    if duplicate:
+        return redirect(url_for('user.quiz_result', score_id=recorded.id))
     
     # Clear quiz session data
     session.pop('quiz_start_time', None)
     session.pop('quiz_id', None)
+    session.pop('quiz_seed', None)
+    session.pop('quiz_draw_version', None)
     
     flash(f'Quiz completed! You scored {total_scored}/{total_questions}', 'success')
-    return redirect(url_for('user.quiz_result', score_id=score.id))
+    return redirect(url_for('user.quiz_result', score_id=recorded.id))
 
 @user_bp.route('/quiz/result/<int:score_id>')
 @user_required
@@ -111,15 +170,28 @@ def quiz_result(score_id):
 
 @user_bp.route('/scores')
 @user_required
+@read_only
 def scores():
-    scores = Score.query.filter_by(user_id=session['user_id']).order_by(Score.time_stamp_of_attempt.desc()).all()
-    return render_template('user/scores.html', scores=scores)
+    page = request.args.get('page', 1, type=int)
+    scores = archive.history(session['user_id'], page=page, per_page=SCORES_PAGE_SIZE)
+    stats = archive.user_stats(session['user_id'])
+    return render_template('user/scores.html', scores=scores, stats=stats)
 
 @user_bp.route('/profile')
 @user_required
+@read_only
 def profile():
     user = User.query.get_or_404(session['user_id'])
-    return render_template('user/profile.html', user=user)
+    stats = archive.user_stats(user.id)
+    return render_template('user/profile.html', user=user, stats=stats)
+
+@user_bp.route('/profile/progress')
+@user_required
+@read_only
+def progress():
+    """Downsampled score timeline for the progress chart"""
+    return jsonify(series.chart(session['user_id'], subject_id=request.args.get('subject_id', type=int),
+                                points=request.args.get('points', series.DEFAULT_POINTS, type=int)))
 
 @user_bp.route('/profile/edit', methods=['GET', 'POST'])
 @user_required
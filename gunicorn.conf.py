@@ -0,0 +1,48 @@
+"""
+Gunicorn configuration for Quiz Master.
+
+All settings can be overridden from the environment:
+
+    QUIZMASTER_BIND            address to listen on (default 0.0.0.0:8000)
+    QUIZMASTER_WORKERS         worker processes (default 2 * CPUs + 1)
+    QUIZMASTER_THREADS         threads per worker (default 2)
+    QUIZMASTER_TIMEOUT         seconds before a silent worker is killed (default 30)
+    QUIZMASTER_GRACEFUL_TIMEOUT seconds a worker gets to finish on restart (default 30)
+    QUIZMASTER_MAX_REQUESTS    recycle a worker after this many requests (default 0, never)
+
+Graceful restarts: `kill -HUP <master pid>` reloads the app and replaces
+workers one by one; `kill -USR2` followed by `kill -QUIT` on the old master
+upgrades the binary with zero downtime.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('QUIZMASTER_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('QUIZMASTER_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('QUIZMASTER_THREADS', 2))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+timeout = int(os.environ.get('QUIZMASTER_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('QUIZMASTER_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+max_requests = int(os.environ.get('QUIZMASTER_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# Import and warm the app once in the master, then fork
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+def post_fork(server, worker):
+    from wsgi import app
+    from services.health import reset_after_fork
+    reset_after_fork(app)
+
+def post_worker_init(worker):
+    from wsgi import app
+    from services.health import warm_up
+    warm_up(app)
+    worker.log.info('Worker %s warmed up and ready', worker.pid)
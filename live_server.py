@@ -0,0 +1,18 @@
+"""
+Live quiz server (server-sent events), run beside the WSGI app:
+
+    python live_server.py
+
+It listens on QUIZMASTER_LIVE_BIND (default 127.0.0.1:8001); route
+QUIZMASTER_LIVE_URL (default /live) to it from the reverse proxy with
+response buffering off. Run a single process: live sessions are held in
+its memory.
+"""
+
+from app import create_app
+from services.live import serve
+
+app = create_app()
+
+if __name__ == '__main__':
+    serve(app)
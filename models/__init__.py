@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from .routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def init_models():
     """Initialize all models - call this after db is configured"""
@@ -10,5 +11,13 @@ def init_models():
     from .quiz import Quiz
     from .question import Question
     from .score import Score
+    from .rollup import DailyScoreRollup, DailyScoreRollupUser, DailyRegistrationRollup
+    from .job import Job
+    from .api_token import ApiToken
+    from .score_archive import ScoreArchive
+    from .catalog_version import CatalogVersion
+    from .recommendation import ChapterRecommendation
+    from .quiz_warmup import QuizWarmup
+    from .bank_snapshot import BankSnapshot
     
     return User, Subject, Chapter, Quiz, Question, Score
@@ -0,0 +1,16 @@
+from datetime import datetime
+from . import db
+
+class ApiToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of the bearer token
+    name = db.Column(db.String(100))  # e.g. the device or client it was issued to
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime)
+    
+    # Relationship
+    user = db.relationship('User')
+    
+    def __repr__(self):
+        return f'<ApiToken {self.id} for user {self.user_id}>'
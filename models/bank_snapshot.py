@@ -0,0 +1,16 @@
+from datetime import datetime
+from . import db
+
+class BankSnapshot(db.Model):
+    """A chapter's bank question ids as of one bank_version, so attempts
+    drawn from it can be redrawn after the bank changes (see
+    services/question_bank.py)"""
+    __tablename__ = 'bank_snapshot'
+
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='CASCADE'), primary_key=True)
+    version = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON {tag or '': [ids]}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<BankSnapshot chapter={self.chapter_id} v{self.version}>'
@@ -0,0 +1,12 @@
+from . import db
+
+class CatalogVersion(db.Model):
+    """Single-row counter bumped whenever subjects, chapters, quizzes or quiz
+    questions change; workers compare it against their cached catalog tree"""
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)  # always 1
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CatalogVersion {self.version}>'
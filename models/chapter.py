@@ -5,11 +5,13 @@ class Chapter(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    bank_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every bank change
     
     # Relationship
-    quizzes = db.relationship('Quiz', backref='chapter', lazy=True, cascade='all, delete-orphan')
+    quizzes = db.relationship('Quiz', backref='chapter', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    bank_questions = db.relationship('Question', backref='bank_chapter', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
     
     def __repr__(self):
         return f'<Chapter {self.name}>'
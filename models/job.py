@@ -0,0 +1,56 @@
+import json
+from datetime import datetime
+from . import db
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params_json = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed, cancelled
+    progress = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    progress_message = db.Column(db.String(200))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    error = db.Column(db.Text)
+    result_json = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    FINISHED = ('succeeded', 'failed', 'cancelled')
+
+    @property
+    def params(self):
+        return json.loads(self.params_json or '{}')
+
+    @property
+    def result(self):
+        return json.loads(self.result_json) if self.result_json else None
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'progress_message': self.progress_message,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'cancel_requested': self.cancel_requested,
+            'error': self.error,
+            'result': self.result,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
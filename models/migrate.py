@@ -0,0 +1,86 @@
+"""
+In-place schema upgrades for existing SQLite databases.
+
+db.create_all() only creates missing tables; it never changes existing
+ones. upgrade_schema() brings tables created by older versions in line
+with the models. Call it inside an app context after create_all().
+"""
+
+import re
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn, CreateTable
+from . import db
+
+def upgrade_schema(engine=None, tables=None):
+    """Upgrade the given tables (default: all) in engine (default: primary)"""
+    engine = engine if engine is not None else db.engines[None]
+    if engine.dialect.name != 'sqlite':
+        return
+
+    with engine.connect() as conn:
+        # Must be switched off outside a transaction, otherwise dropping a
+        # parent table during a rebuild would cascade into its children
+        foreign_keys = conn.exec_driver_sql('PRAGMA foreign_keys').scalar()
+        conn.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        try:
+            for table in tables if tables is not None else db.metadata.sorted_tables:
+                if _needs_rebuild(conn, table):
+                    _rebuild_table(conn, table)
+                else:
+                    _add_missing_columns(conn, table)
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+            conn.commit()
+        finally:
+            conn.exec_driver_sql(f'PRAGMA foreign_keys={"ON" if foreign_keys else "OFF"}')
+
+def _needs_rebuild(conn, table):
+    """True if an existing table differs from the model in a way ALTER TABLE can't fix.
+
+    That is: FK ON DELETE actions, column nullability, or a new column that
+    has a foreign key or is NOT NULL without a server default.
+    """
+    if not inspect(conn).has_table(table.name):
+        return False
+
+    existing = {column['name']: column for column in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            if column.foreign_keys or (not column.nullable and column.server_default is None):
+                return True
+        elif not column.primary_key and existing[column.name]['nullable'] != column.nullable:
+            return True
+
+    expected = {
+        (fk.parent.name, fk.column.table.name): (fk.ondelete or 'NO ACTION').upper()
+        for fk in table.foreign_keys
+    }
+    actual = {
+        (row[3], row[2]): row[6].upper()
+        for row in conn.exec_driver_sql(f'PRAGMA foreign_key_list("{table.name}")')
+    }
+    return expected != actual
+
+def _add_missing_columns(conn, table):
+    if not inspect(conn).has_table(table.name):
+        return
+
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            ddl = CreateColumn(column).compile(conn)
+            conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}')
+
+def _rebuild_table(conn, table):
+    """Recreate a table from its model definition, keeping its rows"""
+    temp_name = f'{table.name}__new'
+    ddl = str(CreateTable(table).compile(conn))
+    ddl = re.sub(r'^\s*CREATE TABLE \S+', f'CREATE TABLE "{temp_name}"', ddl, count=1)
+
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    columns = ', '.join(f'"{column.name}"' for column in table.columns if column.name in existing)
+
+    conn.exec_driver_sql(ddl)
+    conn.exec_driver_sql(f'INSERT INTO "{temp_name}" ({columns}) SELECT {columns} FROM "{table.name}"')
+    conn.exec_driver_sql(f'DROP TABLE "{table.name}"')
+    conn.exec_driver_sql(f'ALTER TABLE "{temp_name}" RENAME TO "{table.name}"')
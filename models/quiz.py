@@ -1,17 +1,38 @@
+import json
 from datetime import datetime
 from . import db
 
 class Quiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'), nullable=False)
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='CASCADE'), nullable=False, index=True)
     date_of_quiz = db.Column(db.Date, nullable=False)
     time_duration = db.Column(db.Integer, nullable=False)  # Duration in minutes
     remarks = db.Column(db.Text)
+    # Bank quizzes draw draw_count questions from the chapter's question bank
+    # per attempt, optionally with per-tag quotas stored as JSON {tag: count}
+    draw_count = db.Column(db.Integer)
+    draw_tags = db.Column(db.Text)
+    # Cache warm-up before the quiz day: minutes ahead (None: the app's
+    # default, 0: never) and the steps to run, comma-separated (None: all)
+    warmup_minutes = db.Column(db.Integer)
+    warmup_steps = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship
-    questions = db.relationship('Question', backref='quiz', lazy=True, cascade='all, delete-orphan')
-    scores = db.relationship('Score', backref='quiz', lazy=True, cascade='all, delete-orphan')
+    questions = db.relationship('Question', backref='quiz', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    scores = db.relationship('Score', backref='quiz', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    
+    @property
+    def is_bank_draw(self):
+        return bool(self.draw_count)
+    
+    @property
+    def draw_quotas(self):
+        return json.loads(self.draw_tags) if self.draw_tags else None
+    
+    @property
+    def question_count(self):
+        return self.draw_count if self.is_bank_draw else len(self.questions)
     
     def __repr__(self):
         return f'<Quiz for {self.chapter.name}>'
@@ -0,0 +1,18 @@
+from . import db
+
+class QuizWarmup(db.Model):
+    """The last cache warm-up run for a quiz (see services/warmup.py)"""
+    __tablename__ = 'quiz_warmup'
+
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), primary_key=True)
+    warmed_at = db.Column(db.DateTime, nullable=False)
+    catalog_version = db.Column(db.Integer, nullable=False)  # catalog the caches were filled from
+    steps = db.Column(db.String(50), nullable=False)
+    rows = db.Column(db.Integer, nullable=False, default=0)  # rows read to pull their pages in
+    fragments = db.Column(db.Integer, nullable=False, default=0)
+    seconds = db.Column(db.Float, nullable=False, default=0)
+    processes = db.Column(db.Integer, nullable=False, default=0)  # worker processes warmed since
+    error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<QuizWarmup quiz={self.quiz_id} {self.warmed_at}>'
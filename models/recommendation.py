@@ -0,0 +1,27 @@
+from . import db
+
+class ChapterRecommendation(db.Model):
+    """A student's recency-weighted accuracy in one chapter, for the
+    recommended-practice panel (see services/recommendations.py)"""
+    __tablename__ = 'chapter_recommendation'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='CASCADE'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Scored/asked questions, each attempt weighted by its age at last_attempt
+    weighted_scored = db.Column(db.Float, nullable=False, default=0)
+    weighted_questions = db.Column(db.Float, nullable=False, default=0)
+    last_attempt = db.Column(db.DateTime, nullable=False)
+    quiz_ids = db.Column(db.Text, nullable=False, default='')  # attempted quizzes, comma-separated
+    weakness = db.Column(db.Float, nullable=False, default=0)  # 1 - weighted accuracy
+
+    @property
+    def accuracy(self):
+        return 1 - self.weakness
+
+    @property
+    def attempted_quiz_ids(self):
+        return {int(quiz_id) for quiz_id in self.quiz_ids.split(',') if quiz_id}
+
+    def __repr__(self):
+        return f'<ChapterRecommendation user={self.user_id} chapter={self.chapter_id} {self.weakness:.2f}>'
@@ -0,0 +1,44 @@
+from datetime import datetime
+from . import db
+
+class DailyScoreRollup(db.Model):
+    """Per-day attempt totals for a subject, chapter or quiz"""
+    __tablename__ = 'daily_score_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    scope = db.Column(db.String(10), primary_key=True)  # 'subject', 'chapter' or 'quiz'
+    scope_id = db.Column(db.Integer, primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    sum_scored = db.Column(db.Integer, nullable=False, default=0)
+    sum_questions = db.Column(db.Integer, nullable=False, default=0)
+    unique_users = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_daily_score_rollup_scope_day', 'scope', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<DailyScoreRollup {self.day} {self.scope}:{self.scope_id}>'
+
+class DailyScoreRollupUser(db.Model):
+    """Users already counted in a day's unique_users (open days only, see compaction)"""
+    __tablename__ = 'daily_score_rollup_user'
+
+    day = db.Column(db.Date, primary_key=True)
+    scope = db.Column(db.String(10), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+
+    def __repr__(self):
+        return f'<DailyScoreRollupUser {self.day} {self.scope}:{self.scope_id} user={self.user_id}>'
+
+class DailyRegistrationRollup(db.Model):
+    """Per-day count of non-admin user registrations"""
+    __tablename__ = 'daily_registration_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    registrations = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyRegistrationRollup {self.day} {self.registrations}>'
@@ -0,0 +1,145 @@
+"""
+Read-only routing for db.session.
+
+Routes and helpers wrapped in read_only() send their SELECTs to the
+'readonly' bind: a read-only connection to the same SQLite file (mode=ro
+plus PRAGMA query_only) or a replica for other backends. Flushes always
+go to the primary engine, so a read-only section can never write.
+
+With score sharding enabled, code running under using_shard(i) sends
+statements that touch a sharded table to shard i's engine (shard
+connections attach the primary, so they can still join catalog tables);
+everything else goes to the primary as usual. Touching a sharded table
+outside a shard raises ShardRequired rather than silently reading the
+primary's empty copy.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.util import find_tables
+from flask_sqlalchemy.session import Session
+from services import metrics
+
+READONLY_BIND = 'readonly'
+SHARD_BIND_PREFIX = 'scores_'
+
+# Tables that live in every score shard, rather than the primary, when
+# sharding is enabled
+SHARDED_TABLES = ('score', 'daily_score_rollup', 'daily_score_rollup_user', 'chapter_recommendation')
+
+_read_only = ContextVar('read_only', default=False)
+_shard = ContextVar('shard', default=None)
+
+class ShardRequired(RuntimeError):
+    pass
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _shard.get() is not None and _touches_sharded(mapper, clause):
+            metrics.incr('db.route.shard')
+            return self._db.engines[shard_bind(_shard.get())]
+        if bind is None and mapper is not None and mapper.local_table.name in SHARDED_TABLES \
+                and shard_bind(0) in self._db.engines:
+            raise ShardRequired(f'{mapper.local_table.name} is sharded; query it inside using_shard()')
+        if bind is None and _read_only.get() and not self._flushing and not _has_bind_key(mapper, clause):
+            engine = self._db.engines.get(READONLY_BIND)
+            if engine is not None:
+                metrics.incr('db.route.readonly')
+                return engine
+        metrics.incr('db.route.primary')
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _touches_sharded(mapper, clause):
+    if mapper is not None and mapper.local_table.name in SHARDED_TABLES:
+        return True
+    return clause is not None and any(
+        getattr(table, 'name', None) in SHARDED_TABLES for table in find_tables(clause, include_crud=True))
+
+def _has_bind_key(mapper, clause):
+    """True for statements on models kept in a database of their own (__bind_key__)"""
+    if mapper is not None:
+        return mapper.local_table.metadata.info.get('bind_key') is not None
+    return clause is not None and any(
+        table.metadata.info.get('bind_key') is not None
+        for table in find_tables(clause, include_crud=True) if hasattr(table, 'metadata'))
+
+def is_read_only():
+    return _read_only.get()
+
+@contextmanager
+def read_only_session():
+    """Route queries issued inside the block to the read-only bind"""
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
+
+def read_only(f):
+    """Decorator for routes and query helpers that never write"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with read_only_session():
+            return f(*args, **kwargs)
+    return decorated_function
+
+def shard_bind(index):
+    return f'{SHARD_BIND_PREFIX}{index}'
+
+def current_shard():
+    return _shard.get()
+
+@contextmanager
+def using_shard(index):
+    """Route queries issued inside the block to score shard `index`"""
+    token = _shard.set(index)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+def readonly_uri(uri):
+    """Derive a read-only SQLite URI from the primary one.
+
+    Returns None for other backends, which need an explicit replica URI.
+    """
+    url = make_url(uri)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        return None
+    database = url.database
+    if database.startswith('file:'):
+        database = database[5:]
+    return f'{url.drivername}:///file:{database}?mode=ro&uri=true'
+
+def init_routing(db):
+    """Configure SQLite pragmas on the primary and read-only engines.
+
+    Must be called inside an app context. WAL lets readers and the single
+    writer proceed concurrently; query_only makes read-only connections
+    reject writes even if the URI is a plain read/write one. Foreign keys
+    are enforced so ON DELETE CASCADE does the subtree deletes.
+    """
+    primary = db.engines[None]
+    readonly = db.engines.get(READONLY_BIND)
+
+    if primary.dialect.name == 'sqlite' and not event.contains(primary, 'connect', _primary_pragmas):
+        event.listen(primary, 'connect', _primary_pragmas)
+
+    if readonly is not None and readonly.dialect.name == 'sqlite' \
+            and not event.contains(readonly, 'connect', _readonly_pragmas):
+        event.listen(readonly, 'connect', _readonly_pragmas)
+
+def _primary_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+def _readonly_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
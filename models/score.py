@@ -3,11 +3,13 @@ from . import db
 
 class Score(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
     time_stamp_of_attempt = db.Column(db.DateTime, default=datetime.utcnow)
     total_scored = db.Column(db.Integer, nullable=False)
     total_questions = db.Column(db.Integer, nullable=False)
+    seed = db.Column(db.Integer)  # Question draw/order seed of this attempt
+    submission_token = db.Column(db.String(32), unique=True, index=True)  # One Score per attempt
     
     def __repr__(self):
         return f'<Score {self.total_scored}/{self.total_questions}>'
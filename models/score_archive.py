@@ -0,0 +1,28 @@
+from datetime import datetime
+from . import db
+
+class ScoreArchive(db.Model):
+    """A compressed block of one user's archived Score rows.
+
+    The rows themselves are in payload (see services.archive); the
+    aggregate columns let statistics and paging skip decompression.
+    """
+    __bind_key__ = 'archive'
+    __table_args__ = (db.Index('ix_score_archive_user_last', 'user_id', 'last_attempt'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)  # Lives in another database, so no FK
+    shard = db.Column(db.Integer)  # Score shard the rows came from, if sharded
+    first_attempt = db.Column(db.DateTime, nullable=False)
+    last_attempt = db.Column(db.DateTime, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    sum_scored = db.Column(db.Integer, nullable=False)
+    sum_questions = db.Column(db.Integer, nullable=False)
+    best_scored = db.Column(db.Integer, nullable=False)
+    best_questions = db.Column(db.Integer, nullable=False)
+    archived_before = db.Column(db.DateTime, nullable=False)  # Cutoff of the run that wrote it
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ScoreArchive {self.attempts} attempts of user {self.user_id}>'
@@ -8,7 +8,7 @@ class Subject(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship
-    chapters = db.relationship('Chapter', backref='subject', lazy=True, cascade='all, delete-orphan')
+    chapters = db.relationship('Chapter', backref='subject', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def __repr__(self):
         return f'<Subject {self.name}>'
@@ -12,7 +12,7 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship
-    scores = db.relationship('Score', backref='user', lazy=True)
+    scores = db.relationship('Score', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -0,0 +1,85 @@
+"""
+Credentials for the JSON API.
+
+Clients authenticate with a bearer token rather than the cookie session.
+Only a SHA-256 of each token is stored, so a leaked database does not
+leak usable tokens. An attempt in progress is carried by the client as a
+signed attempt token (user, quiz, seed, draw version, start time) instead of living in the session, which is what lets offline
+clients submit later and in batches.
+"""
+
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from flask import current_app
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from models import db
+from models.api_token import ApiToken
+
+ATTEMPT_SALT = 'quizmaster-api-attempt'
+DEFAULT_ATTEMPT_MAX_AGE = 7 * 24 * 3600  # offline clients may sync days later
+LAST_USED_RESOLUTION = timedelta(minutes=5)
+
+class InvalidAttempt(Exception):
+    pass
+
+def _digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue_token(user, name=None):
+    """Create a token for the user and return it; it cannot be shown again"""
+    token = secrets.token_urlsafe(32)
+    db.session.add(ApiToken(user_id=user.id, token_hash=_digest(token), name=name))
+    db.session.commit()
+    return token
+
+def authenticate(token):
+    """The ApiToken row for a bearer token, or None"""
+    if not token:
+        return None
+    api_token = ApiToken.query.filter_by(token_hash=_digest(token)).first()
+    if api_token is None:
+        return None
+
+    # Only write last_used_at now and then, not on every request
+    now = datetime.utcnow()
+    if api_token.last_used_at is None or now - api_token.last_used_at > LAST_USED_RESOLUTION:
+        api_token.last_used_at = now
+        db.session.commit()
+    return api_token
+
+def revoke(api_token):
+    db.session.delete(api_token)
+    db.session.commit()
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=ATTEMPT_SALT)
+
+def sign_attempt(user_id, quiz, seed, version):
+    """An attempt token; version is the draw version from question_bank.draw"""
+    return _serializer().dumps({
+        'u': user_id,
+        'q': quiz.id,
+        's': seed,
+        'v': version,
+        't': datetime.utcnow().isoformat(),
+    })
+
+def load_attempt(token, user_id, quiz_id):
+    """Verify an attempt token and return its fields as a dict.
+
+    Raises InvalidAttempt if it is forged, expired, or for another user
+    or quiz.
+    """
+    max_age = current_app.config.get('QUIZMASTER_API_ATTEMPT_MAX_AGE', DEFAULT_ATTEMPT_MAX_AGE)
+    try:
+        attempt = _serializer().loads(token or '', max_age=max_age)
+    except SignatureExpired:
+        raise InvalidAttempt('attempt expired')
+    except BadSignature:
+        raise InvalidAttempt('invalid attempt token')
+
+    if attempt.get('u') != user_id or attempt.get('q') != quiz_id:
+        raise InvalidAttempt('attempt token does not match this user and quiz')
+    attempt['t'] = datetime.fromisoformat(attempt['t'])
+    return attempt
@@ -0,0 +1,347 @@
+"""
+Hot/cold archival of old quiz attempts.
+
+archive_scores() moves Score rows older than a cutoff out of the hot table
+into the archive database (QUIZMASTER_ARCHIVE_DATABASE_URI), one
+ScoreArchive block per user and run. A block stores its rows column by
+column (ids and timestamps delta-encoded) and zlib-compressed, next to the
+aggregates needed for statistics, so the hot table and its indexes only
+hold recent attempts.
+
+Readers go through user_stats() and history(), which add the archived
+aggregates to the hot ones and page from hot rows into archived blocks
+only when a page reaches past the last hot attempt. Deleting a quiz drops
+its archived attempts with delete_quizzes(), which rewrites the blocks
+holding them so the aggregates keep matching the rows.
+"""
+
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import delete, func, select
+from flask import current_app
+from models import db
+from models.quiz import Quiz
+from models.score import Score
+from models.score_archive import ScoreArchive
+from services import metrics, sharding
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 365
+HEADER = struct.Struct('<I')
+EPOCH = datetime(1970, 1, 1)
+
+class ArchivedScore:
+    """A Score row read back from the archive; quacks like Score in templates"""
+    __slots__ = ('id', 'quiz_id', 'user_id', 'time_stamp_of_attempt',
+                 'total_scored', 'total_questions', 'seed', 'quiz')
+
+    def __init__(self, id, quiz_id, user_id, time_stamp_of_attempt, total_scored, total_questions, seed):
+        self.id = id
+        self.quiz_id = quiz_id
+        self.user_id = user_id
+        self.time_stamp_of_attempt = time_stamp_of_attempt
+        self.total_scored = total_scored
+        self.total_questions = total_questions
+        self.seed = seed
+        self.quiz = None
+
+class HistoryPage:
+    """One page of a user's attempts, newest first (Pagination-like)"""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = max(1, -(-total // per_page))
+        self.has_prev = page > 1
+        self.has_next = page < self.pages
+        self.prev_num = page - 1
+        self.next_num = page + 1
+
+# Block encoding
+
+def _to_micros(moment):
+    delta = moment - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def encode_rows(rows):
+    """Compress (id, quiz_id, time, scored, questions, seed) rows, oldest first"""
+    ids = [row[0] for row in rows]
+    times = [_to_micros(row[2]) for row in rows]
+    columns = [
+        array('q', [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]),
+        array('q', [row[1] for row in rows]),
+        array('q', [times[0]] + [b - a for a, b in zip(times, times[1:])]),
+        array('q', [row[3] for row in rows]),
+        array('q', [row[4] for row in rows]),
+        array('q', [-1 if row[5] is None else row[5] for row in rows]),
+    ]
+    if sys.byteorder != 'little':
+        for column in columns:
+            column.byteswap()
+    return zlib.compress(HEADER.pack(len(rows)) + b''.join(column.tobytes() for column in columns), 9)
+
+def decode_rows(payload, user_id):
+    """ArchivedScore objects from a block, oldest first"""
+    data = zlib.decompress(payload)
+    count, = HEADER.unpack_from(data)
+    columns = []
+    for index in range(6):
+        column = array('q')
+        start = HEADER.size + index * count * 8
+        column.frombytes(data[start:start + count * 8])
+        if sys.byteorder != 'little':
+            column.byteswap()
+        columns.append(column)
+
+    ids, quiz_ids, time_deltas, scored, questions, seeds = columns
+    times = (EPOCH + timedelta(microseconds=micros) for micros in accumulate(time_deltas))
+    return [
+        ArchivedScore(score_id, quiz_id, user_id, moment, total_scored, total_questions,
+                      None if seed == -1 else seed)
+        for score_id, quiz_id, moment, total_scored, total_questions, seed
+        in zip(accumulate(ids), quiz_ids, times, scored, questions, seeds)
+    ]
+
+# Archiving
+
+def default_cutoff():
+    days = current_app.config.get('QUIZMASTER_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    return datetime.utcnow() - timedelta(days=days)
+
+def archive_scores(cutoff=None):
+    """Move attempts older than cutoff into the archive; returns rows moved.
+
+    Each user's rows are written as a block and committed before they are
+    deleted from the hot table. Re-running after an interruption skips
+    rows that already made it into a block.
+    """
+    cutoff = cutoff or default_cutoff()
+    moved = 0
+    for shard in sharding.shards():
+        with sharding.on_shard(shard):
+            user_ids = db.session.execute(
+                select(Score.user_id).where(Score.time_stamp_of_attempt < cutoff).distinct()
+            ).scalars().all()
+            for user_id in user_ids:
+                moved += _archive_user(user_id, shard, cutoff)
+
+    metrics.incr('archive.rows_moved', moved)
+    return moved
+
+def _archive_user(user_id, shard, cutoff):
+    rows = db.session.execute(
+        select(Score.id, Score.quiz_id, Score.time_stamp_of_attempt,
+               Score.total_scored, Score.total_questions, Score.seed)
+        .where(Score.user_id == user_id, Score.time_stamp_of_attempt < cutoff)
+        .order_by(Score.time_stamp_of_attempt, Score.id)
+    ).all()
+
+    already_archived = _archived_ids(user_id, shard, rows[0][2]) if rows else set()
+    fresh = [row for row in rows if row[0] not in already_archived]
+    if fresh:
+        best = max(fresh, key=lambda row: row[3])
+        db.session.add(ScoreArchive(
+            user_id=user_id,
+            shard=shard,
+            first_attempt=fresh[0][2],
+            last_attempt=fresh[-1][2],
+            attempts=len(fresh),
+            sum_scored=sum(row[3] for row in fresh),
+            sum_questions=sum(row[4] for row in fresh),
+            best_scored=best[3],
+            best_questions=best[4],
+            archived_before=cutoff,
+            payload=encode_rows(fresh),
+        ))
+        db.session.commit()
+
+    ids = [row[0] for row in rows]
+    for start in range(0, len(ids), 500):
+        db.session.execute(delete(Score).where(Score.id.in_(ids[start:start + 500])))
+    db.session.commit()
+    return len(fresh)
+
+def _archived_ids(user_id, shard, since):
+    """Ids of this user's rows from `since` on already in the archive.
+
+    Only non-empty after an interrupted run left rows both in a block and
+    in the hot table.
+    """
+    same_shard = ScoreArchive.shard.is_(None) if shard is None else ScoreArchive.shard == shard
+    blocks = db.session.execute(
+        select(ScoreArchive.payload)
+        .where(ScoreArchive.user_id == user_id, same_shard, ScoreArchive.last_attempt >= since)
+    ).scalars()
+    return {row.id for payload in blocks for row in decode_rows(payload, user_id)}
+
+def horizon():
+    """Latest cutoff any archive run used, or None if nothing is archived"""
+    return db.session.execute(select(func.max(ScoreArchive.archived_before))).scalar()
+
+def delete_user(user_id):
+    db.session.execute(delete(ScoreArchive).where(ScoreArchive.user_id == user_id))
+    db.session.commit()
+
+def delete_quizzes(quiz_ids, since=None):
+    """Drop the archived attempts at quizzes about to be deleted; returns
+    attempts dropped.
+
+    Only blocks ending at or after `since` (when the oldest of the quizzes
+    was created) are read. The rewritten blocks are left in the session,
+    to be committed with the delete of the quizzes (in the archive
+    database's own transaction, so not atomically with it).
+    """
+    quiz_ids = set(quiz_ids)
+    if not quiz_ids:
+        return 0
+    return _drop_attempts(lambda quiz_id: quiz_id in quiz_ids, since)
+
+def purge_deleted_quizzes():
+    """Drop archived attempts at quizzes that no longer exist (deleted
+    before delete_quizzes() was called on deletes); returns attempts dropped"""
+    existing = set(db.session.execute(select(Quiz.id)).scalars())
+    dropped = _drop_attempts(lambda quiz_id: quiz_id not in existing)
+    db.session.commit()
+    return dropped
+
+def attempts_since(since=None):
+    """Attempts in the blocks delete_quizzes(..., since) reads and rewrites"""
+    query = select(func.coalesce(func.sum(ScoreArchive.attempts), 0))
+    if since is not None:
+        query = query.where(ScoreArchive.last_attempt >= since)
+    return db.session.execute(query).scalar()
+
+def _drop_attempts(is_dropped, since=None):
+    query = select(ScoreArchive.id, ScoreArchive.user_id, ScoreArchive.payload)
+    if since is not None:
+        query = query.where(ScoreArchive.last_attempt >= since)
+
+    changed = []
+    for block_id, user_id, payload in db.session.execute(query.execution_options(yield_per=100)):
+        rows = decode_rows(payload, user_id)
+        kept = [row for row in rows if not is_dropped(row.quiz_id)]
+        if len(kept) < len(rows):
+            changed.append((block_id, kept, len(rows) - len(kept)))
+
+    for block_id, kept, _ in changed:
+        block = db.session.get(ScoreArchive, block_id)
+        if not kept:
+            db.session.delete(block)
+            continue
+        best = max(kept, key=lambda row: row.total_scored)
+        block.first_attempt = kept[0].time_stamp_of_attempt
+        block.last_attempt = kept[-1].time_stamp_of_attempt
+        block.attempts = len(kept)
+        block.sum_scored = sum(row.total_scored for row in kept)
+        block.sum_questions = sum(row.total_questions for row in kept)
+        block.best_scored = best.total_scored
+        block.best_questions = best.total_questions
+        block.payload = encode_rows([(row.id, row.quiz_id, row.time_stamp_of_attempt, row.total_scored,
+                                      row.total_questions, row.seed) for row in kept])
+
+    dropped = sum(count for _, _, count in changed)
+    metrics.incr('archive.rows_dropped', dropped)
+    return dropped
+
+# Reading
+
+def archived_totals():
+    """{user_id: (attempts, sum_scored, sum_questions)} over the whole archive"""
+    rows = db.session.execute(
+        select(ScoreArchive.user_id, func.sum(ScoreArchive.attempts),
+               func.sum(ScoreArchive.sum_scored), func.sum(ScoreArchive.sum_questions))
+        .group_by(ScoreArchive.user_id)
+    )
+    return {user_id: (attempts, scored, questions) for user_id, attempts, scored, questions in rows}
+
+def user_stats(user_id):
+    """Attempts, average percentage, best score and last attempt time over
+    hot and archived attempts.
+
+    Run under the user's shard (sharding.for_user) when sharded.
+    """
+    hot = db.session.execute(
+        select(func.count(Score.id), func.sum(Score.total_scored), func.sum(Score.total_questions),
+               func.max(Score.time_stamp_of_attempt))
+        .where(Score.user_id == user_id)
+    ).one()
+    cold = db.session.execute(
+        select(func.sum(ScoreArchive.attempts), func.sum(ScoreArchive.sum_scored),
+               func.sum(ScoreArchive.sum_questions), func.max(ScoreArchive.last_attempt))
+        .where(ScoreArchive.user_id == user_id)
+    ).one()
+    attempts = hot[0] + (cold[0] or 0)
+    scored = (hot[1] or 0) + (cold[1] or 0)
+    questions = (hot[2] or 0) + (cold[2] or 0)
+
+    # Highest raw score, as the history pages have always shown it
+    candidates = db.session.execute(
+        select(Score.total_scored, Score.total_questions).where(Score.user_id == user_id)
+        .order_by(Score.total_scored.desc(), Score.time_stamp_of_attempt).limit(1)
+    ).all() + db.session.execute(
+        select(ScoreArchive.best_scored, ScoreArchive.best_questions)
+        .where(ScoreArchive.user_id == user_id)
+        .order_by(ScoreArchive.best_scored.desc()).limit(1)
+    ).all()
+    best = max(candidates, key=lambda row: row[0]) if candidates else (0, 0)
+
+    return {
+        'attempts': attempts,
+        'average': scored / questions * 100 if questions else 0,
+        'best_scored': best[0],
+        'best_questions': best[1],
+        'last_attempt': max(filter(None, (hot[3], cold[3])), default=None),
+    }
+
+def history(user_id, page=1, per_page=20):
+    """A page of the user's attempts, newest first, hot rows before archived ones.
+
+    Archived blocks are only decompressed when the page reaches into them.
+    Run under the user's shard (sharding.for_user) when sharded.
+    """
+    page = max(page, 1)
+    offset = (page - 1) * per_page
+    hot_total = db.session.execute(select(func.count(Score.id)).where(Score.user_id == user_id)).scalar()
+
+    items = []
+    if offset < hot_total:
+        items = Score.query.filter_by(user_id=user_id) \
+            .order_by(Score.time_stamp_of_attempt.desc(), Score.id.desc()) \
+            .offset(offset).limit(per_page).all()
+
+    blocks = db.session.execute(
+        select(ScoreArchive.id, ScoreArchive.attempts)
+        .where(ScoreArchive.user_id == user_id)
+        .order_by(ScoreArchive.last_attempt.desc(), ScoreArchive.id.desc())
+    ).all()
+    total = hot_total + sum(attempts for _, attempts in blocks)
+
+    if len(items) < per_page and blocks:
+        items += _archived_slice(user_id, blocks, max(offset - hot_total, 0), per_page - len(items))
+    return HistoryPage(items, page, per_page, total)
+
+def _archived_slice(user_id, blocks, skip, limit):
+    rows = []
+    for block_id, attempts in blocks:
+        if skip >= attempts:
+            skip -= attempts
+            continue
+        payload = db.session.get(ScoreArchive, block_id).payload
+        newest_first = decode_rows(payload, user_id)[::-1]
+        rows += newest_first[skip:skip + limit - len(rows)]
+        skip = 0
+        metrics.incr('archive.blocks_read')
+        if len(rows) >= limit:
+            break
+
+    quizzes = {quiz.id: quiz for quiz in Quiz.query.filter(Quiz.id.in_({row.quiz_id for row in rows}))}
+    for row in rows:
+        row.quiz = quizzes.get(row.quiz_id)
+    # Deletes drop their quizzes' archived attempts; this only skips ones
+    # left by deletes from before that (see purge_deleted_quizzes)
+    return [row for row in rows if row.quiz is not None]
@@ -0,0 +1,71 @@
+"""
+Fingerprinted static assets.
+
+On startup (or `flask assets build`) every file under static/ is hashed
+and copied to instance/assets/ as name.<hash>.ext, together with a
+precompressed .gz variant for text types. Templates link to them through
+asset_url(), so the URL changes whenever the content does and browsers
+can cache each one forever.
+"""
+
+import gzip
+import hashlib
+import os
+import shutil
+from flask import url_for
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+HASH_LENGTH = 12
+
+_manifest = {}   # logical name -> fingerprinted name
+_reverse = {}    # fingerprinted name -> logical name
+
+def build_dir(app):
+    return os.path.join(app.instance_path, 'assets')
+
+def fingerprint(filename, digest):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{digest}{ext}'
+
+def build(app):
+    """Hash, copy and precompress all static files. Returns the manifest."""
+    manifest = {}
+    static_dir = app.static_folder
+    out_dir = build_dir(app)
+
+    for dirpath, _, filenames in os.walk(static_dir):
+        for name in filenames:
+            source = os.path.join(dirpath, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+
+            hashed = fingerprint(logical, hashlib.sha256(content).hexdigest()[:HASH_LENGTH])
+            target = os.path.join(out_dir, hashed)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                if logical.endswith(COMPRESSIBLE):
+                    with gzip.open(target + '.gz', 'wb', compresslevel=9) as f:
+                        f.write(content)
+            manifest[logical] = hashed
+
+    _manifest.clear()
+    _manifest.update(manifest)
+    _reverse.clear()
+    _reverse.update({hashed: logical for logical, hashed in manifest.items()})
+    return manifest
+
+def init_assets(app):
+    build(app)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+def asset_url(filename):
+    """URL of the fingerprinted copy, falling back to the plain static URL"""
+    hashed = _manifest.get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.serve', filename=hashed)
+
+def is_fingerprinted(filename):
+    return filename in _reverse
@@ -0,0 +1,296 @@
+"""
+Online backups of the SQLite databases.
+
+run() copies every SQLite file the app uses (the primary, the score
+shards and the archive) while the site keeps serving. Each copy runs the
+backup API over a read transaction held for the whole copy: in WAL mode
+that is a consistent snapshot which writers never wait for, and which
+their commits cannot restart. It advances QUIZMASTER_BACKUP_STEP_PAGES
+pages at a time, sleeping QUIZMASTER_BACKUP_STEP_SLEEP seconds between
+steps so the copy's I/O stays out of the way of quiz submissions. The
+pinned snapshot also keeps WAL checkpoints from getting past it, so each
+database's -wal file grows with every commit made during its copy and
+only shrinks back on a checkpoint after the copy ends.
+
+A run is gzipped into its own directory under QUIZMASTER_BACKUP_DIR
+(default instance/backups) with a manifest of checksums. The directory
+only appears once the run is complete, and only the newest
+QUIZMASTER_BACKUP_KEEP runs are kept. With
+QUIZMASTER_BACKUP_INTERVAL_MINUTES set, the job runner queues a backup at
+every multiple of that interval; `flask backup run` does the same from
+cron. verify() checks a run's checksums and SQLite integrity. restore()
+puts a verified run back in place and must only be used while the app is
+stopped.
+"""
+
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from models import db
+from services import jobs, metrics
+
+DEFAULT_KEEP = 48
+DEFAULT_STEP_PAGES = 256
+DEFAULT_STEP_SLEEP = 0.01
+COMPRESS_LEVEL = 6
+CHUNK_SIZE = 1024 * 1024
+MANIFEST = 'manifest.json'
+LOCK_FILE = '.lock'
+STAMP_FORMAT = '%Y%m%dT%H%M%SZ'
+
+class BackupError(Exception):
+    pass
+
+class BackupRun:
+    """A completed backup run, read from its manifest"""
+    __slots__ = ('stamp', 'taken_at', 'directory', 'databases', 'seconds', 'size')
+
+    def __init__(self, directory, manifest):
+        self.stamp = os.path.basename(directory)
+        self.taken_at = datetime.strptime(self.stamp, STAMP_FORMAT)
+        self.directory = directory
+        self.databases = manifest['databases']
+        self.seconds = manifest['seconds']
+        self.size = sum(entry['size'] for entry in self.databases)
+
+def backup_dir(app=None):
+    app = app or current_app
+    return app.config.get('QUIZMASTER_BACKUP_DIR') or os.path.join(app.instance_path, 'backups')
+
+def databases():
+    """(name, path) of every SQLite file behind the app's binds, primary
+    first; each is named after its bind ('primary' for the default one),
+    as file names need not be unique across directories"""
+    found = {}
+    for bind in sorted(db.engines, key=lambda bind: (bind is not None, str(bind))):
+        url = db.engines[bind].url
+        if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+            continue
+        path = url.database[5:] if url.database.startswith('file:') else url.database
+        path = os.path.realpath(path)
+        if os.path.exists(path):
+            # The read-only bind is the primary file again
+            found.setdefault(path, 'primary' if bind is None else bind)
+    return [(name, path) for path, name in found.items()]
+
+# Taking backups
+
+def run(progress=None):
+    """Back up every database; returns the new BackupRun.
+
+    progress, if given, is called as progress(percent, message) after
+    every step.
+    """
+    config = current_app.config
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    targets = databases()
+    started = time.perf_counter()
+
+    with _exclusive(directory):
+        stamp = datetime.utcnow().strftime(STAMP_FORMAT)
+        partial = os.path.join(directory, f'.{stamp}.partial')
+        os.makedirs(partial)
+        try:
+            entries = []
+            for index, (name, path) in enumerate(targets):
+                def report(done, total):
+                    metrics.gauge('backup.progress', int((index + done / total) / len(targets) * 100))
+                    if progress:
+                        progress((index + done / total) / len(targets) * 100,
+                                 f'Copying {name}: page {done} of {total}')
+
+                copy = os.path.join(partial, f'{name}.db')
+                with metrics.timed('backup.copy'):
+                    pages = _copy(path, copy, config.get('QUIZMASTER_BACKUP_STEP_PAGES', DEFAULT_STEP_PAGES),
+                                  config.get('QUIZMASTER_BACKUP_STEP_SLEEP', DEFAULT_STEP_SLEEP), report)
+                with metrics.timed('backup.compress'):
+                    size, digest = _compress(copy, f'{copy}.gz')
+                os.remove(copy)
+                entries.append({'name': name, 'pages': pages, 'size': size, 'sha256': digest})
+
+            seconds = round(time.perf_counter() - started, 3)
+            with open(os.path.join(partial, MANIFEST), 'w') as f:
+                json.dump({'databases': entries, 'seconds': seconds}, f, indent=2)
+            final = os.path.join(directory, stamp)
+            os.rename(partial, final)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            metrics.incr('backup.failures')
+            raise
+
+        prune(config.get('QUIZMASTER_BACKUP_KEEP', DEFAULT_KEEP))
+
+    backup = BackupRun(final, {'databases': entries, 'seconds': seconds})
+    metrics.incr('backup.runs')
+    metrics.observe('backup.run', seconds)
+    metrics.gauge('backup.last_size', backup.size)
+    metrics.gauge('backup.last_success', time.time())
+    return backup
+
+@contextmanager
+def _exclusive(directory):
+    """One backup at a time per backup directory, across processes"""
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise BackupError('another backup is already running')
+        # Left behind by a run that died; nothing else can be writing them
+        for name in os.listdir(directory):
+            if name.endswith('.partial'):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _copy(path, copy, step_pages, step_sleep, report):
+    source = sqlite3.connect(path, isolation_level=None)
+    target = sqlite3.connect(copy)
+    try:
+        source.execute('PRAGMA query_only=ON')
+        if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            # Pin a snapshot: the copy is consistent, and commits by other
+            # connections neither wait for it nor restart it
+            source.execute('BEGIN')
+            source.execute('SELECT count(*) FROM sqlite_master').fetchone()
+
+        resumed = time.perf_counter()
+
+        def step(status, remaining, total):
+            nonlocal resumed
+            metrics.observe('backup.step', time.perf_counter() - resumed)
+            report(total - remaining, total)
+            if remaining:
+                time.sleep(step_sleep)
+            resumed = time.perf_counter()
+
+        source.backup(target, pages=step_pages, progress=step)
+        pages = target.execute('PRAGMA page_count').fetchone()[0]
+        if source.in_transaction:
+            source.execute('COMMIT')
+        return pages
+    finally:
+        target.close()
+        source.close()
+
+def _compress(path, compressed):
+    with open(path, 'rb') as src, gzip.open(compressed, 'wb', compresslevel=COMPRESS_LEVEL) as out:
+        shutil.copyfileobj(src, out, CHUNK_SIZE)
+    return os.path.getsize(compressed), _sha256(compressed)
+
+def prune(keep):
+    """Delete all but the newest `keep` runs; returns how many were deleted"""
+    old = runs()[keep:]
+    for backup in old:
+        shutil.rmtree(backup.directory, ignore_errors=True)
+    return len(old)
+
+@jobs.handler('backup')
+def backup_job(ctx):
+    last = 0.0
+
+    def report(percent, message):
+        nonlocal last
+        # ctx.progress commits; once a second is plenty
+        if time.monotonic() - last >= 1:
+            last = time.monotonic()
+            ctx.progress(percent, message)
+
+    backup = run(progress=report)
+    return {'backup': backup.stamp, 'databases': len(backup.databases),
+            'bytes': backup.size, 'seconds': backup.seconds}
+
+jobs.schedule('backup', 'QUIZMASTER_BACKUP_INTERVAL_MINUTES')
+
+# Reading, verifying and restoring
+
+def runs():
+    """Completed runs, newest first"""
+    directory = backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        try:
+            with open(os.path.join(directory, name, MANIFEST)) as f:
+                found.append(BackupRun(os.path.join(directory, name), json.load(f)))
+        except (OSError, ValueError, KeyError):
+            continue
+    found.sort(key=lambda backup: backup.stamp, reverse=True)
+    return found
+
+def find(stamp=None):
+    """The run with this stamp, or the newest; raises BackupError"""
+    for backup in runs():
+        if stamp is None or backup.stamp == stamp:
+            return backup
+    raise BackupError(f'no backup {stamp}' if stamp else 'no backups yet')
+
+def _decompress(compressed, path):
+    with gzip.open(compressed, 'rb') as src, open(path, 'wb') as out:
+        shutil.copyfileobj(src, out, CHUNK_SIZE)
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def verify(backup):
+    """[(name, problem or None)] for every database in a run"""
+    results = []
+    with tempfile.TemporaryDirectory(dir=backup_dir()) as scratch:
+        for entry in backup.databases:
+            compressed = os.path.join(backup.directory, f"{entry['name']}.db.gz")
+            try:
+                if _sha256(compressed) != entry['sha256']:
+                    results.append((entry['name'], 'checksum mismatch'))
+                    continue
+                copy = os.path.join(scratch, f"{entry['name']}.db")
+                _decompress(compressed, copy)
+                connection = sqlite3.connect(copy)
+                try:
+                    problems = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+                finally:
+                    connection.close()
+                results.append((entry['name'], None if problems == ['ok'] else '; '.join(problems[:5])))
+            except (OSError, EOFError, sqlite3.DatabaseError) as e:
+                results.append((entry['name'], str(e)))
+    return results
+
+def restore(backup):
+    """Replace the live databases with a verified run. Stop the app first."""
+    current = dict(databases())
+    missing = [entry['name'] for entry in backup.databases if entry['name'] not in current]
+    if missing:
+        raise BackupError(f"not configured here: {', '.join(missing)}")
+    problems = [f'{name}: {problem}' for name, problem in verify(backup) if problem]
+    if problems:
+        raise BackupError(f"backup {backup.stamp} failed verification ({'; '.join(problems)})")
+
+    for engine in db.engines.values():
+        engine.dispose()
+    for entry in backup.databases:
+        path = current[entry['name']]
+        restoring = f'{path}.restoring'
+        _decompress(os.path.join(backup.directory, f"{entry['name']}.db.gz"), restoring)
+        # A WAL left from the replaced file would be replayed into the restored one
+        for suffix in ('-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+        os.replace(restoring, path)
+    return [entry['name'] for entry in backup.databases]
@@ -0,0 +1,184 @@
+"""
+In-memory subject -> chapter -> quiz tree shared by the browsing pages.
+
+Each worker keeps one immutable Catalog built from three flat queries plus
+a question count per quiz, with the chapter/quiz/question counts the pages
+show precomputed on every node. Freshness comes from the single
+catalog_version row: mapper events bump it in the same transaction as any
+change to a subject, chapter, quiz or quiz question (bulk deletes call
+bump_version() themselves), so every process notices the change on its
+next request by reading one integer, and rebuilds only then.
+"""
+
+import threading
+from sqlalchemy import event, func, insert, select, update
+from flask import g
+from models import db
+from models.subject import Subject
+from models.chapter import Chapter
+from models.quiz import Quiz
+from models.question import Question
+from models.catalog_version import CatalogVersion
+from services import metrics
+
+_tree = None
+_lock = threading.Lock()
+
+class SubjectNode:
+    __slots__ = ('id', 'name', 'description', 'created_at', 'chapters',
+                 'chapter_count', 'quiz_count', 'question_count')
+
+    def __init__(self, subject, chapters):
+        self.id = subject.id
+        self.name = subject.name
+        self.description = subject.description
+        self.created_at = subject.created_at
+        self.chapters = chapters
+        self.chapter_count = len(chapters)
+        self.quiz_count = sum(chapter.quiz_count for chapter in chapters)
+        self.question_count = sum(chapter.question_count for chapter in chapters)
+
+    def __repr__(self):
+        return f'<SubjectNode {self.name}>'
+
+class ChapterNode:
+    __slots__ = ('id', 'subject_id', 'subject', 'name', 'description', 'created_at',
+                 'quizzes', 'quiz_count', 'question_count')
+
+    def __init__(self, chapter, quizzes):
+        self.id = chapter.id
+        self.subject_id = chapter.subject_id
+        self.subject = None  # set once the parent node exists
+        self.name = chapter.name
+        self.description = chapter.description
+        self.created_at = chapter.created_at
+        self.quizzes = quizzes
+        self.quiz_count = len(quizzes)
+        self.question_count = sum(quiz.question_count for quiz in quizzes)
+
+    def __repr__(self):
+        return f'<ChapterNode {self.name}>'
+
+class QuizNode:
+    __slots__ = ('id', 'chapter_id', 'chapter', 'date_of_quiz', 'time_duration',
+                 'remarks', 'draw_count', 'created_at', 'question_count',
+                 'warmup_minutes', 'warmup_steps')
+
+    def __init__(self, quiz, fixed_questions):
+        self.id = quiz.id
+        self.chapter_id = quiz.chapter_id
+        self.chapter = None  # set once the parent node exists
+        self.date_of_quiz = quiz.date_of_quiz
+        self.time_duration = quiz.time_duration
+        self.remarks = quiz.remarks
+        self.draw_count = quiz.draw_count
+        self.created_at = quiz.created_at
+        self.question_count = quiz.draw_count if quiz.draw_count else fixed_questions
+        self.warmup_minutes = quiz.warmup_minutes
+        self.warmup_steps = quiz.warmup_steps
+
+    @property
+    def is_bank_draw(self):
+        return bool(self.draw_count)
+
+    def __repr__(self):
+        return f'<QuizNode {self.id}>'
+
+class Catalog:
+    """One version of the tree; never modified after it is built"""
+    __slots__ = ('version', 'subjects', 'chapters', 'quizzes',
+                 '_subjects_by_id', '_chapters_by_id', '_quizzes_by_id')
+
+    def __init__(self, version, subjects):
+        self.version = version
+        self.subjects = subjects
+        self.chapters = tuple(sorted((chapter for subject in subjects for chapter in subject.chapters),
+                                     key=lambda chapter: chapter.id))
+        self.quizzes = tuple(sorted((quiz for chapter in self.chapters for quiz in chapter.quizzes),
+                                    key=lambda quiz: quiz.id))
+        self._subjects_by_id = {subject.id: subject for subject in subjects}
+        self._chapters_by_id = {chapter.id: chapter for chapter in self.chapters}
+        self._quizzes_by_id = {quiz.id: quiz for quiz in self.quizzes}
+
+    def subject(self, subject_id):
+        return self._subjects_by_id.get(subject_id)
+
+    def chapter(self, chapter_id):
+        return self._chapters_by_id.get(chapter_id)
+
+    def quiz(self, quiz_id):
+        return self._quizzes_by_id.get(quiz_id)
+
+def init_catalog():
+    """Attach the version-bumping listeners (safe to call more than once)"""
+    for model in (Subject, Chapter, Quiz, Question):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            if not event.contains(model, name, _changed):
+                event.listen(model, name, _changed)
+
+def _changed(mapper, connection, target):
+    # Bank questions (no quiz) do not show up in the tree
+    if isinstance(target, Question) and target.quiz_id is None:
+        return
+    _bump(connection)
+
+def _bump(executor):
+    table = CatalogVersion.__table__
+    result = executor.execute(
+        update(table).where(table.c.id == 1).values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        executor.execute(insert(table).values(id=1, version=1))
+
+def bump_version():
+    """Mark the catalog changed, for bulk statements that bypass the mapper
+    events; commit it with the change"""
+    _bump(db.session)
+
+def read_version():
+    return db.session.execute(select(CatalogVersion.version).where(CatalogVersion.id == 1)).scalar() or 0
+
+def current():
+    """The catalog tree, checked against the version row once per request"""
+    global _tree
+    if 'catalog' in g:
+        return g.catalog
+
+    version = read_version()
+    tree = _tree
+    if tree is None or tree.version != version:
+        with _lock:
+            tree = _tree
+            if tree is None or tree.version != version:
+                with metrics.timed('catalog.rebuild'):
+                    tree = _tree = _build(version)
+    g.catalog = tree
+    return tree
+
+def _build(version):
+    # The version was read first, so a change committed meanwhile only
+    # causes one more rebuild on the next request
+    question_counts = dict(db.session.execute(
+        select(Question.quiz_id, func.count()).where(Question.quiz_id.isnot(None)).group_by(Question.quiz_id)
+    ).all())
+
+    quizzes_by_chapter = {}
+    for quiz in db.session.execute(select(Quiz).order_by(Quiz.id)).scalars():
+        quizzes_by_chapter.setdefault(quiz.chapter_id, []).append(
+            QuizNode(quiz, question_counts.get(quiz.id, 0)))
+
+    chapters_by_subject = {}
+    for chapter in db.session.execute(select(Chapter).order_by(Chapter.id)).scalars():
+        node = ChapterNode(chapter, tuple(quizzes_by_chapter.get(chapter.id, ())))
+        for quiz in node.quizzes:
+            quiz.chapter = node
+        chapters_by_subject.setdefault(chapter.subject_id, []).append(node)
+
+    subjects = []
+    for subject in db.session.execute(select(Subject).order_by(Subject.id)).scalars():
+        node = SubjectNode(subject, tuple(chapters_by_subject.get(subject.id, ())))
+        for chapter in node.chapters:
+            chapter.subject = node
+        subjects.append(node)
+
+    return Catalog(version, tuple(subjects))
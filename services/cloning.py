@@ -0,0 +1,162 @@
+"""
+Server-side copies of quizzes, chapters and subjects, and bulk rescheduling.
+
+A clone is a handful of INSERT ... SELECT statements in one transaction,
+one per level of the tree, so copying a subject with tens of thousands of
+questions never loads a row into Python. Copied chapters and quizzes get
+ids numbered on from the table's current maximum in the source's id
+order, which lets the next level's statement map old parent ids to new
+ones with the same ROW_NUMBER() expression. The catalog version is bumped
+first: besides telling every worker about the new rows, that write takes
+SQLite's write lock, so no other insert can take those ids before commit.
+
+Dates move as a block: the earliest quiz lands on start_date (or every
+date shifts by shift_days) and the others keep their spacing.
+"""
+
+from datetime import datetime
+from sqlalchemy import func, insert, literal, select, update
+from models import db
+from models.subject import Subject
+from models.chapter import Chapter
+from models.quiz import Quiz
+from models.question import Question
+from services import catalog, metrics
+
+QUESTION_COLUMNS = ('tag', 'question_statement', 'option1', 'option2', 'option3', 'option4', 'correct_option')
+QUIZ_COLUMNS = ('remarks', 'draw_count', 'draw_tags', 'warmup_minutes', 'warmup_steps')
+
+def _id_map(table, condition):
+    """old_id -> new_id for the rows matching condition, numbered on from
+    the current maximum id. Later statements in the transaction can reuse
+    it as long as condition still matches only the originals."""
+    base = db.session.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+    return select(
+        table.c.id.label('old_id'),
+        (literal(base) + func.row_number().over(order_by=table.c.id)).label('new_id'),
+    ).where(condition).subquery()
+
+def _shift(condition, start_date, shift_days):
+    """Days to move the quizzes matching condition by"""
+    if start_date is None:
+        return shift_days or 0
+    earliest = db.session.execute(select(func.min(Quiz.date_of_quiz)).where(condition)).scalar()
+    return (start_date - earliest).days if earliest else 0
+
+def _shifted(column, days):
+    # SQLite stores dates as YYYY-MM-DD, which date() reads and writes
+    return func.date(column, f'{days:+d} days') if days else column
+
+def _copy_questions(parent_column, parents, now, condition=None):
+    """Copy the questions whose parent_column is in the parents id map,
+    pointing the copies at the new parent ids"""
+    questions = Question.__table__
+    query = select(parents.c.new_id, *(questions.c[name] for name in QUESTION_COLUMNS), literal(now)) \
+        .select_from(questions.join(parents, parents.c.old_id == questions.c[parent_column]))
+    if condition is not None:
+        query = query.where(condition)
+    return db.session.execute(insert(questions).from_select(
+        [parent_column, *QUESTION_COLUMNS, 'created_at'], query)).rowcount
+
+def _copy_chapters(condition, subject_id, name, now):
+    """Copy chapters and their question banks into subject_id (None: the
+    same subject); returns (chapter id map, chapters, bank questions)"""
+    chapters = Chapter.__table__
+    chapter_map = _id_map(chapters, condition)
+    copied = db.session.execute(insert(chapters).from_select(
+        ['id', 'name', 'description', 'subject_id', 'created_at', 'bank_version'],
+        select(chapter_map.c.new_id, literal(name) if name else chapters.c.name, chapters.c.description,
+               literal(subject_id) if subject_id else chapters.c.subject_id, literal(now), literal(0))
+        .select_from(chapters.join(chapter_map, chapter_map.c.old_id == chapters.c.id))
+    )).rowcount
+    bank = _copy_questions('chapter_id', chapter_map, now, Question.__table__.c.quiz_id.is_(None))
+    return chapter_map, copied, bank
+
+def _copy_quizzes(condition, shift, time_duration, now, chapter_map=None, chapter_id=None):
+    """Copy quizzes and their questions into the copies of their chapters
+    (chapter_map) or into chapter_id; returns (quizzes, questions)"""
+    quizzes = Quiz.__table__
+    quiz_map = _id_map(quizzes, condition)
+    source = quizzes.join(quiz_map, quiz_map.c.old_id == quizzes.c.id)
+    if chapter_map is not None:
+        source = source.join(chapter_map, chapter_map.c.old_id == quizzes.c.chapter_id)
+    copied = db.session.execute(insert(quizzes).from_select(
+        ['id', 'chapter_id', 'date_of_quiz', 'time_duration', *QUIZ_COLUMNS, 'created_at'],
+        select(quiz_map.c.new_id,
+               chapter_map.c.new_id if chapter_map is not None else literal(chapter_id),
+               _shifted(quizzes.c.date_of_quiz, shift),
+               literal(time_duration) if time_duration else quizzes.c.time_duration,
+               *(quizzes.c[name] for name in QUIZ_COLUMNS), literal(now))
+        .select_from(source)
+    )).rowcount
+    return copied, _copy_questions('quiz_id', quiz_map, now)
+
+# Cloning
+
+def clone_quiz(quiz_id, chapter_id=None, start_date=None, shift_days=None, time_duration=None):
+    """Copy a quiz and its questions (into chapter_id, default its own
+    chapter); returns (new quiz id, counts)"""
+    quiz = db.session.get(Quiz, quiz_id)
+    condition = Quiz.id == quiz_id
+    with metrics.timed('clone.quiz'):
+        catalog.bump_version()
+        now = datetime.utcnow()
+        quizzes, questions = _copy_quizzes(condition, _shift(condition, start_date, shift_days), time_duration,
+                                           now, chapter_id=chapter_id or quiz.chapter_id)
+        new_id = db.session.execute(select(func.max(Quiz.id))).scalar()
+        db.session.commit()
+    return new_id, {'quizzes': quizzes, 'questions': questions}
+
+def clone_chapter(chapter_id, subject_id=None, name=None, start_date=None, shift_days=None, time_duration=None):
+    """Copy a chapter with its question bank, quizzes and questions (into
+    subject_id, default its own subject); returns (new chapter id, counts)"""
+    condition = Quiz.chapter_id == chapter_id
+    with metrics.timed('clone.chapter'):
+        catalog.bump_version()
+        now = datetime.utcnow()
+        chapter_map, chapters, bank = _copy_chapters(Chapter.id == chapter_id, subject_id, name, now)
+        new_id = db.session.execute(select(func.max(Chapter.id))).scalar()
+        quizzes, questions = _copy_quizzes(condition, _shift(condition, start_date, shift_days), time_duration,
+                                           now, chapter_map=chapter_map)
+        db.session.commit()
+    return new_id, {'chapters': chapters, 'quizzes': quizzes, 'questions': questions + bank}
+
+def clone_subject(subject_id, name=None, start_date=None, shift_days=None, time_duration=None):
+    """Copy a subject and everything under it; returns (new subject id, counts)"""
+    subject = db.session.get(Subject, subject_id)
+    in_subject = Chapter.subject_id == subject_id
+    condition = Quiz.chapter_id.in_(select(Chapter.id).where(in_subject))
+    with metrics.timed('clone.subject'):
+        catalog.bump_version()
+        now = datetime.utcnow()
+        copy = Subject(name=name or f'{subject.name} (copy)', description=subject.description, created_at=now)
+        db.session.add(copy)
+        db.session.flush()
+        chapter_map, chapters, bank = _copy_chapters(in_subject, copy.id, None, now)
+        quizzes, questions = _copy_quizzes(condition, _shift(condition, start_date, shift_days), time_duration,
+                                           now, chapter_map=chapter_map)
+        db.session.commit()
+    return copy.id, {'chapters': chapters, 'quizzes': quizzes, 'questions': questions + bank}
+
+# Rescheduling
+
+def reschedule(quiz_ids, start_date=None, shift_days=None, time_duration=None):
+    """Move many quizzes' dates as a block, and optionally set their
+    duration, in one UPDATE; returns quizzes changed"""
+    if not quiz_ids:
+        return 0
+    condition = Quiz.id.in_(quiz_ids)
+    values = {}
+    shift = _shift(condition, start_date, shift_days)
+    if shift:
+        values['date_of_quiz'] = _shifted(Quiz.__table__.c.date_of_quiz, shift)
+    if time_duration:
+        values['time_duration'] = time_duration
+    if not values:
+        return 0
+
+    with metrics.timed('clone.reschedule'):
+        result = db.session.execute(update(Quiz.__table__).where(Quiz.__table__.c.id.in_(quiz_ids)).values(**values))
+        catalog.bump_version()
+        db.session.commit()
+    return result.rowcount
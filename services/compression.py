@@ -0,0 +1,46 @@
+"""
+Gzip for dynamic HTML and JSON responses.
+
+Responses are compressed after the view runs when the client accepts
+gzip and the body is at least QUIZMASTER_GZIP_MIN_SIZE bytes; smaller
+bodies gain less than the CPU cost. Streamed responses (file downloads,
+server-sent events) are left alone.
+"""
+
+import gzip
+from flask import current_app, request
+from services import metrics
+
+COMPRESSIBLE_MIMETYPES = ('text/html', 'application/json')
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVEL = 6
+
+def init_compression(app):
+    app.config.setdefault('QUIZMASTER_GZIP_MIN_SIZE', DEFAULT_MIN_SIZE)
+    app.config.setdefault('QUIZMASTER_GZIP_LEVEL', DEFAULT_LEVEL)
+    app.after_request(compress_response)
+
+def compress_response(response):
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or not 200 <= response.status_code < 300):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip'] <= 0:
+        return response
+
+    data = response.get_data()
+    if len(data) < current_app.config['QUIZMASTER_GZIP_MIN_SIZE']:
+        return response
+
+    compressed = gzip.compress(data, compresslevel=current_app.config['QUIZMASTER_GZIP_LEVEL'])
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Length'] = str(len(compressed))
+
+    metrics.incr('http.gzip.responses')
+    metrics.incr('http.gzip.bytes_saved', len(data) - len(compressed))
+    return response
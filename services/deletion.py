@@ -0,0 +1,182 @@
+"""
+Subtree deletes for subjects, chapters, quizzes and users.
+
+Small subtrees are removed with a single DELETE of the parent row and the
+database's ON DELETE CASCADE does the rest. Large ones (by dependent
+question and score rows) are removed by a background job, a chunk of
+rows per transaction with a pause in between, so the SQLite write lock is
+only ever held briefly and quiz submissions keep going through.
+
+Score shards sit in other files, out of reach of the cascade, so their
+rows are deleted explicitly on every shard before the parent goes. So
+are archived attempts: their blocks are rewritten before the parent
+goes and committed along with it, but in the archive database's own
+transaction (a user's blocks are deleted in one of their own first), so
+the two are not atomic and `flask archive purge` clears what a failed
+delete leaves behind. Rewriting means decompressing every block the
+subtree's quizzes could appear in, so the attempts in those blocks count
+toward the threshold too.
+"""
+
+import time
+from flask import current_app, session
+from sqlalchemy import delete, func, select
+from models import db
+from models.user import User
+from models.subject import Subject
+from models.chapter import Chapter
+from models.quiz import Quiz
+from models.question import Question
+from models.score import Score
+from models.recommendation import ChapterRecommendation
+from models.routing import SHARDED_TABLES
+from services import archive, catalog, jobs, metrics, series, sharding
+
+SUBTREES = {
+    'subject': Subject,
+    'chapter': Chapter,
+    'quiz': Quiz,
+    'user': User,
+}
+
+DEFAULT_CHUNKED_THRESHOLD = 50000
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_CHUNK_PAUSE = 0.05
+
+def _quiz_ids(kind, obj_id):
+    if kind == 'quiz':
+        return select(Quiz.id).where(Quiz.id == obj_id)
+    if kind == 'chapter':
+        return select(Quiz.id).where(Quiz.chapter_id == obj_id)
+    return select(Quiz.id).join(Chapter, Chapter.id == Quiz.chapter_id).where(Chapter.subject_id == obj_id)
+
+def _dependents(kind, obj_id):
+    """(model, filter) pairs for the bulky rows under a subtree, leaves first"""
+    if kind == 'user':
+        return [(Score, Score.user_id == obj_id),
+                (ChapterRecommendation, ChapterRecommendation.user_id == obj_id)]
+    quiz_ids = _quiz_ids(kind, obj_id)
+    dependents = [(Score, Score.quiz_id.in_(quiz_ids)),
+                  (Question, Question.quiz_id.in_(quiz_ids))]
+    if kind == 'chapter':
+        dependents.append((Question, Question.chapter_id == obj_id))
+    elif kind == 'subject':
+        dependents.append((Question, Question.chapter_id.in_(
+            select(Chapter.id).where(Chapter.subject_id == obj_id))))
+    return dependents
+
+def _archived_quizzes(kind, obj_id):
+    """(quiz ids, since) for archive.delete_quizzes: no attempt at a quiz
+    predates the quiz, so blocks ending before the oldest are skipped"""
+    quizzes = db.session.execute(select(Quiz.id, Quiz.created_at).where(Quiz.id.in_(_quiz_ids(kind, obj_id)))).all()
+    created = [created_at for _, created_at in quizzes]
+    return [quiz_id for quiz_id, _ in quizzes], min(created) if created and all(created) else None
+
+def _delete_archived(kind, obj_id):
+    """Drop the subtree's archived attempts (blocks left in the session)"""
+    if kind == 'user':
+        archive.delete_user(obj_id)
+        series.delete_user(obj_id)
+        return
+    quiz_ids, since = _archived_quizzes(kind, obj_id)
+    if quiz_ids:
+        archive.delete_quizzes(quiz_ids, since=since)
+
+def _shards_for(model):
+    """Shards holding model's rows ([None] for the primary)"""
+    return sharding.shards() if _is_sharded(model) else [None]
+
+def _is_sharded(model):
+    return model.__tablename__ in SHARDED_TABLES
+
+def _count(model, condition):
+    return db.session.execute(select(func.count()).select_from(model).where(condition)).scalar()
+
+def _delete_all(model, condition):
+    db.session.execute(delete(model).where(condition))
+    db.session.commit()
+
+def subtree_size(kind, obj_id):
+    """Number of question and score rows that deleting the object removes,
+    plus the archived attempts it decompresses to do so"""
+    total = 0
+    if kind != 'user':
+        quiz_ids, since = _archived_quizzes(kind, obj_id)
+        if quiz_ids:
+            total += archive.attempts_since(since)
+    for model, condition in _dependents(kind, obj_id):
+        if _is_sharded(model):
+            total += sum(sharding.fan_out(_count, model, condition))
+        else:
+            total += _count(model, condition)
+    return total
+
+def delete_subtree(kind, obj_id):
+    """Delete an object and everything under it.
+
+    Returns 'deleted' when done inline, or 'scheduled' when the subtree is
+    above QUIZMASTER_CHUNKED_DELETE_THRESHOLD and a background job has been
+    queued to remove it.
+    """
+    threshold = current_app.config.get('QUIZMASTER_CHUNKED_DELETE_THRESHOLD', DEFAULT_CHUNKED_THRESHOLD)
+    if subtree_size(kind, obj_id) > threshold:
+        jobs.submit('delete_subtree', {'kind': kind, 'obj_id': obj_id},
+                    created_by=session.get('user_id'), max_attempts=5)
+        metrics.incr('delete.chunked_scheduled')
+        return 'scheduled'
+
+    model = SUBTREES[kind]
+    with metrics.timed(f'delete.{kind}'):
+        if sharding.enabled():
+            for dependent, condition in _dependents(kind, obj_id):
+                if _is_sharded(dependent):
+                    sharding.fan_out(_delete_all, dependent, condition)
+        _delete_archived(kind, obj_id)
+        db.session.execute(delete(model).where(model.id == obj_id))
+        if kind != 'user':
+            catalog.bump_version()
+        db.session.commit()
+    return 'deleted'
+
+def delete_in_chunks(kind, obj_id, chunk_size=DEFAULT_CHUNK_SIZE, pause=DEFAULT_CHUNK_PAUSE, progress=None):
+    """Delete a subtree a chunk at a time, committing after every chunk.
+
+    progress, if given, is called as progress(removed, total) after each
+    chunk. Safe to re-run after an interruption.
+    """
+    total = subtree_size(kind, obj_id)
+    removed = 0
+    for model, condition in _dependents(kind, obj_id):
+        for shard in _shards_for(model):
+            while True:
+                with sharding.on_shard(shard):
+                    chunk = select(model.id).where(condition).limit(chunk_size)
+                    result = db.session.execute(delete(model).where(model.id.in_(chunk)))
+                    db.session.commit()
+                removed += result.rowcount
+                if progress:
+                    progress(removed, total)
+                if result.rowcount < chunk_size:
+                    break
+                time.sleep(pause)
+
+    _delete_archived(kind, obj_id)
+    parent = SUBTREES[kind]
+    db.session.execute(delete(parent).where(parent.id == obj_id))
+    if kind != 'user':
+        catalog.bump_version()
+    db.session.commit()
+    return removed
+
+@jobs.handler('delete_subtree')
+def delete_subtree_job(ctx, kind, obj_id):
+    config = current_app.config
+    chunk_size = config.get('QUIZMASTER_DELETE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    pause = config.get('QUIZMASTER_DELETE_CHUNK_PAUSE', DEFAULT_CHUNK_PAUSE)
+
+    def report(removed, total):
+        ctx.progress(removed * 99 // max(total, 1), f'Deleted {removed} of {total} rows')
+
+    with metrics.timed(f'delete.{kind}.chunked'):
+        removed = delete_in_chunks(kind, obj_id, chunk_size, pause, progress=report)
+    return {'kind': kind, 'id': obj_id, 'rows_removed': removed}
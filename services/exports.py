@@ -0,0 +1,75 @@
+"""
+Score exports, written as CSV files under instance/exports/ by a
+background job and downloaded from the admin jobs page.
+"""
+
+import csv
+import os
+from flask import current_app
+from sqlalchemy import func, select
+from models import db
+from models.routing import read_only_session
+from models.user import User
+from models.subject import Subject
+from models.chapter import Chapter
+from models.quiz import Quiz
+from models.score import Score
+from services import jobs, sharding
+
+CHUNK_SIZE = 5000
+
+COLUMNS = ['score_id', 'attempted_at', 'user_id', 'username', 'full_name',
+           'subject', 'chapter', 'quiz_id', 'quiz_date', 'total_scored', 'total_questions']
+
+def export_dir():
+    path = os.path.join(current_app.instance_path, 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def export_path(filename):
+    """Absolute path of an export file, refusing anything outside export_dir()"""
+    return os.path.join(export_dir(), os.path.basename(filename))
+
+@jobs.handler('export_scores')
+def export_scores_job(ctx, user_id=None):
+    filename = f'scores-{ctx.job_id}.csv'
+    conditions = [Score.user_id == user_id] if user_id else []
+
+    total = 0
+    for shard in sharding.shards():
+        with sharding.on_shard(shard), read_only_session():
+            total += db.session.execute(select(func.count(Score.id)).where(*conditions)).scalar()
+
+    written = 0
+    with open(export_path(filename), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for shard in sharding.shards():
+            written = _export_shard(ctx, writer, shard, conditions, written, total)
+
+    return {'filename': filename, 'rows': written}
+
+def _export_shard(ctx, writer, shard, conditions, written, total):
+    """Write one shard's scores (the only one when unsharded); returns the running total"""
+    last_id = 0
+    while True:
+        # Keyset pagination keeps each read short and index-only on score.id
+        with sharding.on_shard(shard), read_only_session():
+            rows = db.session.execute(
+                select(Score.id, Score.time_stamp_of_attempt, User.id, User.username, User.full_name,
+                       Subject.name, Chapter.name, Quiz.id, Quiz.date_of_quiz,
+                       Score.total_scored, Score.total_questions)
+                .join(User, User.id == Score.user_id)
+                .join(Quiz, Quiz.id == Score.quiz_id)
+                .join(Chapter, Chapter.id == Quiz.chapter_id)
+                .join(Subject, Subject.id == Chapter.subject_id)
+                .where(Score.id > last_id, *conditions)
+                .order_by(Score.id).limit(CHUNK_SIZE)
+            ).all()
+        if not rows:
+            return written
+
+        writer.writerows(rows)
+        written += len(rows)
+        last_id = rows[-1][0]
+        ctx.progress(written * 99 // max(total, 1), f'Exported {written} of {total} scores')
@@ -0,0 +1,67 @@
+"""
+Rendered HTML fragments of the quiz pages, cached per worker.
+
+A question's statement and options render the same for every attempt,
+so take_quiz renders each question's body once and then reuses the HTML.
+Entries are keyed by question id and carry the text they were rendered
+from. An edited question no longer matches its entry and is simply
+rendered again, so nothing has to invalidate the cache. The newest
+FRAGMENT_CACHE_SIZE bodies are kept. services/warmup.py fills the cache
+ahead of a quiz.
+"""
+
+import threading
+from collections import OrderedDict
+from flask import render_template
+from markupsafe import Markup
+from services import metrics
+
+FRAGMENT_CACHE_SIZE = 20000
+QUESTION_TEMPLATE = 'user/_question_body.html'
+
+_lock = threading.Lock()
+_questions = OrderedDict()  # question id -> (content, html)
+
+def init_fragments(app):
+    app.jinja_env.globals['question_body'] = question_body
+
+def _content(question):
+    return (question.question_statement, question.option1, question.option2, question.option3, question.option4)
+
+def question_body(question):
+    """The card body of one question on the take-quiz page"""
+    content = _content(question)
+    with _lock:
+        entry = _questions.get(question.id)
+        if entry is not None and entry[0] == content:
+            _questions.move_to_end(question.id)
+            metrics.incr('fragments.hits')
+            return entry[1]
+
+    metrics.incr('fragments.misses')
+    html = Markup(render_template(QUESTION_TEMPLATE, question=question))
+    _store(question.id, content, html)
+    return html
+
+def _store(question_id, content, html):
+    with _lock:
+        _questions[question_id] = (content, html)
+        _questions.move_to_end(question_id)
+        while len(_questions) > FRAGMENT_CACHE_SIZE:
+            _questions.popitem(last=False)
+
+def prerender(questions):
+    """Render and cache the bodies of questions not cached yet; returns
+    how many were rendered"""
+    rendered = 0
+    for question in questions:
+        with _lock:
+            entry = _questions.get(question.id)
+        content = _content(question)
+        if entry is None or entry[0] != content:
+            _store(question.id, content, Markup(render_template(QUESTION_TEMPLATE, question=question)))
+            rendered += 1
+    return rendered
+
+def cached():
+    return len(_questions)
@@ -0,0 +1,24 @@
+"""Scoring a set of answers against the questions an attempt was shown."""
+
+from itertools import zip_longest
+
+def count_correct(questions, answers):
+    """Number of answers matching their question's correct option.
+
+    answers is aligned with questions; each entry is an option number
+    (1-4, as int or string) or None for an unanswered question.
+    """
+    total_scored = 0
+    for question, answer in zip(questions, answers):
+        try:
+            if answer is not None and int(answer) == question.correct_option:
+                total_scored += 1
+        except (TypeError, ValueError):
+            continue
+    return total_scored
+
+def grade_drawn(questions, answers):
+    """(scored, total) for an attempt's stored draw, as from
+    question_bank.load_drawn; questions deleted since are left out"""
+    graded = [(question, answer) for question, answer in zip_longest(questions, answers) if question is not None]
+    return count_correct([question for question, _ in graded], [answer for _, answer in graded]), len(graded)
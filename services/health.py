@@ -0,0 +1,42 @@
+"""
+Process readiness for the load balancer.
+
+A worker only reports ready once warm_up() has run in it: the database
+is reachable through the worker's own connection pool and every template
+has been compiled.
+"""
+
+import threading
+from sqlalchemy import text
+from models import db
+
+_ready = threading.Event()
+
+def is_ready():
+    return _ready.is_set()
+
+def mark_not_ready():
+    _ready.clear()
+
+def warm_up(app):
+    """Open a DB connection and compile all templates, then report ready"""
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+
+    _ready.set()
+
+def reset_after_fork(app):
+    """Drop connections inherited from the parent process.
+
+    Called in each worker right after fork; the pool then opens fresh
+    connections on first use instead of sharing the master's sockets/files.
+    """
+    mark_not_ready()
+    with app.app_context():
+        # close=False: the parent still owns those connections
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,329 @@
+"""
+Background jobs for heavy admin operations.
+
+Jobs are rows in the job table, so they survive restarts and are visible
+to every worker process. Each web process runs a dispatcher thread that
+claims queued jobs and executes them on a small thread pool; the number
+of jobs running at once across all processes is capped by
+QUIZMASTER_JOB_CONCURRENCY so request workers stay free for students.
+
+Handlers are plain functions registered with @handler('kind'). They get
+a JobContext as first argument plus the job's params, report progress
+through ctx.progress() (which is also where cancellation is noticed) and
+return a JSON-serialisable result. A handler that raises is retried with
+exponential backoff until max_attempts is reached.
+
+While a handler runs, its process's dispatcher refreshes the job's
+heartbeat, so a job is only taken for lost when the process running it
+is gone; it is then queued again, or failed once its attempts are used up.
+
+Kinds registered with schedule() are also queued by the dispatchers every
+N minutes of the clock (N from a config setting), through one conditional
+INSERT so that several processes never queue the same slot twice. Each
+process tries a slot once, so polls in between write nothing and leave
+the SQLite write lock to submissions.
+Functions registered with on_poll() run in every process's dispatcher on
+each poll, for per-process upkeep that must not wait for a request.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import exists, func, insert, literal, or_, select, update
+from models import db
+from models.job import Job
+from services import metrics
+
+DEFAULT_CONCURRENCY = 2
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_STALE_AFTER = timedelta(minutes=15)
+HEARTBEAT_INTERVAL = timedelta(minutes=1)
+RETRY_BACKOFF_SECONDS = 5
+EPOCH = datetime(1970, 1, 1)
+
+HANDLERS = {}
+SCHEDULES = {}
+POLL_HOOKS = []
+
+_runner_lock = threading.Lock()
+_runner_pid = None
+_wakeup = threading.Event()
+_running = set()  # ids of the jobs this process is executing
+_heartbeat = {'sent': EPOCH}
+_slots = {}  # kind -> the last schedule slot this process tried to queue
+
+class JobCancelled(Exception):
+    pass
+
+def handler(kind):
+    """Register a function as the handler for jobs of this kind"""
+    def register(f):
+        HANDLERS[kind] = f
+        return f
+    return register
+
+def schedule(kind, setting):
+    """Queue a job of this kind every app.config[setting] minutes (0 or
+    unset: never). Slots are aligned to the clock, e.g. 60 runs on the hour;
+    a slot is skipped while an earlier job of the kind is queued or running.
+    """
+    SCHEDULES[kind] = setting
+
+def on_poll(f):
+    """Call f() in every process's dispatcher thread on each poll, inside
+    an app context; it should return quickly when it has nothing to do"""
+    POLL_HOOKS.append(f)
+    return f
+
+class JobContext:
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, percent, message=None):
+        """Record progress and stop if cancellation was requested.
+
+        Commits the current session, so call it between units of work.
+        """
+        now = datetime.utcnow()
+        db.session.execute(
+            update(Job).where(Job.id == self.job_id)
+            .values(progress=max(0, min(100, int(percent))), progress_message=message, heartbeat_at=now)
+        )
+        db.session.commit()
+
+        if db.session.execute(select(Job.cancel_requested).where(Job.id == self.job_id)).scalar():
+            raise JobCancelled()
+
+# Submitting and controlling jobs
+
+def submit(kind, params=None, created_by=None, max_attempts=3):
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+
+    job = Job(kind=kind, params_json=json.dumps(params or {}),
+              created_by=created_by, max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.commit()
+
+    metrics.incr('jobs.submitted')
+    _wakeup.set()
+    return job
+
+def cancel(job_id):
+    """Cancel a queued job at once, or ask a running one to stop"""
+    job = db.session.get(Job, job_id)
+    if job is None or job.is_finished:
+        return False
+
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.finished_at = datetime.utcnow()
+    else:
+        job.cancel_requested = True
+    db.session.commit()
+    return True
+
+def retry(job_id):
+    """Queue a failed or cancelled job again with a fresh attempt budget"""
+    job = db.session.get(Job, job_id)
+    if job is None or job.status not in ('failed', 'cancelled'):
+        return False
+
+    job.status = 'queued'
+    job.attempts = 0
+    job.cancel_requested = False
+    job.error = None
+    job.progress = 0
+    job.progress_message = None
+    job.run_after = None
+    job.finished_at = None
+    db.session.commit()
+
+    _wakeup.set()
+    return True
+
+# Runner
+
+def init_jobs(app):
+    """Start this process's dispatcher lazily, on its first request.
+
+    Starting from a request (rather than at import) means each forked
+    Gunicorn worker gets its own thread; preload only runs in the master.
+    """
+    app.config.setdefault('QUIZMASTER_JOB_CONCURRENCY', DEFAULT_CONCURRENCY)
+    app.config.setdefault('QUIZMASTER_JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    app.before_request(_ensure_runner)
+
+    # Registers the built-in handlers
+    from services import backup, deletion, exports, recommendations, rollups, warmup  # noqa: F401
+
+def _ensure_runner():
+    global _runner_pid
+    if _runner_pid == os.getpid():
+        return
+
+    with _runner_lock:
+        if _runner_pid == os.getpid():
+            return
+        _runner_pid = os.getpid()
+        app = current_app._get_current_object()
+        threading.Thread(target=_dispatch_loop, args=(app,), daemon=True, name='job-dispatcher').start()
+
+def _dispatch_loop(app):
+    concurrency = app.config['QUIZMASTER_JOB_CONCURRENCY']
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job')
+
+    while True:
+        try:
+            with app.app_context():
+                send_heartbeats()
+                requeue_stale()
+                enqueue_due()
+                while (job_id := claim_next(concurrency)) is not None:
+                    executor.submit(_execute, app, job_id)
+                db.session.remove()
+        except Exception:
+            app.logger.exception('Job dispatcher iteration failed')
+
+        for hook in POLL_HOOKS:
+            with app.app_context():
+                try:
+                    hook()
+                except Exception:
+                    app.logger.exception('Dispatcher poll hook %s failed', hook.__name__)
+                finally:
+                    db.session.remove()
+
+        _wakeup.wait(app.config['QUIZMASTER_JOB_POLL_INTERVAL'])
+        _wakeup.clear()
+
+def claim_next(concurrency):
+    """Atomically move the oldest due job to running, if under the cap"""
+    now = datetime.utcnow()
+    candidate = db.session.execute(
+        select(Job.id)
+        .where(Job.status == 'queued', or_(Job.run_after.is_(None), Job.run_after <= now))
+        .order_by(Job.id).limit(1)
+    ).scalar()
+    if candidate is None:
+        return None
+
+    running = select(func.count()).select_from(Job).where(Job.status == 'running').scalar_subquery()
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate, Job.status == 'queued', running < concurrency)
+        .values(status='running', attempts=Job.attempts + 1, started_at=now, heartbeat_at=now)
+    )
+    db.session.commit()
+    return candidate if result.rowcount == 1 else None
+
+def send_heartbeats(now=None):
+    """Refresh the heartbeat of the jobs running in this process, at most
+    once per HEARTBEAT_INTERVAL"""
+    now = now or datetime.utcnow()
+    with _runner_lock:
+        job_ids = list(_running)
+    if not job_ids or now - _heartbeat['sent'] < HEARTBEAT_INTERVAL:
+        return
+    db.session.execute(
+        update(Job).where(Job.id.in_(job_ids), Job.status == 'running').values(heartbeat_at=now)
+    )
+    db.session.commit()
+    _heartbeat['sent'] = now
+
+def requeue_stale(stale_after=DEFAULT_STALE_AFTER):
+    """Put running jobs whose process died (no heartbeat) back in the
+    queue, or fail them if they have no attempts left"""
+    now = datetime.utcnow()
+    stale = (Job.status == 'running') & (Job.heartbeat_at < now - stale_after)
+    failed = db.session.execute(
+        update(Job).where(stale, Job.attempts >= Job.max_attempts)
+        .values(status='failed', finished_at=now, error='Worker lost', progress_message='Failed after worker loss')
+    )
+    requeued = db.session.execute(
+        update(Job).where(stale)
+        .values(status='queued', progress_message='Requeued after worker loss')
+    )
+    db.session.commit()
+    if failed.rowcount:
+        metrics.incr('jobs.failed', failed.rowcount)
+    if requeued.rowcount:
+        metrics.incr('jobs.requeued', requeued.rowcount)
+
+def enqueue_due(now=None):
+    """Queue each scheduled kind whose current slot has no job yet (once
+    per slot and process)"""
+    now = now or datetime.utcnow()
+    for kind, setting in SCHEDULES.items():
+        minutes = current_app.config.get(setting) or 0
+        if minutes <= 0:
+            continue
+        period = minutes * 60
+        elapsed = (now - EPOCH).total_seconds()
+        slot = EPOCH + timedelta(seconds=elapsed - elapsed % period)
+        if _slots.get(kind) == slot:
+            continue
+
+        taken = exists().where(Job.kind == kind, or_(Job.status.in_(('queued', 'running')), Job.created_at >= slot))
+        result = db.session.execute(
+            insert(Job).from_select(
+                ['kind', 'params_json', 'status', 'progress', 'attempts', 'max_attempts',
+                 'cancel_requested', 'created_at'],
+                select(literal(kind), literal('{}'), literal('queued'), literal(0), literal(0), literal(1),
+                       literal(False), literal(now)).where(~taken)
+            )
+        )
+        db.session.commit()
+        _slots[kind] = slot
+        if result.rowcount:
+            metrics.incr('jobs.scheduled')
+
+def _execute(app, job_id):
+    with _runner_lock:
+        _running.add(job_id)
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        kind, params = job.kind, job.params
+        metrics.gauge('jobs.running', _running_count())
+
+        try:
+            with metrics.timed(f'jobs.{kind}'):
+                result = HANDLERS[kind](JobContext(job_id), **params)
+            _finish(job_id, 'succeeded', progress=100, result_json=json.dumps(result))
+            metrics.incr('jobs.succeeded')
+        except JobCancelled:
+            db.session.rollback()
+            _finish(job_id, 'cancelled', progress_message='Cancelled')
+            metrics.incr('jobs.cancelled')
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Job %s (%s) failed', job_id, kind)
+            job = db.session.get(Job, job_id)
+            if job.attempts < job.max_attempts:
+                job.status = 'queued'
+                job.error = str(e)
+                job.run_after = datetime.utcnow() + timedelta(seconds=RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+                db.session.commit()
+                metrics.incr('jobs.retried')
+            else:
+                _finish(job_id, 'failed', error=str(e))
+                metrics.incr('jobs.failed')
+        finally:
+            with _runner_lock:
+                _running.discard(job_id)
+            metrics.gauge('jobs.running', _running_count())
+            db.session.remove()
+            _wakeup.set()
+
+def _finish(job_id, status, **values):
+    db.session.execute(
+        update(Job).where(Job.id == job_id)
+        .values(status=status, finished_at=datetime.utcnow(), **values)
+    )
+    db.session.commit()
+
+def _running_count():
+    return db.session.execute(select(func.count()).select_from(Job).where(Job.status == 'running')).scalar()
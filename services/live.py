@@ -0,0 +1,508 @@
+"""
+Live hosted quizzes over server-sent events.
+
+An instructor opens a session for a quiz and advances it question by
+question while students answer and watch a live leaderboard. This runs in
+its own asyncio process (live_server.py) next to the WSGI workers, so one
+process can hold thousands of idle SSE connections; live state is kept in
+memory there and all clients of a session see the same process.
+
+Answers are plain form POSTs recorded in memory, never a DB transaction
+per click. Every QUIZMASTER_LIVE_TICK seconds each session that changed
+publishes one coalesced frame (new question, answered count, leaderboard
+and score deltas), encoded once and written as-is to every subscriber
+through the broker (services.pubsub). Scores are saved as regular Score
+rows, in one transaction per shard, when the session finishes.
+
+Clients authenticate with the site's Flask session cookie. Slow clients
+whose send buffer backs up are dropped; EventSource reconnects and gets a
+fresh snapshot.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import json
+import secrets
+import time
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qs, urlsplit
+from itsdangerous import BadSignature
+from models import db
+from models.quiz import Quiz
+from models.score import Score
+from services import metrics, question_bank, sharding
+from services.pubsub import load_broker
+
+DEFAULT_TICK = 0.25
+DEFAULT_BIND = '127.0.0.1:8001'
+LEADERBOARD_SIZE = 10
+KEEPALIVE_SECONDS = 15
+FINISHED_TTL_SECONDS = 600
+MAX_BODY = 4096
+MAX_SEND_BUFFER = 256 * 1024
+HEADER_TIMEOUT = 10
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+CODE_LENGTH = 6
+
+REASONS = {200: 'OK', 201: 'Created', 202: 'Accepted', 204: 'No Content', 400: 'Bad Request',
+           401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class LiveError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Participant:
+    __slots__ = ('user_id', 'name', 'answered', 'correct', 'answer_time')
+
+    def __init__(self, user_id, name):
+        self.user_id = user_id
+        self.name = name
+        self.answered = 0
+        self.correct = 0
+        self.answer_time = 0.0  # seconds spent on correct answers, breaks ties
+
+    def rank_key(self):
+        return (-self.correct, self.answer_time, self.user_id)
+
+class LiveSession:
+    """State of one hosted quiz; only touched from the event loop"""
+
+    def __init__(self, code, quiz_id, host_id, seed, questions):
+        self.code = code
+        self.quiz_id = quiz_id
+        self.host_id = host_id
+        self.seed = seed
+        self.questions = questions  # [(id, statement, [options], correct_option)]
+        self.status = 'lobby'
+        self.index = -1
+        self.question_started = None
+        self.answers = {}  # user_id -> (option, seconds) for the open question
+        self.participants = {}
+        self.finished_at = None
+        self.saved = False
+
+        # Pending changes, flushed into one frame per tick
+        self.seq = 0
+        self._status_changed = False
+        self._question_changed = False
+        self._counts_changed = False
+        self._reveal = None
+        self._changed_scores = set()
+        self._published_top = []
+
+    @property
+    def channel(self):
+        return f'live:{self.code}'
+
+    def join(self, user_id, name):
+        if user_id not in self.participants:
+            self.participants[user_id] = Participant(user_id, name)
+            self._counts_changed = True
+
+    def answer(self, user_id, index, option):
+        if self.status != 'question' or index != self.index:
+            raise LiveError(409, 'that question is closed')
+        if user_id in self.answers:
+            raise LiveError(409, 'already answered')
+        if option not in (1, 2, 3, 4):
+            raise LiveError(400, 'option must be 1-4')
+        self.answers[user_id] = (option, time.monotonic() - self.question_started)
+        self._counts_changed = True
+
+    def advance(self):
+        """Close the open question (if any) and open the next one"""
+        self._close_question()
+        if self.index + 1 >= len(self.questions):
+            self._finish()
+            return
+        self.index += 1
+        self.status = 'question'
+        self.question_started = time.monotonic()
+        self._status_changed = self._question_changed = self._counts_changed = True
+
+    def finish(self):
+        self._close_question()
+        self._finish()
+
+    def _close_question(self):
+        if self.status != 'question':
+            return
+        correct_option = self.questions[self.index][3]
+        for user_id, (option, seconds) in self.answers.items():
+            participant = self.participants[user_id]
+            participant.answered += 1
+            if option == correct_option:
+                participant.correct += 1
+                participant.answer_time += seconds
+                self._changed_scores.add(user_id)
+        self._reveal = {'index': self.index, 'correct': correct_option}
+        self.answers = {}
+
+    def _finish(self):
+        if self.status != 'finished':
+            self.status = 'finished'
+            self.finished_at = time.monotonic()
+            self._status_changed = True
+
+    def question_payload(self):
+        if self.status != 'question':
+            return None
+        _, statement, options, _ = self.questions[self.index]
+        return {'index': self.index, 'count': len(self.questions), 'statement': statement, 'options': options}
+
+    def leaderboard(self):
+        top = heapq.nsmallest(LEADERBOARD_SIZE, self.participants.values(), key=Participant.rank_key)
+        return [[rank, p.user_id, p.name, p.correct] for rank, p in enumerate(top, 1)]
+
+    def snapshot(self, user_id):
+        """Full state for a client that just connected"""
+        participant = self.participants.get(user_id)
+        return {
+            'seq': self.seq,
+            'code': self.code,
+            'status': self.status,
+            'question': self.question_payload(),
+            'question_count': len(self.questions),
+            'participants': len(self.participants),
+            'answered': len(self.answers),
+            'leaderboard': self.leaderboard(),
+            'you': {
+                'host': user_id == self.host_id,
+                'correct': participant.correct if participant else 0,
+                'answered': user_id in self.answers,
+            },
+        }
+
+    def frame(self):
+        """The changes since the last tick as one frame, or None"""
+        if not (self._status_changed or self._question_changed or self._counts_changed
+                or self._reveal or self._changed_scores):
+            return None
+
+        self.seq += 1
+        frame = {'seq': self.seq}
+        if self._status_changed:
+            frame['status'] = self.status
+        if self._question_changed:
+            frame['question'] = self.question_payload()
+        if self._reveal:
+            frame['reveal'] = self._reveal
+        if self._counts_changed:
+            frame['participants'] = len(self.participants)
+            frame['answered'] = len(self.answers)
+        if self._changed_scores:
+            frame['scores'] = {user_id: self.participants[user_id].correct for user_id in self._changed_scores}
+            top = self.leaderboard()
+            published = self._published_top
+            frame['leaderboard'] = [row for position, row in enumerate(top)
+                                    if position >= len(published) or published[position] != row]
+            frame['leaderboard_size'] = len(top)
+            self._published_top = top
+
+        self._status_changed = self._question_changed = self._counts_changed = False
+        self._reveal = None
+        self._changed_scores = set()
+        return frame
+
+    @property
+    def asked(self):
+        """Questions opened so far; fewer than all if the host finished early"""
+        return self.index + 1
+
+    def results(self):
+        """(user_id, correct) for everyone who answered at least once"""
+        return [(p.user_id, p.correct) for p in self.participants.values() if p.answered]
+
+def encode_event(event, payload, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(payload, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode()
+
+class LiveServer:
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.prefix = urlsplit(config.get('QUIZMASTER_LIVE_URL', '/live')).path.rstrip('/') or '/live'
+        self.tick = config.get('QUIZMASTER_LIVE_TICK', DEFAULT_TICK)
+        self.allowed_origins = set(config.get('QUIZMASTER_LIVE_ALLOWED_ORIGINS', ()))
+        self.broker = load_broker(config.get('QUIZMASTER_LIVE_BROKER'))
+        self.sessions = {}
+        self.connections = 0
+        self._saving = set()
+        self._serializer = app.session_interface.get_signing_serializer(app)
+        self._max_age = int(app.permanent_session_lifetime.total_seconds())
+
+    # Event loop
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_BODY * 4, backlog=1024)
+        self.app.logger.info('Live server listening on %s:%s%s', host, port, self.prefix)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.tick_loop())
+
+    async def tick_loop(self):
+        last_keepalive = time.monotonic()
+        while True:
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            for session in list(self.sessions.values()):
+                frame = session.frame()
+                if frame is not None:
+                    delivered = await self.broker.publish(session.channel, encode_event('tick', frame, frame['seq']))
+                    metrics.incr('live.frames')
+                    metrics.incr('live.deliveries', delivered)
+                if session.status == 'finished' and not session.saved:
+                    session.saved = True
+                    task = asyncio.create_task(self.save_results(session))
+                    self._saving.add(task)
+                    task.add_done_callback(self._saving.discard)
+                elif session.finished_at and now - session.finished_at > FINISHED_TTL_SECONDS:
+                    del self.sessions[session.code]
+
+            if now - last_keepalive > KEEPALIVE_SECONDS:
+                last_keepalive = now
+                for session in self.sessions.values():
+                    await self.broker.publish(session.channel, b': keepalive\n\n')
+            metrics.gauge('live.connections', self.connections)
+            metrics.gauge('live.sessions', len(self.sessions))
+
+    # Database work, off the event loop
+
+    def _in_app(self, fn, *args):
+        with self.app.app_context():
+            try:
+                return fn(*args)
+            finally:
+                db.session.remove()
+
+    def _load_quiz(self, quiz_id):
+        quiz = db.session.get(Quiz, quiz_id)
+        if quiz is None:
+            return None, None
+        # One draw for the whole room, so everyone gets the same questions
+        seed = question_bank.new_seed()
+        questions = question_bank.load_questions(question_bank.draw_question_ids(quiz, seed))
+        return seed, [(q.id, q.question_statement, [q.option1, q.option2, q.option3, q.option4], q.correct_option)
+                      for q in questions]
+
+    def _save_scores(self, quiz_id, seed, total, results):
+        by_shard = {}
+        for user_id, correct in results:
+            shard = sharding.shard_for(user_id) if sharding.enabled() else None
+            by_shard.setdefault(shard, []).append(Score(
+                quiz_id=quiz_id, user_id=user_id, total_scored=correct, total_questions=total, seed=seed))
+        for shard, scores in by_shard.items():
+            with sharding.on_shard(shard):
+                db.session.add_all(scores)
+                db.session.commit()
+        return len(results)
+
+    async def save_results(self, session):
+        try:
+            saved = await asyncio.to_thread(self._in_app, self._save_scores, session.quiz_id, session.seed,
+                                            session.asked, session.results())
+            metrics.incr('live.scores_saved', saved)
+        except Exception:
+            self.app.logger.exception('Saving live session %s failed', session.code)
+
+    # HTTP
+
+    def authenticate(self, headers):
+        try:
+            cookie = SimpleCookie(headers.get('cookie', ''))
+        except CookieError:
+            return None
+        morsel = cookie.get(self.app.config['SESSION_COOKIE_NAME'])
+        if morsel is None:
+            return None
+        try:
+            data = self._serializer.loads(morsel.value, max_age=self._max_age)
+        except BadSignature:
+            return None
+        return data if 'user_id' in data else None
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, headers, form = await asyncio.wait_for(self.read_request(reader), HEADER_TIMEOUT)
+        except LiveError as e:
+            await self.respond(writer, e.status, {'error': str(e)})
+            return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError, UnicodeDecodeError):
+            writer.close()
+            return
+
+        cors = self.cors_headers(headers)
+        try:
+            if method == 'OPTIONS':
+                await self.respond(writer, 204, None, cors)
+                return
+            result = await self.route(method, path, headers, form, reader, writer, cors)
+            if result is not None:
+                await self.respond(writer, *result, cors)
+        except LiveError as e:
+            await self.respond(writer, e.status, {'error': str(e)}, cors)
+        except ConnectionError:
+            pass
+        except Exception:
+            self.app.logger.exception('Live request %s %s failed', method, path)
+            # An event stream has sent its headers already; just drop it
+            if not writer.is_closing():
+                with contextlib.suppress(ConnectionError):
+                    await self.respond(writer, 500, {'error': 'internal error'}, cors)
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY:
+            raise LiveError(413, 'request body too large')
+        body = await reader.readexactly(length) if length else b''
+        form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        return method.upper(), urlsplit(target).path, headers, form
+
+    def cors_headers(self, headers):
+        origin = headers.get('origin')
+        if origin and origin in self.allowed_origins:
+            return {'Access-Control-Allow-Origin': origin, 'Access-Control-Allow-Credentials': 'true',
+                    'Access-Control-Allow-Methods': 'GET, POST', 'Vary': 'Origin'}
+        return {}
+
+    async def respond(self, writer, status, payload, extra_headers=None):
+        body = b'' if payload is None else json.dumps(payload, separators=(',', ':')).encode()
+        head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}', 'Connection: close',
+                f'Content-Length: {len(body)}', 'Cache-Control: no-store']
+        if payload is not None:
+            head.append('Content-Type: application/json')
+        head += [f'{name}: {value}' for name, value in (extra_headers or {}).items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, form, reader, writer, cors):
+        if not path.startswith(self.prefix + '/'):
+            raise LiveError(404, 'not found')
+        parts = path[len(self.prefix) + 1:].strip('/').split('/')
+
+        if parts == ['healthz']:
+            return 200, {'sessions': len(self.sessions), 'connections': self.connections}
+
+        user = self.authenticate(headers)
+        if user is None:
+            raise LiveError(401, 'log in first')
+
+        if parts == ['sessions'] and method == 'POST':
+            return await self.create_session(user, form)
+        if len(parts) != 2:
+            raise LiveError(404, 'not found')
+
+        session = self.sessions.get(parts[0].upper())
+        if session is None:
+            raise LiveError(404, 'no such live session')
+        action = parts[1]
+
+        if action == 'events' and method == 'GET':
+            await self.stream(session, user, reader, writer, cors)
+            return None
+        if method != 'POST':
+            raise LiveError(405, 'method not allowed')
+        if action == 'answers':
+            if user.get('is_admin'):
+                raise LiveError(403, 'hosts do not answer')
+            try:
+                index, option = int(form.get('index', '')), int(form.get('option', ''))
+            except ValueError:
+                raise LiveError(400, 'index and option are required')
+            session.join(user['user_id'], user.get('full_name') or user.get('username'))
+            session.answer(user['user_id'], index, option)
+            metrics.incr('live.answers')
+            return 202, {'accepted': True}
+        if action in ('advance', 'finish'):
+            if user['user_id'] != session.host_id:
+                raise LiveError(403, 'only the host can do that')
+            if action == 'advance':
+                session.advance()
+            else:
+                session.finish()
+            return 200, {'status': session.status, 'index': session.index}
+        raise LiveError(404, 'not found')
+
+    async def create_session(self, user, form):
+        if not user.get('is_admin'):
+            raise LiveError(403, 'only admins can host')
+        try:
+            quiz_id = int(form.get('quiz_id', ''))
+        except ValueError:
+            raise LiveError(400, 'quiz_id is required')
+
+        seed, questions = await asyncio.to_thread(self._in_app, self._load_quiz, quiz_id)
+        if questions is None:
+            raise LiveError(404, 'quiz not found')
+        if not questions:
+            raise LiveError(409, 'this quiz has no questions yet')
+
+        code = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+        while code in self.sessions:
+            code = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+        self.sessions[code] = LiveSession(code, quiz_id, user['user_id'], seed, questions)
+        metrics.incr('live.sessions_created')
+        return 201, {'code': code}
+
+    async def stream(self, session, user, reader, writer, cors):
+        if not user.get('is_admin'):
+            session.join(user['user_id'], user.get('full_name') or user.get('username'))
+
+        head = ['HTTP/1.1 200 OK', 'Content-Type: text/event-stream', 'Cache-Control: no-store',
+                'Connection: keep-alive', 'X-Accel-Buffering: no']
+        head += [f'{name}: {value}' for name, value in cors.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        writer.write(b'retry: 2000\n\n' + encode_event('state', session.snapshot(user['user_id']), session.seq))
+        transport = writer.transport
+
+        def deliver(message):
+            if transport.is_closing():
+                self.broker.unsubscribe(session.channel, deliver)
+            elif transport.get_write_buffer_size() > MAX_SEND_BUFFER:
+                # Too far behind; reconnecting gets a fresh snapshot
+                metrics.incr('live.slow_clients_dropped')
+                self.broker.unsubscribe(session.channel, deliver)
+                transport.close()
+            else:
+                transport.write(message)
+
+        self.broker.subscribe(session.channel, deliver)
+        self.connections += 1
+        try:
+            # Nothing more is read from an SSE client; this returns on disconnect
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            self.broker.unsubscribe(session.channel, deliver)
+            writer.close()
+
+def serve(app, bind=None):
+    """Run the live server until interrupted"""
+    host, _, port = (bind or app.config.get('QUIZMASTER_LIVE_BIND', DEFAULT_BIND)).rpartition(':')
+    try:
+        asyncio.run(LiveServer(app).serve(host or '0.0.0.0', int(port)))
+    except KeyboardInterrupt:
+        pass
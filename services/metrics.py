@@ -0,0 +1,49 @@
+"""
+In-process metrics.
+
+Counters and timings are kept per process (each Gunicorn worker has its
+own) and exposed as JSON at /admin/metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_gauges = {}
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+def observe(name, seconds):
+    """Record one duration sample under name"""
+    with _lock:
+        count, total, worst = _timings.get(name, (0, 0.0, 0.0))
+        _timings[name] = (count + 1, total + seconds, max(worst, seconds))
+
+@contextmanager
+def timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': {
+                name: {'count': count, 'total': round(total, 6),
+                       'avg': round(total / count, 6) if count else 0, 'max': round(worst, 6)}
+                for name, (count, total, worst) in _timings.items()
+            }
+        }
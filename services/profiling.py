@@ -0,0 +1,279 @@
+"""
+Opt-in request profiling for production.
+
+With QUIZMASTER_PROFILING=1 every worker checks each request against the
+capture rules: a random sample (QUIZMASTER_PROFILE_SAMPLE_RATE, or the
+rate an admin armed), plus every request to an armed endpoint/path or
+from an armed user id. A chosen request is profiled from before_request
+to teardown, so view code, ORM hydration and Jinja rendering are all
+included, with either
+
+    cprofile  deterministic cProfile, written as a .prof pstats file
+    sample    a thread sampling the request's stack every few ms, written
+              as collapsed stacks (.collapsed, for flamegraph tools)
+
+Files go to QUIZMASTER_PROFILE_DIR (default instance/profiles) and only
+the newest QUIZMASTER_PROFILE_KEEP are kept. Admins arm and disarm
+capture from /admin/profiling; the rules live in a file in the same
+directory so that every worker process on the host picks them up. At most
+one request per process is profiled at a time.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import current_app, g, request, session
+from services import metrics
+
+MODES = ('cprofile', 'sample')
+DEFAULT_KEEP = 200
+DEFAULT_ARM_MINUTES = 15
+SAMPLE_INTERVAL = 0.005
+RULES_FILE = 'armed.json'
+RULES_CHECK_SECONDS = 1.0
+FILENAME = re.compile(
+    r'^(?P<stamp>\d{8}T\d{6}\.\d{3})-p(?P<pid>\d+)-(?P<endpoint>[\w.]+)-u(?P<user>\d+|none)'
+    r'-(?P<ms>\d+)ms\.(?P<ext>prof|collapsed)$')
+
+_busy = threading.Lock()
+_rules_cache = {'checked': 0.0, 'mtime': None, 'rules': None}
+
+class Capture:
+    """A finished profile file, parsed from its name"""
+    __slots__ = ('filename', 'taken_at', 'pid', 'endpoint', 'user_id', 'duration_ms', 'kind', 'size')
+
+    def __init__(self, filename, match, size):
+        self.filename = filename
+        self.taken_at = datetime.strptime(match['stamp'], '%Y%m%dT%H%M%S.%f')
+        self.pid = int(match['pid'])
+        self.endpoint = match['endpoint']
+        self.user_id = None if match['user'] == 'none' else int(match['user'])
+        self.duration_ms = int(match['ms'])
+        self.kind = 'cprofile' if match['ext'] == 'prof' else 'sample'
+        self.size = size
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer into collapsed stacks"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='profile-sampler')
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+def profile_dir(app=None):
+    app = app or current_app
+    return app.config.get('QUIZMASTER_PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+def init_profiling(app):
+    """Install the request hooks when QUIZMASTER_PROFILING is on"""
+    if not app.config.get('QUIZMASTER_PROFILING'):
+        return
+    os.makedirs(profile_dir(app), exist_ok=True)
+    app.before_request(_start)
+    app.teardown_request(_finish)
+
+# Capture rules
+
+def armed_rules():
+    """The armed rules, or None; re-read from disk at most once a second"""
+    now = time.monotonic()
+    if now - _rules_cache['checked'] < RULES_CHECK_SECONDS:
+        rules = _rules_cache['rules']
+    else:
+        _rules_cache['checked'] = now
+        path = os.path.join(profile_dir(), RULES_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != _rules_cache['mtime']:
+            _rules_cache['mtime'] = mtime
+            _rules_cache['rules'] = _read_rules(path) if mtime else None
+        rules = _rules_cache['rules']
+    if rules and rules['expires_at'] < time.time():
+        return None
+    return rules
+
+def _read_rules(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def arm(mode='cprofile', sample_rate=0.0, route=None, user_id=None, minutes=DEFAULT_ARM_MINUTES):
+    """Start capturing in every worker for the next `minutes` minutes"""
+    if mode not in MODES:
+        raise ValueError(f'unknown profiler {mode!r}')
+    if not 0 <= sample_rate <= 1:
+        raise ValueError('sample rate must be between 0 and 1')
+    if minutes <= 0:
+        raise ValueError('must be armed for at least a minute')
+    rules = {
+        'mode': mode,
+        'sample_rate': sample_rate,
+        'route': route or None,
+        'user_id': user_id,
+        'expires_at': time.time() + minutes * 60,
+    }
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    # Write then rename, so no worker ever reads half a file
+    tmp = os.path.join(directory, f'.{RULES_FILE}.{os.getpid()}')
+    with open(tmp, 'w') as f:
+        json.dump(rules, f)
+    os.replace(tmp, os.path.join(directory, RULES_FILE))
+    _rules_cache['checked'] = 0.0
+    return rules
+
+def disarm():
+    try:
+        os.remove(os.path.join(profile_dir(), RULES_FILE))
+    except FileNotFoundError:
+        pass
+    _rules_cache['checked'] = 0.0
+
+def _matches(rules):
+    route = rules.get('route')
+    if route:
+        if route.startswith('/') and request.path.startswith(route):
+            return True
+        if request.endpoint == route:
+            return True
+    if rules.get('user_id') is not None and session.get('user_id') == rules['user_id']:
+        return True
+    return random.random() < rules.get('sample_rate', 0)
+
+def _selected_mode():
+    rules = armed_rules()
+    if rules is not None:
+        return rules['mode'] if _matches(rules) else None
+    rate = current_app.config.get('QUIZMASTER_PROFILE_SAMPLE_RATE', 0)
+    return current_app.config.get('QUIZMASTER_PROFILE_MODE', 'cprofile') if random.random() < rate else None
+
+# Request hooks
+
+def _start():
+    if request.endpoint == 'static':
+        return
+    mode = _selected_mode()
+    if mode is None or not _busy.acquire(blocking=False):
+        return
+
+    if mode == 'sample':
+        profiler = StackSampler(threading.get_ident())
+    else:
+        profiler = cProfile.Profile()
+    g._profile = (mode, profiler, time.perf_counter())
+    if mode == 'sample':
+        profiler.start()
+    else:
+        profiler.enable()
+
+def _finish(exc):
+    state = g.pop('_profile', None)
+    if state is None:
+        return
+    mode, profiler, started = state
+    try:
+        if mode == 'sample':
+            profiler.stop()
+        else:
+            profiler.disable()
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        _write(mode, profiler, elapsed_ms)
+    finally:
+        _busy.release()
+
+def _write(mode, profiler, elapsed_ms):
+    directory = profile_dir()
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f')[:-3]
+    endpoint = re.sub(r'[^\w.]', '_', request.endpoint or 'unmatched')
+    user = session.get('user_id') or 'none'
+    ext = 'collapsed' if mode == 'sample' else 'prof'
+    path = os.path.join(directory, f'{stamp}-p{os.getpid()}-{endpoint}-u{user}-{elapsed_ms}ms.{ext}')
+    try:
+        if mode == 'sample':
+            profiler.dump(path)
+        else:
+            profiler.dump_stats(path)
+        _rotate(directory, current_app.config.get('QUIZMASTER_PROFILE_KEEP', DEFAULT_KEEP))
+    except OSError:
+        current_app.logger.exception('Could not write profile %s', path)
+        return
+    metrics.incr('profiling.captures')
+
+def _rotate(directory, keep):
+    names = sorted(name for name in os.listdir(directory) if FILENAME.match(name))
+    for name in names[:len(names) - keep]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass  # another worker got there first
+
+# Reading captures
+
+def captures():
+    """All captures on disk, newest first"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = FILENAME.match(name)
+        if match:
+            try:
+                size = os.path.getsize(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            found.append(Capture(name, match, size))
+    found.sort(key=lambda capture: capture.filename, reverse=True)
+    return found
+
+def capture_path(filename):
+    """Absolute path of a capture, or None if the name is not one of ours"""
+    if not FILENAME.match(filename):
+        return None
+    path = os.path.join(profile_dir(), filename)
+    return path if os.path.isfile(path) else None
+
+def summary(path, limit=40, sort='cumulative'):
+    """Text table of the top functions of a .prof file"""
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,50 @@
+"""
+Publish/subscribe for the live quiz server.
+
+LocalBroker delivers messages to callbacks in the same process and event
+loop, which is all a single live server needs. The broker is chosen with
+QUIZMASTER_LIVE_BROKER ('module:Class'), so a networked broker can stand
+in for it (e.g. to spread subscribers over several live processes) as
+long as it offers the same three methods:
+
+    subscribe(channel, callback)    callback(message) for every message
+    unsubscribe(channel, callback)
+    await publish(channel, message) message is bytes; returns receivers
+"""
+
+import importlib
+from collections import defaultdict
+
+DEFAULT_BROKER = 'services.pubsub:LocalBroker'
+
+class LocalBroker:
+    """In-process pub/sub; callbacks run synchronously on publish"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel, callback):
+        self._subscribers[channel].add(callback)
+
+    def unsubscribe(self, channel, callback):
+        subscribers = self._subscribers.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(callback)
+        if not subscribers:
+            del self._subscribers[channel]
+
+    def subscriber_count(self, channel):
+        return len(self._subscribers.get(channel, ()))
+
+    async def publish(self, channel, message):
+        # Copy: callbacks may unsubscribe themselves (e.g. a dead client)
+        subscribers = list(self._subscribers.get(channel, ()))
+        for callback in subscribers:
+            callback(message)
+        return len(subscribers)
+
+def load_broker(path=None):
+    """Instantiate the broker class named by 'module:Class'"""
+    module_name, _, class_name = (path or DEFAULT_BROKER).partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -0,0 +1,239 @@
+"""
+Chapter question banks and per-attempt question draws.
+
+Each worker caches, per chapter, the sorted ids of the bank's questions as
+compact arrays (one for the whole bank and one per tag). The cache entry
+is tagged with the chapter's bank_version and rebuilt only when an admin
+changes the bank. A draw is then random.Random(seed).sample() over index
+ranges, which is O(k) for k questions however large the bank is, followed
+by a primary-key fetch of just those k rows.
+
+An attempt keeps only its seed and draw version (the bank_version it drew
+from). The first draw from a version stores the bank's id arrays as a
+bank_snapshot row, so grading redraws the very same questions from the
+seed after the bank has changed; ones deleted since come back as None.
+Snapshots older than the API's attempt lifetime are pruned as newer ones
+are written. Fixed quizzes only ever gain questions, so their draw
+version is simply the highest question id drawn.
+"""
+
+import json
+import random
+import secrets
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db
+from models.bank_snapshot import BankSnapshot
+from models.chapter import Chapter
+from models.question import Question
+
+SEED_BITS = 31
+CACHE_SIZE = 128  # banks (chapter and version) kept per worker
+DEFAULT_SNAPSHOT_MAX_AGE = 7 * 24 * 3600  # as long as an API attempt lives
+
+_cache = OrderedDict()  # (chapter_id, bank_version) -> strata
+_cache_lock = threading.Lock()
+
+class DrawUnavailable(Exception):
+    """An attempt's draw can no longer be rebuilt (its bank snapshot is gone)"""
+
+def new_seed():
+    return secrets.randbits(SEED_BITS)
+
+def bump_bank_version(chapter_id):
+    """Invalidate every worker's cached id arrays for this chapter's bank"""
+    db.session.execute(
+        update(Chapter).where(Chapter.id == chapter_id)
+        .values(bank_version=Chapter.bank_version + 1)
+    )
+
+def parse_quotas(text):
+    """Parse 'tag:count, tag:count' into a dict, or None if blank.
+
+    Raises ValueError on malformed input.
+    """
+    if not text or not text.strip():
+        return None
+
+    quotas = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        tag, _, count = part.partition(':')
+        tag, count = tag.strip(), int(count)
+        if not tag or count < 1:
+            raise ValueError(part)
+        quotas[tag] = count
+    return quotas or None
+
+def format_quotas(quiz):
+    quotas = quiz.draw_quotas or {}
+    return ', '.join(f'{tag}:{count}' for tag, count in quotas.items())
+
+def bank_ids(chapter, version=None):
+    """{None: all ids, tag: ids with that tag} for the chapter's bank as of
+    version (default: the current bank_version), cached.
+
+    Raises DrawUnavailable for a version without a snapshot.
+    """
+    current = version is None
+    version = chapter.bank_version if current else version
+    strata = _cached(chapter.id, version)
+    if strata is not None:
+        return strata
+
+    strata = _load_snapshot(chapter.id, version)
+    if strata is None:
+        if not current:
+            raise DrawUnavailable(f'bank version {version} of chapter {chapter.id} is gone')
+        strata = _snapshot(chapter)
+        version = chapter.bank_version
+    _remember((chapter.id, version), strata)
+    return strata
+
+def _cached(chapter_id, version):
+    with _cache_lock:
+        strata = _cache.get((chapter_id, version))
+        if strata is not None:
+            _cache.move_to_end((chapter_id, version))
+        return strata
+
+def _remember(key, strata):
+    with _cache_lock:
+        _cache[key] = strata
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def _load_snapshot(chapter_id, version):
+    payload = db.session.execute(
+        select(BankSnapshot.payload).where(BankSnapshot.chapter_id == chapter_id, BankSnapshot.version == version)
+    ).scalar()
+    if payload is None:
+        return None
+    stored = json.loads(zlib.decompress(payload))
+    return {tag or None: array('q', ids) for tag, ids in stored.items()}
+
+def _snapshot(chapter):
+    """Read the current bank and store it as the snapshot of its version.
+
+    chapter.bank_version is brought up to date if the bank changed since
+    the chapter was loaded, so it names the version of what is returned.
+    """
+    while True:
+        strata = {None: array('q')}
+        rows = db.session.execute(
+            select(Question.id, Question.tag)
+            .where(Question.chapter_id == chapter.id, Question.quiz_id.is_(None))
+            .order_by(Question.id)
+        )
+        for question_id, tag in rows:
+            strata[None].append(question_id)
+            if tag:
+                strata.setdefault(tag, array('q')).append(question_id)
+
+        # A bank edit commits its questions and version bump together, so
+        # an unchanged version after the read means the ids are that version's
+        version = db.session.execute(select(Chapter.bank_version).where(Chapter.id == chapter.id)).scalar()
+        if version == chapter.bank_version:
+            break
+        db.session.refresh(chapter, ['bank_version'])
+
+    payload = zlib.compress(json.dumps({tag or '': ids.tolist() for tag, ids in strata.items()}).encode(), 9)
+    max_age = current_app.config.get('QUIZMASTER_API_ATTEMPT_MAX_AGE', DEFAULT_SNAPSHOT_MAX_AGE)
+    # In its own transaction, leaving the caller's session alone
+    try:
+        with db.engines[None].begin() as connection:
+            connection.execute(insert(BankSnapshot).values(chapter_id=chapter.id, version=version, payload=payload,
+                                                           created_at=datetime.utcnow()))
+            connection.execute(delete(BankSnapshot).where(
+                BankSnapshot.chapter_id == chapter.id, BankSnapshot.version < version,
+                BankSnapshot.created_at < datetime.utcnow() - timedelta(seconds=max_age)))
+    except IntegrityError:
+        pass  # another worker stored it first
+    return strata
+
+def bank_size(chapter):
+    return len(bank_ids(chapter)[None])
+
+def shortfall(quiz, chapter):
+    """Why chapter's bank cannot serve quiz's full draw, or None if it can"""
+    strata = bank_ids(chapter)
+    if len(strata[None]) < quiz.draw_count:
+        return f'the bank has {len(strata[None])} questions and the quiz draws {quiz.draw_count}'
+    short = sorted(tag for tag, count in (quiz.draw_quotas or {}).items() if len(strata.get(tag, ())) < count)
+    if short:
+        return f'the bank has too few questions tagged {", ".join(short)}'
+    return None
+
+def draw(quiz, seed):
+    """A new attempt's question ids, as (draw version, ids); the version
+    and seed are all draw_question_ids needs to give the same ids again"""
+    ids = draw_question_ids(quiz, seed)
+    return (quiz.chapter.bank_version if quiz.is_bank_draw else max(ids, default=0)), ids
+
+def draw_question_ids(quiz, seed, version=None):
+    """The ordered question ids a given attempt sees.
+
+    Bank quizzes sample draw_count ids (per-tag quotas first, the rest
+    from the whole bank); fixed quizzes shuffle their own questions.
+    version, from draw(), redraws an earlier attempt as it was; deleted
+    questions keep their place. Raises DrawUnavailable if it cannot be.
+    """
+    rng = random.Random(seed)
+
+    if not quiz.is_bank_draw:
+        query = select(Question.id).where(Question.quiz_id == quiz.id).order_by(Question.id)
+        if version is not None:
+            query = query.where(Question.id <= version)
+        ids = list(db.session.execute(query).scalars())
+        rng.shuffle(ids)
+        return ids
+
+    strata = bank_ids(quiz.chapter, version)
+    everything = strata[None]
+    wanted = min(quiz.draw_count, len(everything))
+
+    drawn = []
+    for tag, count in sorted((quiz.draw_quotas or {}).items()):
+        ids = strata.get(tag, ())
+        for index in rng.sample(range(len(ids)), min(count, len(ids), wanted - len(drawn))):
+            drawn.append(ids[index])
+
+    # Top up from the whole bank, skipping ids a quota already took.
+    # Rejection sampling stays O(k) while the draw is a small part of the
+    # bank; past half of it, sampling the leftovers directly is cheaper.
+    chosen = set(drawn)
+    if wanted - len(drawn) > len(everything) // 2:
+        leftovers = [question_id for question_id in everything if question_id not in chosen]
+        drawn += rng.sample(leftovers, wanted - len(drawn))
+    while len(drawn) < wanted:
+        question_id = everything[rng.randrange(len(everything))]
+        if question_id not in chosen:
+            chosen.add(question_id)
+            drawn.append(question_id)
+
+    rng.shuffle(drawn)
+    return drawn
+
+def load_questions(question_ids):
+    """Fetch questions by id, in the given order"""
+    if not question_ids:
+        return []
+    by_id = {q.id: q for q in Question.query.filter(Question.id.in_(question_ids))}
+    return [by_id[question_id] for question_id in question_ids if question_id in by_id]
+
+def load_drawn(question_ids):
+    """The questions of a stored draw, aligned with question_ids; None
+    stands for a question deleted since the attempt started"""
+    by_id = {q.id: q for q in Question.query.filter(Question.id.in_(question_ids))} if question_ids else {}
+    return [by_id.get(question_id) for question_id in question_ids]
+
+def quotas_to_json(quotas):
+    return json.dumps(quotas) if quotas else None
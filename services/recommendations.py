@@ -0,0 +1,255 @@
+"""
+Recommended practice: each student's weakest chapters.
+
+For every (user, chapter) pair with attempts, chapter_recommendation keeps
+the questions scored and asked with each attempt weighted by its age
+(halving every QUIZMASTER_RECOMMEND_HALF_LIFE_DAYS days before the latest
+attempt), the resulting weakness (1 - weighted accuracy) and which quizzes
+were attempted. A Score mapper event folds every new attempt into its row
+in the submission's transaction; rebuild() recomputes the table from
+the score table a batch of users at a time, vectorized with NumPy
+(plain Python if it is missing). Archived attempts are older than any
+weight that still matters and are left out.
+
+The dashboard panel reads a user's rows with a single primary-key lookup
+and ranks them against the in-memory catalog, so chapters and quizzes not
+yet attempted are suggested without a query either.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy import inspect as sa_inspect
+from models import db
+from models.quiz import Quiz
+from models.score import Score
+from models.recommendation import ChapterRecommendation
+from services import catalog, jobs, metrics, sharding
+
+try:
+    import numpy as np
+except ImportError:  # optional; rebuild() falls back to plain Python
+    np = None
+
+DEFAULT_HALF_LIFE_DAYS = 30
+UNTRIED_WEIGHT = 0.25  # added for a chapter whose quizzes are all untried
+UNSEEN_WEAKNESS = 0.4  # assumed for chapters the student never attempted
+REBUILD_BATCH_USERS = 500
+EPOCH = datetime(1970, 1, 1)
+
+class Recommendation:
+    """A chapter to practice, with the quiz to take next (None: retake any)"""
+    __slots__ = ('chapter', 'priority', 'accuracy', 'attempts', 'quiz')
+
+    def __init__(self, chapter, priority, accuracy, attempts, quiz):
+        self.chapter = chapter
+        self.priority = priority
+        self.accuracy = accuracy
+        self.attempts = attempts
+        self.quiz = quiz
+
+def half_life_seconds():
+    days = current_app.config.get('QUIZMASTER_RECOMMEND_HALF_LIFE_DAYS', DEFAULT_HALF_LIFE_DAYS)
+    return days * 86400
+
+def _to_seconds(moment):
+    return (moment - EPOCH).total_seconds()
+
+def _weakness(scored, questions):
+    return 1 - scored / questions if questions else 0
+
+def init_recommendations():
+    """Attach the incremental maintenance listener (safe to call more than once)"""
+    if not event.contains(Score, 'after_insert', _score_inserted):
+        event.listen(Score, 'after_insert', _score_inserted)
+
+# Incremental maintenance
+
+def _score_inserted(mapper, connection, target):
+    chapter_id = connection.execute(select(Quiz.chapter_id).where(Quiz.id == target.quiz_id)).scalar()
+    if chapter_id is None:
+        return
+
+    table = ChapterRecommendation.__table__
+    key = (table.c.user_id == target.user_id) & (table.c.chapter_id == chapter_id)
+    attempted_at = target.time_stamp_of_attempt or datetime.utcnow()
+    row = connection.execute(select(table).where(key)).first()
+    if row is None:
+        connection.execute(insert(table).values(
+            user_id=target.user_id,
+            chapter_id=chapter_id,
+            attempts=1,
+            weighted_scored=target.total_scored,
+            weighted_questions=target.total_questions,
+            last_attempt=attempted_at,
+            quiz_ids=str(target.quiz_id),
+            weakness=_weakness(target.total_scored, target.total_questions),
+        ))
+        return
+
+    # Re-weight both sides to the later of the two times (offline API
+    # submissions can arrive out of order)
+    latest = max(row.last_attempt, attempted_at)
+    half_life = half_life_seconds()
+    old_weight = 2 ** (-(latest - row.last_attempt).total_seconds() / half_life)
+    new_weight = 2 ** (-(latest - attempted_at).total_seconds() / half_life)
+    scored = row.weighted_scored * old_weight + target.total_scored * new_weight
+    questions = row.weighted_questions * old_weight + target.total_questions * new_weight
+
+    quiz_ids = {int(quiz_id) for quiz_id in row.quiz_ids.split(',') if quiz_id} | {target.quiz_id}
+    connection.execute(update(table).where(key).values(
+        attempts=row.attempts + 1,
+        weighted_scored=scored,
+        weighted_questions=questions,
+        last_attempt=latest,
+        quiz_ids=','.join(map(str, sorted(quiz_ids))),
+        weakness=_weakness(scored, questions),
+    ))
+
+# Batch rebuild
+
+def rebuild(progress=None):
+    """Recompute every row from the score table; returns rows written.
+
+    progress, if given, is called as progress(shards_done, shard_count).
+    """
+    half_life = half_life_seconds()
+    aggregate = _aggregate_numpy if np is not None else _aggregate_python
+    written = 0
+    shards = sharding.shards()
+    for done, shard in enumerate(shards):
+        with sharding.on_shard(shard):
+            user_ids = sorted(
+                set(db.session.execute(select(Score.user_id).distinct()).scalars())
+                | set(db.session.execute(select(ChapterRecommendation.user_id).distinct()).scalars())
+            )
+            for start in range(0, len(user_ids), REBUILD_BATCH_USERS):
+                written += _rebuild_users(user_ids[start:start + REBUILD_BATCH_USERS], half_life, aggregate)
+        if progress:
+            progress(done + 1, len(shards))
+    return written
+
+def _rebuild_users(user_ids, half_life, aggregate):
+    """Recompute the rows of some users in one write transaction.
+
+    The write lock is taken before the scores are read, so a submission
+    arriving meanwhile (and its incremental update) waits until the
+    rebuilt rows are committed and then applies on top of them.
+    """
+    connection = db.session.connection(bind_arguments={'mapper': sa_inspect(ChapterRecommendation)})
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+    db.session.execute(delete(ChapterRecommendation).where(ChapterRecommendation.user_id.in_(user_ids)))
+    rows = db.session.execute(
+        select(Score.user_id, Quiz.chapter_id, Score.quiz_id, Score.time_stamp_of_attempt,
+               Score.total_scored, Score.total_questions)
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .where(Score.user_id.in_(user_ids))
+    ).all()
+    with metrics.timed('recommendations.rebuild'):
+        records = aggregate(rows, half_life) if rows else []
+    if records:
+        db.session.execute(insert(ChapterRecommendation), records)
+    db.session.commit()
+    return len(records)
+
+def _record(user_id, chapter_id, attempts, scored, questions, last_seconds, quiz_ids):
+    return {
+        'user_id': user_id,
+        'chapter_id': chapter_id,
+        'attempts': attempts,
+        'weighted_scored': scored,
+        'weighted_questions': questions,
+        'last_attempt': EPOCH + timedelta(seconds=last_seconds),
+        'quiz_ids': ','.join(map(str, quiz_ids)),
+        'weakness': _weakness(scored, questions),
+    }
+
+def _aggregate_numpy(rows, half_life):
+    count = len(rows)
+    users = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    chapters = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+    quizzes = np.fromiter((row[2] for row in rows), dtype=np.int64, count=count)
+    seconds = np.fromiter((_to_seconds(row[3]) for row in rows), dtype=np.float64, count=count)
+    scored = np.fromiter((row[4] for row in rows), dtype=np.float64, count=count)
+    asked = np.fromiter((row[5] for row in rows), dtype=np.float64, count=count)
+
+    # One group per (user, chapter)
+    base = int(chapters.max()) + 1
+    keys, group = np.unique(users * base + chapters, return_inverse=True)
+    last = np.full(len(keys), -np.inf)
+    np.maximum.at(last, group, seconds)
+    weights = np.exp2((seconds - last[group]) / half_life)
+
+    attempts = np.bincount(group, minlength=len(keys))
+    weighted_scored = np.bincount(group, weights=weights * scored, minlength=len(keys))
+    weighted_asked = np.bincount(group, weights=weights * asked, minlength=len(keys))
+
+    # Distinct quizzes per group, split into one run per group
+    pairs = np.unique(np.stack([group, quizzes], axis=1), axis=0)
+    runs = np.split(pairs[:, 1], np.flatnonzero(np.diff(pairs[:, 0])) + 1)
+
+    return [
+        _record(int(key // base), int(key % base), int(attempts[index]), float(weighted_scored[index]),
+                float(weighted_asked[index]), float(last[index]), runs[index].tolist())
+        for index, key in enumerate(keys)
+    ]
+
+def _aggregate_python(rows, half_life):
+    last = {}
+    for user_id, chapter_id, _, attempted_at, _, _ in rows:
+        moment = _to_seconds(attempted_at)
+        if moment > last.get((user_id, chapter_id), float('-inf')):
+            last[(user_id, chapter_id)] = moment
+
+    groups = {}
+    for user_id, chapter_id, quiz_id, attempted_at, scored, asked in rows:
+        key = (user_id, chapter_id)
+        weight = 2 ** ((_to_seconds(attempted_at) - last[key]) / half_life)
+        group = groups.setdefault(key, [0, 0.0, 0.0, set()])
+        group[0] += 1
+        group[1] += weight * scored
+        group[2] += weight * asked
+        group[3].add(quiz_id)
+
+    return [
+        _record(user_id, chapter_id, attempts, scored, asked, last[(user_id, chapter_id)], sorted(quiz_ids))
+        for (user_id, chapter_id), (attempts, scored, asked, quiz_ids) in sorted(groups.items())
+    ]
+
+@jobs.handler('rebuild_recommendations')
+def rebuild_recommendations_job(ctx):
+    def report(done, total):
+        ctx.progress(int(done / total * 100), f'Rebuilt {done} of {total} score databases')
+
+    return {'rows_written': rebuild(progress=report)}
+
+# Reading
+
+def for_user(user_id, limit=5):
+    """The user's top chapters to practice, weakest first.
+
+    Run under the user's shard (sharding.for_user) when sharded.
+    """
+    rows = {row.chapter_id: row for row in db.session.execute(
+        select(ChapterRecommendation).where(ChapterRecommendation.user_id == user_id)
+    ).scalars()}
+
+    recommendations = []
+    for chapter in catalog.current().chapters:
+        if not chapter.quizzes:
+            continue
+        row = rows.get(chapter.id)
+        attempted = row.attempted_quiz_ids if row else set()
+        untried = [quiz for quiz in chapter.quizzes if quiz.id not in attempted]
+        weakness = row.weakness if row else UNSEEN_WEAKNESS
+        recommendations.append(Recommendation(
+            chapter,
+            priority=weakness + UNTRIED_WEIGHT * len(untried) / chapter.quiz_count,
+            accuracy=row.accuracy if row else None,
+            attempts=row.attempts if row else 0,
+            quiz=untried[0] if untried else None,
+        ))
+
+    recommendations.sort(key=lambda recommendation: -recommendation.priority)
+    return recommendations[:limit]
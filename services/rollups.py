@@ -0,0 +1,340 @@
+"""
+Daily rollups for the admin dashboard analytics.
+
+Attempt totals are kept per day at subject, chapter and quiz scope, and
+registrations per day. Both tables are bumped from mapper events in the
+same transaction as the Score/User insert, so the dashboard only ever
+reads the rollups and never scans raw history.
+
+With score sharding the score rollups live beside the scores in each
+shard (users are partitioned, so even unique-user counts simply add up)
+and the reading helpers fan out over the shards and merge.
+"""
+
+import calendar
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, delete, distinct, event, func, insert, literal, select, update
+from models import db
+from models.routing import read_only
+from models.user import User
+from models.subject import Subject
+from models.chapter import Chapter
+from models.quiz import Quiz
+from models.score import Score
+from models.rollup import DailyScoreRollup, DailyScoreRollupUser, DailyRegistrationRollup
+from services import archive, jobs, sharding
+
+SCOPES = ('subject', 'chapter', 'quiz')
+GRANULARITIES = ('day', 'week', 'month')
+
+def init_rollups():
+    """Attach the incremental maintenance listeners (safe to call more than once)"""
+    if not event.contains(Score, 'after_insert', _score_inserted):
+        event.listen(Score, 'after_insert', _score_inserted)
+    if not event.contains(User, 'after_insert', _user_inserted):
+        event.listen(User, 'after_insert', _user_inserted)
+
+# Incremental maintenance
+
+def _score_inserted(mapper, connection, target):
+    row = connection.execute(
+        select(Chapter.id, Chapter.subject_id)
+        .join(Quiz, Quiz.chapter_id == Chapter.id)
+        .where(Quiz.id == target.quiz_id)
+    ).first()
+
+    day = (target.time_stamp_of_attempt or datetime.utcnow()).date()
+    scopes = [('quiz', target.quiz_id)]
+    if row:
+        scopes += [('chapter', row.id), ('subject', row.subject_id)]
+
+    for scope, scope_id in scopes:
+        record_attempt(connection, day, scope, scope_id, target.user_id,
+                       target.total_scored, target.total_questions)
+
+def _user_inserted(mapper, connection, target):
+    if target.is_admin:
+        return
+    day = (target.created_at or datetime.utcnow()).date()
+    table = DailyRegistrationRollup.__table__
+
+    result = connection.execute(
+        update(table).where(table.c.day == day)
+        .values(registrations=table.c.registrations + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(day=day, registrations=1))
+
+def record_attempt(connection, day, scope, scope_id, user_id, scored, questions):
+    """Add one attempt to the rollup row for (day, scope, scope_id)"""
+    seen = DailyScoreRollupUser.__table__
+    new_user = 0
+    already_counted = connection.execute(
+        select(seen.c.user_id).where(and_(
+            seen.c.day == day, seen.c.scope == scope,
+            seen.c.scope_id == scope_id, seen.c.user_id == user_id))
+    ).first()
+    if not already_counted:
+        connection.execute(insert(seen).values(day=day, scope=scope, scope_id=scope_id, user_id=user_id))
+        new_user = 1
+
+    table = DailyScoreRollup.__table__
+    result = connection.execute(
+        update(table)
+        .where(and_(table.c.day == day, table.c.scope == scope, table.c.scope_id == scope_id))
+        .values(attempts=table.c.attempts + 1,
+                sum_scored=table.c.sum_scored + scored,
+                sum_questions=table.c.sum_questions + questions,
+                unique_users=table.c.unique_users + new_user,
+                updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(
+            day=day, scope=scope, scope_id=scope_id, attempts=1,
+            sum_scored=scored, sum_questions=questions,
+            unique_users=new_user, updated_at=datetime.utcnow()))
+
+# Backfill and compaction
+
+def backfill(start=None, end=None):
+    """Rebuild the rollups for [start, end] from raw Score and User rows.
+
+    Either bound may be None to extend to the start/end of history. Score
+    rollups are not rebuilt for archived days. Returns the number of
+    rollup rows written.
+    """
+    now = datetime.utcnow()
+    written = 0
+
+    # Archived attempts are gone from Score, so leave the rollups of days
+    # up to the archive horizon as they are
+    archived_before = archive.horizon()
+    score_start = start
+    if archived_before is not None and (start is None or start <= archived_before.date()):
+        score_start = archived_before.date() + timedelta(days=1)
+
+    for shard in sharding.shards():
+        with sharding.on_shard(shard):
+            written += _backfill_scores(score_start, end, now)
+            db.session.commit()
+
+    user_day = func.date(User.created_at)
+    _delete_range(DailyRegistrationRollup, start, end)
+    result = db.session.execute(insert(DailyRegistrationRollup.__table__).from_select(
+        ['day', 'registrations'],
+        select(user_day, func.count(User.id))
+        .where(User.is_admin == False, User.created_at.isnot(None),
+               *_datetime_range(User.created_at, start, end))
+        .group_by(user_day)))
+    written += result.rowcount
+
+    db.session.commit()
+    return written
+
+def _backfill_scores(start, end, now):
+    """Rebuild the score rollups of the current shard; returns rows written"""
+    today = now.date()
+    written = 0
+
+    score_day = func.date(Score.time_stamp_of_attempt)
+    score_range = _datetime_range(Score.time_stamp_of_attempt, start, end)
+    _delete_range(DailyScoreRollup, start, end)
+
+    for scope, column in (('quiz', Score.quiz_id),
+                          ('chapter', Quiz.chapter_id),
+                          ('subject', Chapter.subject_id)):
+        query = (
+            select(score_day, literal(scope), column,
+                   func.count(Score.id), func.sum(Score.total_scored),
+                   func.sum(Score.total_questions), func.count(distinct(Score.user_id)),
+                   literal(now))
+            .select_from(Score)
+            .join(Quiz, Quiz.id == Score.quiz_id)
+            .join(Chapter, Chapter.id == Quiz.chapter_id)
+            .where(*score_range)
+            .group_by(score_day, column)
+        )
+        result = db.session.execute(insert(DailyScoreRollup.__table__).from_select(
+            ['day', 'scope', 'scope_id', 'attempts', 'sum_scored',
+             'sum_questions', 'unique_users', 'updated_at'], query))
+        written += result.rowcount
+
+        # Today is still open, so reseed the unique-user markers for it
+        if (start is None or start <= today) and (end is None or end >= today):
+            db.session.execute(delete(DailyScoreRollupUser).where(
+                DailyScoreRollupUser.day == today, DailyScoreRollupUser.scope == scope))
+            db.session.execute(insert(DailyScoreRollupUser.__table__).from_select(
+                ['day', 'scope', 'scope_id', 'user_id'],
+                select(score_day, literal(scope), column, Score.user_id)
+                .select_from(Score)
+                .join(Quiz, Quiz.id == Score.quiz_id)
+                .join(Chapter, Chapter.id == Quiz.chapter_id)
+                .where(*_datetime_range(Score.time_stamp_of_attempt, today, today))
+                .distinct()))
+
+    return written
+
+def compact():
+    """Drop bookkeeping that is no longer needed.
+
+    Unique-user markers are only consulted for days that can still receive
+    attempts, and rollup rows whose subject/chapter/quiz has been deleted
+    can never be displayed. Returns the number of rows removed.
+    """
+    removed = 0
+    for shard in sharding.shards():
+        with sharding.on_shard(shard):
+            removed += db.session.execute(delete(DailyScoreRollupUser).where(
+                DailyScoreRollupUser.day < datetime.utcnow().date())).rowcount
+
+            for scope, model in (('subject', Subject), ('chapter', Chapter), ('quiz', Quiz)):
+                removed += db.session.execute(delete(DailyScoreRollup).where(
+                    DailyScoreRollup.scope == scope,
+                    DailyScoreRollup.scope_id.notin_(select(model.id)))).rowcount
+
+            db.session.commit()
+    return removed
+
+@jobs.handler('recompute_statistics')
+def recompute_statistics_job(ctx):
+    ctx.progress(0, 'Rebuilding daily rollups')
+    written = backfill()
+    ctx.progress(90, 'Compacting rollups')
+    removed = compact()
+    return {'rows_written': written, 'rows_removed': removed}
+
+def _delete_range(model, start, end):
+    conditions = []
+    if start is not None:
+        conditions.append(model.day >= start)
+    if end is not None:
+        conditions.append(model.day <= end)
+    db.session.execute(delete(model).where(*conditions))
+
+def _datetime_range(column, start, end):
+    conditions = []
+    if start is not None:
+        conditions.append(column >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        conditions.append(column < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return conditions
+
+# Reading
+
+def default_range(today=None):
+    """The dashboard's default window: the last six calendar months"""
+    today = today or datetime.utcnow().date()
+    month, year = today.month - 5, today.year
+    if month <= 0:
+        month += 12
+        year -= 1
+    return date(year, month, 1), today
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def _next_bucket(bucket, granularity):
+    if granularity == 'week':
+        return bucket + timedelta(days=7)
+    if granularity == 'month':
+        if bucket.month == 12:
+            return bucket.replace(year=bucket.year + 1, month=1)
+        return bucket.replace(month=bucket.month + 1)
+    return bucket + timedelta(days=1)
+
+def _bucket_label(bucket, granularity):
+    if granularity == 'month':
+        return f'{calendar.month_abbr[bucket.month]} {bucket.year}'
+    return bucket.isoformat()
+
+def _buckets(start, end, granularity):
+    bucket = bucket_start(start, granularity)
+    while bucket <= end:
+        yield bucket
+        bucket = _next_bucket(bucket, granularity)
+
+@read_only
+def registration_series(start, end, granularity='month'):
+    """Registrations per bucket between start and end (inclusive)"""
+    rows = db.session.query(
+        DailyRegistrationRollup.day, DailyRegistrationRollup.registrations
+    ).filter(
+        DailyRegistrationRollup.day >= start,
+        DailyRegistrationRollup.day <= end
+    ).all()
+
+    counts = defaultdict(int)
+    for day, registrations in rows:
+        counts[bucket_start(day, granularity)] += registrations
+
+    return [{'label': _bucket_label(bucket, granularity), 'count': counts[bucket]}
+            for bucket in _buckets(start, end, granularity)]
+
+@read_only
+def attempt_series(start, end, granularity='month', scope='subject', scope_id=None):
+    """Attempts and average percentage per bucket.
+
+    Without scope_id this totals every subject, i.e. all attempts.
+    """
+    totals = defaultdict(lambda: [0, 0, 0])
+    for rows in sharding.fan_out(_daily_attempts, start, end, scope, scope_id):
+        for day, attempts, scored, questions in rows:
+            bucket = totals[bucket_start(day, granularity)]
+            bucket[0] += attempts
+            bucket[1] += scored or 0
+            bucket[2] += questions or 0
+
+    series = []
+    for bucket in _buckets(start, end, granularity):
+        attempts, scored, questions = totals.get(bucket, (0, 0, 0))
+        series.append({
+            'label': _bucket_label(bucket, granularity),
+            'count': attempts,
+            'average': round(scored / questions * 100, 1) if questions else 0
+        })
+    return series
+
+@read_only
+def _daily_attempts(start, end, scope, scope_id):
+    query = db.session.query(
+        DailyScoreRollup.day,
+        func.sum(DailyScoreRollup.attempts),
+        func.sum(DailyScoreRollup.sum_scored),
+        func.sum(DailyScoreRollup.sum_questions)
+    ).filter(
+        DailyScoreRollup.scope == scope,
+        DailyScoreRollup.day >= start,
+        DailyScoreRollup.day <= end
+    )
+    if scope_id is not None:
+        query = query.filter(DailyScoreRollup.scope_id == scope_id)
+    return query.group_by(DailyScoreRollup.day).all()
+
+def attempts_by_subject(start, end):
+    """Total attempts per subject between start and end (inclusive)"""
+    totals = {}
+    for rows in sharding.fan_out(_attempts_by_subject, start, end):
+        for subject_id, name, attempts in rows:
+            label, count = totals.get(subject_id, (name, 0))
+            totals[subject_id] = (label, count + attempts)
+
+    return [{'label': label, 'count': count} for label, count in totals.values()]
+
+@read_only
+def _attempts_by_subject(start, end):
+    return db.session.query(
+        Subject.id,
+        Subject.name,
+        func.sum(DailyScoreRollup.attempts).label('attempts')
+    ).join(
+        DailyScoreRollup, and_(DailyScoreRollup.scope == 'subject',
+                               DailyScoreRollup.scope_id == Subject.id)
+    ).filter(
+        DailyScoreRollup.day >= start,
+        DailyScoreRollup.day <= end
+    ).group_by(Subject.id, Subject.name).all()
@@ -0,0 +1,344 @@
+"""
+Per-user score timelines for the progress charts.
+
+Each user's attempts are kept as a flat file of little-endian float64
+triples (attempt time in epoch seconds, percentage, quiz id) in
+QUIZMASTER_SERIES_DIR (default instance/series), so reading a history of
+any length is one memory map with NumPy (one read into an array if it is
+missing). A Score mapper event queues every new attempt and the session
+appends it once the transaction commits. A missing file is built from the
+user's hot and archived scores the first time it is read.
+
+Builds and appends of a user hold that user's lock (a thread lock plus a
+byte-range lock on series.lock, for the other workers). A build stamps
+its file with the time it read the database, so an append that finds a
+build newer than its attempts only adds the ones the build missed.
+
+Charts are served downsampled to the requested number of points with
+Largest-Triangle-Three-Buckets, which keeps the visual shape (peaks and
+dips included) of a 10k-attempt history in a few hundred points.
+Attempts at quizzes deleted since are dropped on read against the
+in-memory catalog.
+"""
+
+import os
+import sys
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from models import db
+from models.score import Score
+from models.score_archive import ScoreArchive
+from services import archive, catalog, metrics
+
+try:
+    import numpy as np
+except ImportError:  # series are read into an array instead
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; locks then only cover this process
+    fcntl = None
+
+FIELDS = 3  # time, percentage, quiz id
+RECORD_SIZE = FIELDS * 8
+DEFAULT_POINTS = 300
+MAX_POINTS = 2000
+EPOCH = datetime(1970, 1, 1)
+PENDING_KEY = 'series_pending'
+LOCK_STRIPES = 64
+
+_thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+_lock_files = {}  # (pid, path) -> fd of series.lock, kept open: closing it drops the process's locks
+_lock_files_lock = threading.Lock()
+
+def series_dir(app=None):
+    app = app or current_app
+    return app.config.get('QUIZMASTER_SERIES_DIR') or os.path.join(app.instance_path, 'series')
+
+def series_path(user_id):
+    return os.path.join(series_dir(), f'{user_id}.f64')
+
+def _lock_fd():
+    path = os.path.join(series_dir(), 'series.lock')
+    key = (os.getpid(), path)
+    with _lock_files_lock:
+        if key not in _lock_files:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _lock_files[key] = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        return _lock_files[key]
+
+@contextmanager
+def _user_lock(user_id):
+    """Hold a user's series against builds and appends in every worker"""
+    with _thread_locks[user_id % LOCK_STRIPES]:
+        if fcntl is None:
+            yield
+            return
+        fd = _lock_fd()
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, user_id)
+        try:
+            yield
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, user_id)
+
+def init_series():
+    """Attach the append listeners (safe to call more than once)"""
+    if not event.contains(Score, 'after_insert', _score_inserted):
+        event.listen(Score, 'after_insert', _score_inserted)
+    if not event.contains(db.session, 'after_commit', _flush_pending):
+        event.listen(db.session, 'after_commit', _flush_pending)
+    if not event.contains(db.session, 'after_rollback', _drop_pending):
+        event.listen(db.session, 'after_rollback', _drop_pending)
+
+def _encode(points):
+    data = array('d', (value for point in points for value in point))
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+def _point(attempted_at, scored, questions, quiz_id):
+    percentage = scored / questions * 100 if questions else 0.0
+    return ((attempted_at - EPOCH).total_seconds(), percentage, float(quiz_id))
+
+# Appending
+
+def _score_inserted(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    point = _point(target.time_stamp_of_attempt or datetime.utcnow(),
+                   target.total_scored, target.total_questions, target.quiz_id)
+    # Before the commit, so any build that can see this attempt started later
+    session.info.setdefault(PENDING_KEY, []).append((target.user_id, point, time.time()))
+
+def _drop_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+def _flush_pending(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    by_user = {}
+    for user_id, point, flushed_at in pending:
+        points, since = by_user.get(user_id, ([], flushed_at))
+        points.append(point)
+        by_user[user_id] = (points, min(since, flushed_at))
+    for user_id, (points, since) in by_user.items():
+        append(user_id, points, since)
+
+def append(user_id, points, since=None):
+    """Add committed attempts, written to the database at `since` (epoch
+    seconds) or later, to a user's series.
+
+    A user without a series file is skipped: the file is built from the
+    database, committed attempts included, when it is first read.
+    """
+    path = series_path(user_id)
+    try:
+        with _user_lock(user_id):
+            try:
+                modified = os.stat(path).st_mtime
+            except FileNotFoundError:
+                return
+            if since is None or modified >= since:
+                # Built (or appended to) since: skip what the file already has
+                written = set(_read_records(path))
+                points = [point for point in points if point not in written]
+            if not points:
+                return
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, _encode(points))
+            finally:
+                os.close(fd)
+    except OSError:
+        current_app.logger.exception('Could not append to score series %s', path)
+        return
+    metrics.incr('series.appends', len(points))
+
+# Building
+
+def build(user_id):
+    """Write a user's series from their hot and archived scores.
+
+    Run under the user's shard (sharding.for_user) when sharded.
+    """
+    with _user_lock(user_id):
+        read_at = time.time()
+        points = [_point(attempted_at, scored, questions, quiz_id) for quiz_id, attempted_at, scored, questions
+                  in db.session.execute(
+                      select(Score.quiz_id, Score.time_stamp_of_attempt, Score.total_scored, Score.total_questions)
+                      .where(Score.user_id == user_id))]
+        for payload in db.session.execute(
+                select(ScoreArchive.payload).where(ScoreArchive.user_id == user_id)).scalars():
+            points += [_point(row.time_stamp_of_attempt, row.total_scored, row.total_questions, row.quiz_id)
+                       for row in archive.decode_rows(payload, user_id)]
+        points.sort()
+
+        path = series_path(user_id)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_encode(points))
+        os.utime(tmp, (read_at, read_at))
+        os.replace(tmp, path)
+    metrics.incr('series.builds')
+    return len(points)
+
+def _read_records(path):
+    """The (time, percentage, quiz id) records of a series file"""
+    data = array('d')
+    with open(path, 'rb') as f:
+        data.frombytes(f.read())
+    del data[len(data) - len(data) % FIELDS:]  # a torn trailing record
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return list(zip(data[0::FIELDS], data[1::FIELDS], data[2::FIELDS]))
+
+def delete_user(user_id):
+    try:
+        os.remove(series_path(user_id))
+    except FileNotFoundError:
+        pass
+
+def reset():
+    """Remove every series file; each is rebuilt when next read"""
+    directory = series_dir()
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for name in os.listdir(directory):
+        if name.endswith('.f64'):
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
+
+# Reading
+
+def load(user_id):
+    """(times, percentages, quiz_ids) columns of a user's series, oldest
+    first; NumPy arrays when NumPy is installed, lists otherwise.
+
+    Run under the user's shard (sharding.for_user) when sharded.
+    """
+    path = series_path(user_id)
+    if not os.path.exists(path):
+        build(user_id)
+    count = os.path.getsize(path) // RECORD_SIZE  # ignores a torn trailing record
+
+    if np is not None:
+        if count == 0:
+            return np.empty(0), np.empty(0), np.empty(0)
+        records = np.memmap(path, dtype='<f8', mode='r', shape=(count, FIELDS))
+        if not np.all(records[1:, 0] >= records[:-1, 0]):
+            # Offline API submissions can append out of time order
+            records = records[np.argsort(records[:, 0], kind='stable')]
+        return records[:, 0], records[:, 1], records[:, 2]
+
+    records = sorted(_read_records(path), key=lambda record: record[0])
+    return [record[0] for record in records], [record[1] for record in records], [record[2] for record in records]
+
+def chart(user_id, subject_id=None, points=DEFAULT_POINTS):
+    """JSON-ready progress chart: at most `points` (time in ms, percentage,
+    quiz id) points, plus the subjects present for the subject filter.
+
+    Run under the user's shard (sharding.for_user) when sharded.
+    """
+    tree = catalog.current()
+    points = min(max(points, 3), MAX_POINTS)
+    times, percentages, quiz_ids = load(user_id)
+
+    with metrics.timed('series.chart'):
+        if np is not None:
+            live_ids = np.fromiter((quiz.id for quiz in tree.quizzes), dtype=np.float64)
+            keep = np.isin(quiz_ids, live_ids)
+            subject_of = {quiz.id: quiz.chapter.subject_id for quiz in tree.quizzes}
+            present = {subject_of[int(quiz_id)] for quiz_id in np.unique(quiz_ids[keep])}
+            if subject_id is not None:
+                wanted = [quiz.id for quiz in tree.quizzes if quiz.chapter.subject_id == subject_id]
+                keep &= np.isin(quiz_ids, np.array(wanted, dtype=np.float64))
+            times, percentages, quiz_ids = times[keep], percentages[keep], quiz_ids[keep]
+            chosen = _lttb_numpy(times, percentages, points)
+            selected = zip(times[chosen].tolist(), percentages[chosen].tolist(), quiz_ids[chosen].tolist())
+            total = len(times)
+        else:
+            subject_of = {quiz.id: quiz.chapter.subject_id for quiz in tree.quizzes}
+            rows = [(time, percentage, int(quiz_id))
+                    for time, percentage, quiz_id in zip(times, percentages, quiz_ids)
+                    if int(quiz_id) in subject_of]
+            present = {subject_of[quiz_id] for _, _, quiz_id in rows}
+            if subject_id is not None:
+                rows = [row for row in rows if subject_of[row[2]] == subject_id]
+            chosen = _lttb_python([row[0] for row in rows], [row[1] for row in rows], points)
+            selected = (rows[index] for index in chosen)
+            total = len(rows)
+
+    series = [[int(time * 1000), round(percentage, 1), int(quiz_id)] for time, percentage, quiz_id in selected]
+    labels = {}
+    for _, _, quiz_id in series:
+        if quiz_id not in labels:
+            quiz = tree.quiz(quiz_id)
+            labels[quiz_id] = f'{quiz.chapter.subject.name} - {quiz.chapter.name}'
+    return {
+        'total': total,
+        'points': series,
+        'quizzes': labels,
+        'subjects': [{'id': subject.id, 'name': subject.name} for subject in tree.subjects if subject.id in present],
+    }
+
+# Largest-Triangle-Three-Buckets
+
+def _lttb_python(xs, ys, threshold):
+    """Indexes of the points LTTB keeps (all of them if there are few)"""
+    count = len(xs)
+    if count <= threshold:
+        return list(range(count))
+
+    chosen = [0]
+    size = (count - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * size) + 1
+        end = int((bucket + 1) * size) + 1
+        # Average of the next bucket stands in for the point after this one
+        next_end = min(int((bucket + 2) * size) + 1, count)
+        span = next_end - end
+        avg_x = sum(xs[end:next_end]) / span
+        avg_y = sum(ys[end:next_end]) / span
+
+        px, py = xs[previous], ys[previous]
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((px - avg_x) * (ys[index] - py) - (px - xs[index]) * (avg_y - py))
+            if area > best_area:
+                best, best_area = index, area
+        chosen.append(best)
+        previous = best
+    chosen.append(count - 1)
+    return chosen
+
+def _lttb_numpy(xs, ys, threshold):
+    count = len(xs)
+    if count <= threshold:
+        return np.arange(count)
+
+    chosen = np.empty(threshold, dtype=np.int64)
+    chosen[0], chosen[-1] = 0, count - 1
+    edges = np.minimum((np.arange(threshold) * ((count - 2) / (threshold - 2))).astype(np.int64) + 1, count)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end, next_end = edges[bucket], edges[bucket + 1], edges[bucket + 2]
+        avg_x = xs[end:next_end].mean()
+        avg_y = ys[end:next_end].mean()
+
+        px, py = xs[previous], ys[previous]
+        areas = np.abs((px - avg_x) * (ys[start:end] - py) - (px - xs[start:end]) * (avg_y - py))
+        previous = start + int(areas.argmax())
+        chosen[bucket + 1] = previous
+    return chosen
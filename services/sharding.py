@@ -0,0 +1,113 @@
+"""
+Optional sharding of score data across several SQLite files.
+
+With QUIZMASTER_SCORE_SHARDS=N (N > 0), Score rows and the daily score
+rollups live in N files next to the primary database, chosen by a hash of
+user_id; the catalog, users and everything else stay in the primary. Each
+file has its own write lock, so submissions from users on different
+shards commit concurrently.
+
+Shard connections ATTACH the primary read-only as `catalog`, so joins from
+score tables to quizzes, chapters, subjects and users work unchanged
+inside a shard. Per-user code runs under for_user(); aggregates run once
+per shard in parallel through fan_out() and merge the results. With
+sharding off every helper here degrades to the plain primary database.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from flask import current_app
+from models import db
+from models.migrate import upgrade_schema
+from models.routing import SHARDED_TABLES, shard_bind, using_shard
+
+CATALOG_SCHEMA = 'catalog'
+
+_catalog_path = None
+
+def shard_count():
+    return current_app.config.get('QUIZMASTER_SCORE_SHARDS', 0)
+
+def enabled():
+    return shard_count() > 0
+
+def shard_binds(primary_uri, count):
+    """SQLALCHEMY_BINDS entries for `count` shards beside a SQLite primary"""
+    url = make_url(primary_uri)
+    if count <= 0:
+        return {}
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        raise ValueError('Score sharding needs a file-based SQLite primary database')
+    stem = url.database[:-3] if url.database.endswith('.db') else url.database
+    return {shard_bind(index): f'{url.drivername}:///file:{stem}_scores_{index}.db?uri=true'
+            for index in range(count)}
+
+def shard_for(user_id, count=None):
+    """The shard holding a user's scores (multiplicative hash, stable across restarts)"""
+    count = count or shard_count()
+    return (user_id * 2654435761) % 2 ** 32 % count
+
+def for_user(user_id):
+    """Context that routes queries to the user's shard; a no-op when unsharded"""
+    if not enabled():
+        return nullcontext()
+    return using_shard(shard_for(user_id))
+
+def shards():
+    """Shard indexes for sequential per-shard work ([None] when unsharded)"""
+    return list(range(shard_count())) or [None]
+
+def on_shard(index):
+    """Context that routes queries to a shard from shards()"""
+    return nullcontext() if index is None else using_shard(index)
+
+def fan_out(fn, *args, **kwargs):
+    """Run fn once per shard, in parallel, and return the list of results.
+
+    Each call gets its own app context and session, routed to its shard.
+    Unsharded, fn simply runs once in the caller's context.
+    """
+    if not enabled():
+        return [fn(*args, **kwargs)]
+
+    app = current_app._get_current_object()
+
+    def run(index):
+        with app.app_context(), using_shard(index):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=shard_count(), thread_name_prefix='shard') as executor:
+        return list(executor.map(run, range(shard_count())))
+
+def init_sharding():
+    """Create and upgrade the sharded tables in every shard file.
+
+    Call inside an app context after the primary schema is in place.
+    """
+    global _catalog_path
+    if not enabled():
+        return
+
+    _catalog_path = db.engines[None].url.database
+    tables = [db.metadata.tables[name] for name in SHARDED_TABLES]
+    for index in range(shard_count()):
+        engine = db.engines[shard_bind(index)]
+        if not event.contains(engine, 'connect', _shard_pragmas):
+            event.listen(engine, 'connect', _shard_pragmas)
+            engine.dispose()  # connections opened earlier lack the attach
+        db.metadata.create_all(engine, tables=tables)
+        upgrade_schema(engine, tables)
+
+def _shard_pragmas(dbapi_connection, connection_record):
+    # No foreign_keys pragma: the parents of score rows are in the primary
+    # file, which SQLite cannot enforce across; deletes fan out instead
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'ATTACH DATABASE ? AS {CATALOG_SCHEMA}', (f'file:{_catalog_path}?mode=ro',))
+    cursor.close()
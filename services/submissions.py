@@ -0,0 +1,147 @@
+"""
+Idempotent quiz submissions.
+
+Every attempt gets a submission token when it starts (a hidden field
+from start_quiz, or derived from the API's signed attempt token) and the
+Score it produces stores it under a unique index. A second submission of
+the same attempt, be it the timer's auto-submit racing the submit button
+or a client retrying after a timeout, is answered with the first
+submission's result, without regrading or writing anything.
+
+Tokens of recently committed scores are kept in a small per-process LRU,
+filled from the session's after_commit, so most duplicates are answered
+without a query. The database lookup and the unique index catch the
+rest, including two copies racing through different workers. Counters
+submissions.accepted and submissions.duplicates, and the
+submissions.duplicate_rate gauge, are at /admin/metrics.
+"""
+
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session
+from models import db
+from models.score import Score
+from services import metrics
+
+CACHE_SIZE = 10000
+PENDING_KEY = 'submissions_pending'
+
+# The parts of a Score a duplicate is answered with
+Recorded = namedtuple('Recorded', 'id user_id quiz_id total_scored total_questions')
+
+_lock = threading.Lock()
+_recent = OrderedDict()
+_totals = {'accepted': 0, 'duplicates': 0}
+
+def new_token():
+    return secrets.token_hex(16)
+
+def token_for_attempt(attempt):
+    """Submission token of a signed API attempt token"""
+    return hashlib.sha256(attempt.encode()).hexdigest()[:32]
+
+def init_submissions():
+    """Attach the cache listeners (safe to call more than once)"""
+    if not event.contains(Score, 'after_insert', _score_inserted):
+        event.listen(Score, 'after_insert', _score_inserted)
+    if not event.contains(db.session, 'after_commit', _remember_pending):
+        event.listen(db.session, 'after_commit', _remember_pending)
+    if not event.contains(db.session, 'after_rollback', _drop_pending):
+        event.listen(db.session, 'after_rollback', _drop_pending)
+
+def _count(kind, count=1):
+    if not count:
+        return
+    metrics.incr(f'submissions.{kind}', count)
+    with _lock:
+        _totals[kind] += count
+        rate = _totals['duplicates'] / (_totals['accepted'] + _totals['duplicates'])
+    metrics.gauge('submissions.duplicate_rate', round(rate, 4))
+
+# Recently committed tokens
+
+def _score_inserted(mapper, connection, target):
+    session = object_session(target)
+    if session is None or not target.submission_token:
+        return
+    session.info.setdefault(PENDING_KEY, []).append((target.submission_token, Recorded(
+        target.id, target.user_id, target.quiz_id, target.total_scored, target.total_questions)))
+
+def _drop_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+def _remember_pending(session):
+    for token, recorded in session.info.pop(PENDING_KEY, None) or ():
+        _remember(token, recorded)
+        _count('accepted')
+
+def _remember(token, recorded):
+    with _lock:
+        _recent[token] = recorded
+        _recent.move_to_end(token)
+        while len(_recent) > CACHE_SIZE:
+            _recent.popitem(last=False)
+
+# Finding duplicates
+
+def find(token, user_id):
+    """The score already recorded for this token, or None.
+
+    Only the user's own scores match; a Score still pending in the session
+    (an earlier item of the same batch) counts as recorded. The lookup never
+    flushes the session. Run under the user's shard (sharding.for_user)
+    when sharded. Callers report the duplicates they answer with
+    count_duplicates().
+    """
+    recorded = _lookup(token)
+    if recorded is None or recorded.user_id != user_id:
+        return None
+    return recorded
+
+def count_duplicates(count=1):
+    _count('duplicates', count)
+
+def _lookup(token):
+    if not token:
+        return None
+    for pending in db.session.new:
+        if isinstance(pending, Score) and pending.submission_token == token:
+            return pending
+    with _lock:
+        recorded = _recent.get(token)
+    if recorded is None:
+        with db.session.no_autoflush:
+            row = db.session.execute(
+                select(Score.id, Score.user_id, Score.quiz_id, Score.total_scored, Score.total_questions)
+                .where(Score.submission_token == token)
+            ).first()
+        recorded = Recorded(*row) if row is not None else None
+    return recorded
+
+def commit(score):
+    """Commit the session holding a new score; returns (Recorded, duplicate).
+
+    If another copy of the same attempt committed first, the unique index
+    rejects this one: the session is rolled back and the first copy's
+    score is returned instead. Raises ValueError if the token belongs to
+    another user's score.
+    """
+    token, user_id = score.submission_token, score.user_id
+    try:
+        db.session.flush()
+        recorded = Recorded(score.id, score.user_id, score.quiz_id, score.total_scored, score.total_questions)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        original = _lookup(token)
+        if original is None:
+            raise
+        if original.user_id != user_id:
+            raise ValueError('submission token already used')
+        count_duplicates()
+        return original, True
+    return recorded, False
@@ -0,0 +1,234 @@
+"""
+Cache warm-up ahead of scheduled quizzes.
+
+date_of_quiz says when the load will arrive. From a quiz's warmup_minutes
+before the start of that day (QUIZMASTER_WARMUP_LEAD_MINUTES when unset,
+0 turns it off) until the day ends, the warmup job, queued every
+QUIZMASTER_WARMUP_INTERVAL_MINUTES, runs the quiz's steps:
+
+    cache      the catalog tree and the chapter's bank id arrays
+    pages      reads the quiz's questions (or its chapter's bank) and its
+               scores in every shard, so their SQLite pages are in the OS
+               page cache before the first student arrives
+    fragments  renders each question's take-quiz HTML (services/fragments.py)
+
+Pages are shared by every process on the host, so the job reads them
+once. The other caches live in each worker: once the job has recorded a
+run in quiz_warmup, every process's dispatcher fills its own (through
+jobs.on_poll), and a worker started later does so on its first poll. A
+quiz is warmed again whenever the catalog changes, and its quiz_warmup
+row is dropped by the job once its day is over. A quiz with no steps
+chosen is never warmed, not even on demand. report() gives the state of
+the upcoming quizzes for /admin/warmup.
+"""
+
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+from models import db
+from models.chapter import Chapter
+from models.question import Question
+from models.quiz import Quiz
+from models.quiz_warmup import QuizWarmup
+from models.score import Score
+from services import catalog, fragments, jobs, metrics, question_bank, sharding
+
+STEPS = ('cache', 'pages', 'fragments')
+DEFAULT_LEAD_MINUTES = 60
+REPORT_DAYS = 7
+PROCESS_CHECK_SECONDS = 15
+
+_process = {'checked': 0.0, 'warmed': {}}  # quiz id -> warmed_at this process has caught up with
+
+class WarmupStatus:
+    """An upcoming quiz and where its warm-up stands"""
+    __slots__ = ('quiz', 'due_at', 'steps', 'warmup', 'state')
+
+    def __init__(self, quiz, due_at, steps, warmup, state):
+        self.quiz = quiz
+        self.due_at = due_at
+        self.steps = steps
+        self.warmup = warmup
+        self.state = state
+
+def steps_of(quiz):
+    if quiz.warmup_steps is None:
+        return STEPS
+    chosen = quiz.warmup_steps.split(',')
+    return tuple(step for step in STEPS if step in chosen)
+
+def steps_to_text(steps):
+    """warmup_steps value for the chosen steps (None: all of them)"""
+    chosen = [step for step in STEPS if step in steps]
+    return None if len(chosen) == len(STEPS) else ','.join(chosen)
+
+def due_at(quiz):
+    """When warming a quiz starts, or None if it is never warmed"""
+    lead = quiz.warmup_minutes
+    if lead is None:
+        lead = current_app.config.get('QUIZMASTER_WARMUP_LEAD_MINUTES', DEFAULT_LEAD_MINUTES)
+    if lead <= 0 or not steps_of(quiz):
+        return None
+    return datetime.combine(quiz.date_of_quiz, datetime.min.time()) - timedelta(minutes=lead)
+
+def _is_due(quiz, now):
+    start = due_at(quiz)
+    return start is not None and start <= now < datetime.combine(quiz.date_of_quiz, datetime.min.time()) + timedelta(days=1)
+
+# Warming
+
+def _touch_pages(quiz):
+    """Read the rows a quiz's attempts will read; returns how many"""
+    if quiz.is_bank_draw:
+        condition = (Question.chapter_id == quiz.chapter_id) & Question.quiz_id.is_(None)
+    else:
+        condition = Question.quiz_id == quiz.id
+    # Counting the last column reads every row's record, not just an index
+    rows = db.session.execute(select(func.count(Question.option4)).where(condition)).scalar()
+    return rows + sum(sharding.fan_out(_touch_scores, quiz.id))
+
+def _touch_scores(quiz_id):
+    rows = db.session.execute(select(func.count()).select_from(Score).where(Score.quiz_id == quiz_id)).scalar()
+    # The rightmost pages, where this quiz's submissions will be appended
+    db.session.execute(select(func.max(Score.id))).scalar()
+    return rows
+
+def _questions(quiz):
+    query = select(Question).order_by(Question.id).limit(fragments.FRAGMENT_CACHE_SIZE)
+    if quiz.is_bank_draw:
+        query = query.where(Question.chapter_id == quiz.chapter_id, Question.quiz_id.is_(None))
+    else:
+        query = query.where(Question.quiz_id == quiz.id)
+    return db.session.execute(query).scalars()
+
+def _warm_process(quiz, steps):
+    """Fill this process's caches for a quiz; returns fragments rendered"""
+    if 'cache' in steps and quiz.is_bank_draw:
+        question_bank.bank_ids(db.session.get(Chapter, quiz.chapter_id))
+    if 'fragments' in steps:
+        return fragments.prerender(_questions(quiz))
+    return 0
+
+def warm(quiz, tree):
+    """Run a quiz's steps here and record the run for the other processes"""
+    steps = steps_of(quiz)
+    started = time.perf_counter()
+    rows = rendered = 0
+    error = None
+    try:
+        if 'pages' in steps:
+            rows = _touch_pages(quiz)
+        rendered = _warm_process(quiz, steps)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Warming quiz %s failed', quiz.id)
+        error = str(e)
+        metrics.incr('warmup.failures')
+    seconds = time.perf_counter() - started
+
+    warmup = db.session.get(QuizWarmup, quiz.id) or QuizWarmup(quiz_id=quiz.id)
+    warmup.warmed_at = datetime.utcnow()
+    warmup.catalog_version = tree.version
+    warmup.steps = ','.join(steps)
+    warmup.rows = rows
+    warmup.fragments = rendered
+    warmup.seconds = round(seconds, 3)
+    warmup.processes = 1
+    warmup.error = error
+    db.session.add(warmup)
+    db.session.commit()
+
+    _process['warmed'][quiz.id] = warmup.warmed_at
+    metrics.incr('warmup.quizzes')
+    metrics.observe('warmup.quiz', seconds)
+    return warmup
+
+def pending(tree, now=None):
+    """Quizzes whose warm-up window is open and which were not warmed
+    since the catalog last changed (failed runs are tried again)"""
+    now = now or datetime.utcnow()
+    warmed = dict(db.session.execute(
+        select(QuizWarmup.quiz_id, QuizWarmup.catalog_version).where(QuizWarmup.error.is_(None))).all())
+    return [quiz for quiz in tree.quizzes if _is_due(quiz, now) and warmed.get(quiz.id) != tree.version]
+
+def prune(today=None):
+    """Drop the runs of quizzes whose day is over; returns how many"""
+    today = today or datetime.utcnow().date()
+    result = db.session.execute(delete(QuizWarmup).where(
+        QuizWarmup.quiz_id.in_(select(Quiz.id).where(Quiz.date_of_quiz < today))))
+    db.session.commit()
+    return result.rowcount
+
+@jobs.handler('warmup')
+def warmup_job(ctx, quiz_ids=None):
+    """Warm the given quizzes, or every pending one"""
+    tree = catalog.current()
+    if quiz_ids:
+        quizzes = [quiz for quiz in map(tree.quiz, quiz_ids) if quiz is not None and steps_of(quiz)]
+    else:
+        prune()
+        quizzes = pending(tree)
+
+    rows = rendered = 0
+    for index, quiz in enumerate(quizzes):
+        ctx.progress(index / len(quizzes) * 100, f'Warming quiz {quiz.id}')
+        warmup = warm(quiz, tree)
+        rows += warmup.rows
+        rendered += warmup.fragments
+    return {'quizzes': len(quizzes), 'rows': rows, 'fragments': rendered}
+
+jobs.schedule('warmup', 'QUIZMASTER_WARMUP_INTERVAL_MINUTES')
+
+@jobs.on_poll
+def warm_this_process():
+    """Catch this process's caches up with the runs the job recorded"""
+    now = time.monotonic()
+    if now - _process['checked'] < PROCESS_CHECK_SECONDS:
+        return
+    _process['checked'] = now
+
+    tree = catalog.current()
+    recorded = db.session.execute(
+        select(QuizWarmup.quiz_id, QuizWarmup.warmed_at)
+        .join(Quiz, Quiz.id == QuizWarmup.quiz_id)
+        .where(QuizWarmup.error.is_(None), Quiz.date_of_quiz >= datetime.utcnow().date())
+    ).all()
+    for quiz_id, warmed_at in recorded:
+        quiz = tree.quiz(quiz_id)
+        if quiz is None or not steps_of(quiz) or _process['warmed'].get(quiz_id) == warmed_at:
+            continue
+        with metrics.timed('warmup.process'):
+            _warm_process(quiz, steps_of(quiz))
+        _process['warmed'][quiz_id] = warmed_at
+        db.session.execute(
+            update(QuizWarmup).where(QuizWarmup.quiz_id == quiz_id, QuizWarmup.warmed_at == warmed_at)
+            .values(processes=QuizWarmup.processes + 1)
+        )
+        db.session.commit()
+
+# Reporting
+
+def report(days=REPORT_DAYS, now=None):
+    """WarmupStatus of every quiz from today to `days` ahead, soonest first"""
+    now = now or datetime.utcnow()
+    tree = catalog.current()
+    last = now.date() + timedelta(days=days)
+    quizzes = sorted((quiz for quiz in tree.quizzes if now.date() <= quiz.date_of_quiz <= last),
+                     key=lambda quiz: (quiz.date_of_quiz, quiz.id))
+    warmups = {warmup.quiz_id: warmup for warmup in
+               QuizWarmup.query.filter(QuizWarmup.quiz_id.in_([quiz.id for quiz in quizzes]))}
+
+    statuses = []
+    for quiz in quizzes:
+        start, warmup = due_at(quiz), warmups.get(quiz.id)
+        if warmup is not None and warmup.error:
+            state = 'failed'
+        elif warmup is not None:
+            state = 'warm' if warmup.catalog_version == tree.version else 'stale'
+        elif start is None:
+            state = 'off'
+        else:
+            state = 'due' if start <= now else 'scheduled'
+        statuses.append(WarmupStatus(quiz, start, steps_of(quiz), warmup, state))
+    return statuses
@@ -0,0 +1,97 @@
+// Browser side of live hosted quizzes (services/live.py). State arrives as
+// one "state" snapshot on connect, then "tick" frames carrying only what
+// changed; EventSource reconnects by itself and gets a new snapshot.
+class LiveRoom {
+    constructor(baseUrl, code, userId, render) {
+        this.baseUrl = baseUrl.replace(/\/$/, '');
+        this.code = code;
+        this.userId = userId;
+        this.render = render;
+        this.state = null;
+        this.reveal = null;
+    }
+
+    static async create(baseUrl, quizId) {
+        const response = await fetch(`${baseUrl.replace(/\/$/, '')}/sessions`, {
+            method: 'POST',
+            credentials: 'include',
+            body: new URLSearchParams({quiz_id: quizId}),
+        });
+        const body = await response.json();
+        if (!response.ok) {
+            throw new Error(body.error);
+        }
+        return body.code;
+    }
+
+    connect() {
+        this.source = new EventSource(`${this.baseUrl}/${this.code}/events`, {withCredentials: true});
+        this.source.addEventListener('state', (event) => {
+            this.state = JSON.parse(event.data);
+            this.render(this);
+        });
+        this.source.addEventListener('tick', (event) => this.apply(JSON.parse(event.data)));
+        this.source.onerror = () => {
+            if (this.state && this.state.status === 'finished') {
+                this.source.close();
+            }
+        };
+    }
+
+    apply(frame) {
+        const state = this.state;
+        if (!state) {
+            return;
+        }
+        state.seq = frame.seq;
+        if ('status' in frame) state.status = frame.status;
+        if ('participants' in frame) state.participants = frame.participants;
+        if ('answered' in frame) state.answered = frame.answered;
+        if ('reveal' in frame) this.reveal = frame.reveal;
+        if ('question' in frame) {
+            state.question = frame.question;
+            state.you.answered = false;
+        }
+        if (frame.scores && String(this.userId) in frame.scores) {
+            state.you.correct = frame.scores[String(this.userId)];
+        }
+        if (frame.leaderboard) {
+            for (const row of frame.leaderboard) {
+                state.leaderboard[row[0] - 1] = row;
+            }
+            state.leaderboard.length = frame.leaderboard_size;
+        }
+        this.render(this);
+    }
+
+    async post(action, data) {
+        const response = await fetch(`${this.baseUrl}/${this.code}/${action}`, {
+            method: 'POST',
+            credentials: 'include',
+            body: new URLSearchParams(data || {}),
+        });
+        return {ok: response.ok, body: await response.json()};
+    }
+
+    answer(option) {
+        this.state.you.answered = true;
+        this.render(this);
+        return this.post('answers', {index: this.state.question.index, option: option});
+    }
+}
+
+function renderLeaderboard(tbody, rows, userId) {
+    tbody.innerHTML = '';
+    for (const [rank, id, name, correct] of rows) {
+        const tr = document.createElement('tr');
+        if (id === userId) {
+            tr.className = 'table-primary';
+        }
+        for (const value of [rank, name, correct]) {
+            const td = document.createElement('td');
+            td.textContent = value;
+            tr.appendChild(td);
+        }
+        tbody.appendChild(tr);
+    }
+}
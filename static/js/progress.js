@@ -0,0 +1,81 @@
+// Score-over-time chart for the profile and admin score pages. The server
+// (services/series.py) downsamples the history to about as many points as
+// the canvas is wide, so long histories cost the same as short ones.
+function initProgressChart(canvas, select, url) {
+    let chart = null;
+
+    function formatDay(ms) {
+        return new Date(ms).toLocaleDateString();
+    }
+
+    async function load() {
+        const params = new URLSearchParams({points: Math.max(50, Math.round(canvas.clientWidth / 3))});
+        if (select.value) {
+            params.set('subject_id', select.value);
+        }
+        const response = await fetch(`${url}?${params}`, {credentials: 'same-origin'});
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+
+        if (select.options.length === 1) {
+            data.subjects.forEach(function(subject) {
+                select.add(new Option(subject.name, subject.id));
+            });
+        }
+
+        const points = data.points.map(function(point) {
+            return {x: point[0], y: point[1], quiz: point[2]};
+        });
+        if (chart) {
+            chart.destroy();
+        }
+        chart = new Chart(canvas.getContext('2d'), {
+            type: 'line',
+            data: {
+                datasets: [{
+                    label: 'Score %',
+                    data: points,
+                    borderColor: 'rgba(54, 162, 235, 1)',
+                    backgroundColor: 'rgba(54, 162, 235, 0.2)',
+                    pointRadius: points.length > 100 ? 0 : 3,
+                    tension: 0.2
+                }]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                animation: false,
+                parsing: false,
+                scales: {
+                    x: {
+                        type: 'linear',
+                        ticks: {callback: formatDay, maxTicksLimit: 8}
+                    },
+                    y: {min: 0, max: 100}
+                },
+                plugins: {
+                    legend: {display: false},
+                    title: {
+                        display: true,
+                        text: data.total > points.length
+                            ? `${points.length} of ${data.total} attempts shown`
+                            : `${data.total} attempts`
+                    },
+                    tooltip: {
+                        callbacks: {
+                            title: function(items) { return formatDay(items[0].raw.x); },
+                            label: function(item) {
+                                return `${data.quizzes[item.raw.quiz]}: ${item.raw.y}%`;
+                            }
+                        }
+                    }
+                }
+            }
+        });
+    }
+
+    select.addEventListener('change', load);
+    load();
+}
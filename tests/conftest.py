@@ -0,0 +1,109 @@
+import os
+import sys
+from datetime import date
+import pytest
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'secret123'
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """One app for the whole run, on databases in a temporary directory.
+
+    Per-process caches (catalog, bank ids, recent submissions) are keyed by
+    versions that restart with every new database, so tests share this one
+    and each creates its own subjects, quizzes and users.
+    """
+    directory = tmp_path_factory.mktemp('quizmaster')
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv('QUIZMASTER_DATABASE_URI', f'sqlite:///{directory}/quiz_master.db')
+        env.setenv('QUIZMASTER_ARCHIVE_DATABASE_URI', f'sqlite:///{directory}/quiz_master_archive.db')
+        env.setenv('QUIZMASTER_SERIES_DIR', str(directory / 'series'))
+        env.setenv('QUIZMASTER_WARMUP_INTERVAL_MINUTES', '0')
+        env.setenv('QUIZMASTER_SCORE_SHARDS', '0')
+        from app import create_app
+        app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def ctx(app):
+    from models import db
+    with app.app_context():
+        yield
+        db.session.remove()
+
+@pytest.fixture
+def make_user(ctx):
+    from models import db
+    from models.user import User
+    made = []
+
+    def make(name=None):
+        user = User(username=name or f'student{len(made)}-{os.urandom(4).hex()}@example.com',
+                    password_hash=generate_password_hash(PASSWORD), full_name='Student')
+        db.session.add(user)
+        db.session.commit()
+        made.append(user)
+        return user
+    return make
+
+@pytest.fixture
+def make_chapter(ctx):
+    """Chapter factory: make(bank=N) adds N bank questions, the first
+    option correct and tagged 'even'/'odd' alternately"""
+    from models import db
+    from models.subject import Subject
+    from models.chapter import Chapter
+    from models.question import Question
+
+    def make(bank=0, subject=None):
+        subject = subject or Subject(name='Subject')
+        chapter = Chapter(name='Chapter', subject=subject)
+        db.session.add(chapter)
+        db.session.flush()
+        for index in range(bank):
+            db.session.add(Question(chapter_id=chapter.id, tag='even' if index % 2 == 0 else 'odd',
+                                    question_statement=f'Bank question {index}', option1='a', option2='b',
+                                    option3='c', option4='d', correct_option=1))
+        db.session.commit()
+        return chapter
+    return make
+
+@pytest.fixture
+def make_quiz(ctx):
+    """Quiz factory: make(chapter, questions=N) adds N fixed questions,
+    the first option correct; draw_count makes a bank quiz"""
+    from models import db
+    from models.quiz import Quiz
+    from models.question import Question
+
+    def make(chapter, questions=0, draw_count=None, draw_tags=None, day=None):
+        quiz = Quiz(chapter_id=chapter.id, date_of_quiz=day or date.today(), time_duration=30,
+                    draw_count=draw_count, draw_tags=draw_tags)
+        db.session.add(quiz)
+        db.session.flush()
+        for index in range(questions):
+            db.session.add(Question(quiz_id=quiz.id, question_statement=f'Question {index}', option1='a',
+                                    option2='b', option3='c', option4='d', correct_option=1))
+        db.session.commit()
+        return quiz
+    return make
+
+@pytest.fixture
+def login(app):
+    """Test client signed in as the given user"""
+    def sign_in(user):
+        client = app.test_client()
+        client.post('/login', data={'username': user.username, 'password': PASSWORD})
+        return client
+    return sign_in
+
+@pytest.fixture
+def api_headers(app):
+    def headers(user):
+        response = app.test_client().post('/api/v1/tokens', json={'username': user.username, 'password': PASSWORD})
+        return {'Authorization': f"Bearer {response.get_json()['token']}"}
+    return headers
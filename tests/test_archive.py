@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+from models import db
+from models.quiz import Quiz
+from models.score import Score
+from models.score_archive import ScoreArchive
+from services import archive, deletion
+
+def add_attempts(user, quiz, count, start):
+    for index in range(count):
+        db.session.add(Score(quiz_id=quiz.id, user_id=user.id, total_scored=index % 4, total_questions=4,
+                             time_stamp_of_attempt=start + timedelta(hours=index)))
+    db.session.commit()
+
+def archived_user(make_chapter, make_quiz, make_user):
+    """A user with 5 + 7 archived attempts at two quizzes of one chapter,
+    interleaved in time, and 2 recent attempts at the first"""
+    chapter = make_chapter()
+    kept, doomed = make_quiz(chapter, questions=4), make_quiz(chapter, questions=4)
+    user = make_user()
+    long_ago = datetime.utcnow() - timedelta(days=800)
+    kept.created_at = doomed.created_at = long_ago - timedelta(days=1)
+    add_attempts(user, kept, 5, long_ago)
+    add_attempts(user, doomed, 7, long_ago + timedelta(minutes=30))
+    archive.archive_scores(datetime.utcnow() - timedelta(days=400))
+    add_attempts(user, kept, 2, datetime.utcnow() - timedelta(days=1))
+    return user, kept, doomed
+
+def test_rows_survive_encoding():
+    start = datetime(2024, 5, 1, 12, 30, 15, 250)
+    rows = [(1000 + index * 3, 7 + index % 2, start + timedelta(seconds=index * 61), index, 10,
+             None if index == 2 else index * 11) for index in range(5)]
+
+    decoded = archive.decode_rows(archive.encode_rows(rows), user_id=9)
+
+    assert [(row.id, row.quiz_id, row.time_stamp_of_attempt, row.total_scored, row.total_questions, row.seed)
+            for row in decoded] == rows
+    assert {row.user_id for row in decoded} == {9}
+
+def test_history_pages_through_hot_and_archived_rows(make_chapter, make_quiz, make_user):
+    user, kept, doomed = archived_user(make_chapter, make_quiz, make_user)
+
+    pages = [archive.history(user.id, page=page, per_page=4) for page in (1, 2, 3, 4)]
+
+    assert pages[0].total == 14 and pages[0].pages == 4
+    assert [len(page.items) for page in pages] == [4, 4, 4, 2]
+    moments = [row.time_stamp_of_attempt for page in pages for row in page.items]
+    assert moments == sorted(moments, reverse=True)
+
+def test_deleting_a_quiz_drops_its_archived_attempts(app, make_chapter, make_quiz, make_user):
+    user, kept, doomed = archived_user(make_chapter, make_quiz, make_user)
+
+    with app.test_request_context():
+        assert deletion.delete_subtree('quiz', doomed.id) == 'deleted'
+
+    stats = archive.user_stats(user.id)
+    assert stats['attempts'] == 7
+    page = archive.history(user.id, page=1, per_page=4)
+    assert (page.total, page.pages) == (7, 2)
+    second = archive.history(user.id, page=2, per_page=4)
+    assert len(second.items) == 3
+    assert {row.quiz_id for row in page.items + second.items} == {kept.id}
+
+def test_chunked_chapter_delete_drops_archived_blocks(make_chapter, make_quiz, make_user):
+    user, kept, doomed = archived_user(make_chapter, make_quiz, make_user)
+
+    deletion.delete_in_chunks('chapter', kept.chapter_id, chunk_size=3, pause=0)
+
+    assert ScoreArchive.query.filter_by(user_id=user.id).count() == 0
+    assert archive.user_stats(user.id)['attempts'] == 0
+
+def test_purge_drops_attempts_left_by_old_deletes(make_chapter, make_quiz, make_user):
+    user, kept, doomed = archived_user(make_chapter, make_quiz, make_user)
+    db.session.execute(db.delete(Quiz).where(Quiz.id == doomed.id))
+    db.session.commit()
+
+    assert archive.purge_deleted_quizzes() >= 7
+    block = ScoreArchive.query.filter_by(user_id=user.id).one()
+    assert (block.attempts, block.sum_scored, block.sum_questions) == (5, 0 + 1 + 2 + 3 + 0, 20)
+    assert archive.history(user.id, page=1, per_page=20).total == 7
+
+def test_archived_attempts_count_toward_the_chunked_threshold(app, make_chapter, make_quiz, make_user, monkeypatch):
+    user, kept, doomed = archived_user(make_chapter, make_quiz, make_user)
+    # 8 questions and 2 hot scores, plus the attempts in every archived
+    # block since the quizzes were created (this user's 12 among them)
+    archived = archive.attempts_since(kept.created_at)
+    assert archived >= 12
+    assert deletion.subtree_size('chapter', kept.chapter_id) == 10 + archived
+
+    monkeypatch.setitem(app.config, 'QUIZMASTER_CHUNKED_DELETE_THRESHOLD', 10)
+    with app.test_request_context():
+        assert deletion.delete_subtree('chapter', kept.chapter_id) == 'scheduled'
@@ -0,0 +1,28 @@
+from services import backup
+
+def test_runs_name_databases_by_bind_and_verify(app, ctx, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'QUIZMASTER_BACKUP_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'QUIZMASTER_BACKUP_STEP_SLEEP', 0)
+
+    run = backup.run()
+
+    assert [entry['name'] for entry in run.databases] == ['primary', 'archive']
+    assert sorted(path.name for path in (tmp_path / run.stamp).iterdir()) == [
+        'archive.db.gz', 'manifest.json', 'primary.db.gz']
+    assert backup.verify(backup.find(run.stamp)) == [('primary', None), ('archive', None)]
+
+def test_files_with_the_same_name_get_separate_copies(app, ctx, tmp_path, monkeypatch):
+    from models import db
+    monkeypatch.setitem(app.config, 'QUIZMASTER_BACKUP_DIR', str(tmp_path / 'backups'))
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    engines = {}
+    for bind, directory in ((None, 'a'), ('archive', 'b')):
+        path = tmp_path / directory / 'quiz.db'
+        engines[bind] = db.create_engine(f'sqlite:///{path}')
+        with engines[bind].begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE t (x)')
+    monkeypatch.setattr(type(db), 'engines', property(lambda self: engines))
+
+    assert [name for name, _ in backup.databases()] == ['primary', 'archive']
+    assert len(backup.run().databases) == 2
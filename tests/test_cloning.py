@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+from models import db
+from models.chapter import Chapter
+from models.quiz import Quiz
+from models.question import Question
+from services import cloning
+
+def statements(quiz_id):
+    return sorted(question.question_statement for question in Question.query.filter_by(quiz_id=quiz_id))
+
+def test_clone_quiz_copies_questions_and_moves_the_date(make_chapter, make_quiz):
+    chapter = make_chapter()
+    source = make_quiz(chapter, questions=3, day=date(2030, 1, 10))
+
+    new_id, counts = cloning.clone_quiz(source.id, start_date=date(2030, 2, 1), time_duration=45)
+
+    copy = db.session.get(Quiz, new_id)
+    assert counts == {'quizzes': 1, 'questions': 3}
+    assert (copy.chapter_id, copy.date_of_quiz, copy.time_duration) == (chapter.id, date(2030, 2, 1), 45)
+    assert statements(new_id) == statements(source.id)
+
+def test_clone_chapter_maps_every_question_to_its_quizs_copy(make_chapter, make_quiz):
+    chapter = make_chapter(bank=4)
+    quizzes = [make_quiz(chapter, questions=count, day=date(2030, 3, 1) + timedelta(days=7 * index))
+               for index, count in enumerate((2, 5, 1))]
+    for quiz, suffix in zip(quizzes, 'abc'):
+        for question in Question.query.filter_by(quiz_id=quiz.id):
+            question.question_statement += suffix
+    # Another chapter's quiz in between, so the copied ids are not contiguous with the originals
+    make_quiz(make_chapter(), questions=2)
+    db.session.commit()
+
+    new_id, counts = cloning.clone_chapter(chapter.id, name='Copy', shift_days=14)
+
+    assert counts == {'chapters': 1, 'quizzes': 3, 'questions': 12}
+    copies = Quiz.query.filter_by(chapter_id=new_id).order_by(Quiz.id).all()
+    assert [copy.date_of_quiz for copy in copies] == [quiz.date_of_quiz + timedelta(days=14) for quiz in quizzes]
+    assert [statements(copy.id) for copy in copies] == [statements(quiz.id) for quiz in quizzes]
+    bank = Question.query.filter_by(chapter_id=new_id, quiz_id=None).count()
+    assert bank == 4
+    assert db.session.get(Chapter, new_id).name == 'Copy'
+
+def test_clone_subject_copies_each_chapter(make_chapter, make_quiz):
+    first = make_chapter(bank=2)
+    second = make_chapter(subject=first.subject)
+    make_quiz(first, questions=1)
+    make_quiz(second, questions=3)
+
+    new_id, counts = cloning.clone_subject(first.subject_id)
+
+    assert counts == {'chapters': 2, 'quizzes': 2, 'questions': 6}
+    chapters = Chapter.query.filter_by(subject_id=new_id).order_by(Chapter.id).all()
+    assert [len(chapter.quizzes) for chapter in chapters] == [1, 1]
+    assert [statements(chapter.quizzes[0].id) for chapter in chapters] == [
+        statements(first.quizzes[0].id), statements(second.quizzes[0].id)]
+
+def test_reschedule_keeps_the_spacing(make_chapter, make_quiz):
+    chapter = make_chapter()
+    quizzes = [make_quiz(chapter, day=date(2030, 5, day)) for day in (3, 10, 12)]
+
+    changed = cloning.reschedule([quiz.id for quiz in quizzes], start_date=date(2030, 6, 1), time_duration=20)
+
+    db.session.expire_all()
+    assert changed == 3
+    assert [quiz.date_of_quiz for quiz in quizzes] == [date(2030, 6, 1), date(2030, 6, 8), date(2030, 6, 10)]
+    assert {quiz.time_duration for quiz in quizzes} == {20}
+
+def admin_client(make_user, login):
+    admin = make_user()
+    admin.is_admin = True
+    db.session.commit()
+    return login(admin)
+
+def test_clone_into_a_missing_target_is_a_404(make_chapter, make_quiz, make_user, login):
+    chapter = make_chapter()
+    quiz = make_quiz(chapter, questions=1)
+    client = admin_client(make_user, login)
+
+    assert client.post(f'/admin/quizzes/{quiz.id}/clone', data={'chapter_id': 999999}).status_code == 404
+    assert client.post(f'/admin/chapters/{chapter.id}/clone', data={'subject_id': 999999}).status_code == 404
+    assert Quiz.query.filter_by(chapter_id=chapter.id).count() == 1
+
+def test_bank_quiz_is_not_cloned_into_a_bank_that_cannot_serve_it(make_chapter, make_quiz, make_user, login):
+    quiz = make_quiz(make_chapter(bank=10), draw_count=6, draw_tags='{"odd": 3}')
+    small, untagged, enough = make_chapter(bank=4), make_chapter(), make_chapter(bank=8)
+    db.session.add_all(Question(chapter_id=untagged.id, question_statement=f'Untagged {index}', option1='a',
+                                option2='b', option3='c', option4='d', correct_option=1) for index in range(8))
+    db.session.commit()
+    client = admin_client(make_user, login)
+
+    for target in (small, untagged):
+        page = client.post(f'/admin/quizzes/{quiz.id}/clone', data={'chapter_id': target.id}).get_data(as_text=True)
+        assert 'Cannot copy this quiz' in page
+        assert Quiz.query.filter_by(chapter_id=target.id).count() == 0
+
+    response = client.post(f'/admin/quizzes/{quiz.id}/clone', data={'chapter_id': enough.id})
+    assert response.status_code == 302
+    assert Quiz.query.filter_by(chapter_id=enough.id).one().draw_count == 6
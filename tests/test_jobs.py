@@ -0,0 +1,29 @@
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import db
+from models.job import Job
+from services import jobs
+
+def test_each_schedule_slot_is_tried_once(app, ctx, monkeypatch):
+    monkeypatch.setattr(jobs, 'SCHEDULES', {'tick': 'TEST_TICK_MINUTES'})
+    monkeypatch.setattr(jobs, '_slots', {})
+    monkeypatch.setitem(app.config, 'TEST_TICK_MINUTES', 60)
+    inserts = []
+    thread = threading.get_ident()
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith('INSERT INTO job') and threading.get_ident() == thread:
+            inserts.append(statement)
+
+    start = datetime(2030, 1, 1, 9, 5)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        for minutes in (0, 20, 40, 60, 70):
+            jobs.enqueue_due(start + timedelta(minutes=minutes))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+        db.session.execute(db.delete(Job).where(Job.kind == 'tick'))
+        db.session.commit()
+
+    assert len(inserts) == 2
@@ -0,0 +1,110 @@
+import re
+import pytest
+from models import db
+from models.question import Question
+from models.score import Score
+from services import question_bank
+
+def change_bank(chapter, remove_id):
+    """Add a question to the chapter's bank and delete one, as an admin would"""
+    db.session.add(Question(chapter_id=chapter.id, question_statement='Added later', option1='a', option2='b',
+                            option3='c', option4='d', correct_option=1))
+    db.session.delete(db.session.get(Question, remove_id))
+    question_bank.bump_bank_version(chapter.id)
+    db.session.commit()
+
+def shown_ids(page):
+    return [int(question_id) for question_id in dict.fromkeys(re.findall(r'name="question_(\d+)"', page))]
+
+def test_draw_is_repeatable_per_seed(make_chapter, make_quiz):
+    chapter = make_chapter(bank=40)
+    quiz = make_quiz(chapter, draw_count=10)
+
+    first = question_bank.draw_question_ids(quiz, 1234)
+    assert first == question_bank.draw_question_ids(quiz, 1234)
+    assert len(first) == len(set(first)) == 10
+    assert set(first) <= set(question_bank.bank_ids(chapter)[None])
+
+def test_draw_fills_tag_quotas(make_chapter, make_quiz):
+    chapter = make_chapter(bank=40)
+    quiz = make_quiz(chapter, draw_count=6, draw_tags=question_bank.quotas_to_json({'odd': 4}))
+    odd = set(question_bank.bank_ids(chapter)['odd'])
+
+    for seed in range(20):
+        drawn = question_bank.draw_question_ids(quiz, seed)
+        assert len(drawn) == 6
+        assert len(odd.intersection(drawn)) >= 4
+
+def test_draw_larger_than_bank_takes_it_all(make_chapter, make_quiz):
+    chapter = make_chapter(bank=5)
+    quiz = make_quiz(chapter, draw_count=8)
+
+    assert sorted(question_bank.draw_question_ids(quiz, 7)) == list(question_bank.bank_ids(chapter)[None])
+
+def test_submit_grades_the_questions_shown_after_bank_changes(make_chapter, make_quiz, make_user, login):
+    chapter = make_chapter(bank=30)
+    quiz = make_quiz(chapter, draw_count=5)
+    user = make_user()
+    client = login(user)
+
+    page = client.get(f'/user/quiz/{quiz.id}/start').get_data(as_text=True)
+    ids = shown_ids(page)
+    token = re.search(r'name="submission_token" value="(\w+)"', page).group(1)
+    change_bank(chapter, ids[0])
+
+    answers = {f'question_{question_id}': '1' for question_id in ids}
+    response = client.post(f'/user/quiz/{quiz.id}/submit', data=dict(answers, submission_token=token),
+                           follow_redirects=True)
+
+    assert 'were removed during your attempt' in response.get_data(as_text=True)
+    score = Score.query.filter_by(user_id=user.id, quiz_id=quiz.id).one()
+    assert (score.total_scored, score.total_questions) == (4, 4)
+
+def test_api_attempt_keeps_its_questions_after_bank_changes(make_chapter, make_quiz, make_user, app, api_headers):
+    chapter = make_chapter(bank=30)
+    quiz = make_quiz(chapter, draw_count=5)
+    headers = api_headers(make_user())
+    client = app.test_client()
+
+    payload = client.get(f'/api/v1/quizzes/{quiz.id}', headers=headers).get_json()
+    ids = [row[0] for row in payload['questions']]
+    change_bank(chapter, ids[1])
+
+    again = client.get(f"/api/v1/quizzes/{quiz.id}?attempt={payload['attempt']}", headers=headers).get_json()
+    assert [row[0] for row in again['questions']] == ids
+    assert again['questions'][1] == [ids[1], None, None]
+
+    # Answers follow the order shown; the one for the deleted question is ignored
+    result = client.post(f'/api/v1/quizzes/{quiz.id}/submissions', headers=headers,
+                         json={'attempt': payload['attempt'], 'answers': [1, 1, 1, 2, 2]}).get_json()
+    assert (result['scored'], result['total'], result['bank_changed']) == (2, 4, True)
+
+def test_past_bank_versions_are_redrawn_from_snapshots(make_chapter, make_quiz):
+    chapter = make_chapter(bank=12)
+    quiz = make_quiz(chapter, draw_count=6)
+    version, drawn = question_bank.draw(quiz, 99)
+    change_bank(chapter, drawn[0])
+    question_bank._cache.clear()  # as in a worker that never saw the old bank
+
+    assert question_bank.draw_question_ids(quiz, 99, version) == drawn
+    assert question_bank.draw_question_ids(quiz, 99) != drawn
+    with pytest.raises(question_bank.DrawUnavailable):
+        question_bank.draw_question_ids(quiz, 99, version + 5)
+
+def test_fixed_quiz_redraw_ignores_questions_added_later(make_chapter, make_quiz):
+    quiz = make_quiz(make_chapter(), questions=6)
+    version, drawn = question_bank.draw(quiz, 5)
+    db.session.add(Question(quiz_id=quiz.id, question_statement='Added later', option1='a', option2='b',
+                            option3='c', option4='d', correct_option=1))
+    db.session.commit()
+
+    assert question_bank.draw_question_ids(quiz, 5, version) == drawn
+
+def test_web_attempt_keeps_only_the_seed_in_the_session(make_chapter, make_quiz, make_user, login):
+    quiz = make_quiz(make_chapter(bank=500), draw_count=200)
+    client = login(make_user())
+    client.get(f'/user/quiz/{quiz.id}/start')
+
+    with client.session_transaction() as session:
+        assert session['quiz_draw_version'] == quiz.chapter.bank_version
+        assert not any(isinstance(value, list) for value in session.values())
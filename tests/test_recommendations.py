@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db
+from models.score import Score
+from models.recommendation import ChapterRecommendation
+from services import recommendations
+
+def rows_of(user):
+    return {row.chapter_id: (row.attempts, round(row.weighted_scored, 6), round(row.weighted_questions, 6),
+                             row.last_attempt, row.quiz_ids)
+            for row in ChapterRecommendation.query.filter_by(user_id=user.id)}
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_rebuild_matches_incremental_rows(monkeypatch, make_chapter, make_quiz, make_user, vectorized):
+    if vectorized and recommendations.np is None:
+        pytest.skip('NumPy is not installed')
+    if not vectorized:
+        monkeypatch.setattr(recommendations, 'np', None)
+    first, second = make_chapter(), make_chapter()
+    quizzes = [make_quiz(first, questions=4), make_quiz(first, questions=4), make_quiz(second, questions=4)]
+    user = make_user()
+    start = datetime.utcnow() - timedelta(days=90)
+    for index in range(9):
+        db.session.add(Score(quiz_id=quizzes[index % 3].id, user_id=user.id, total_scored=index % 5,
+                             total_questions=4, time_stamp_of_attempt=start + timedelta(days=index * 7)))
+        db.session.commit()
+    incremental = rows_of(user)
+
+    recommendations.rebuild()
+    db.session.expire_all()
+
+    assert rows_of(user) == incremental
+    assert set(incremental) == {first.id, second.id}
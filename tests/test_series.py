@@ -0,0 +1,68 @@
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+from models import db
+from models.score import Score
+from services import series
+
+def add_scores(user, quiz, count, start):
+    for index in range(count):
+        db.session.add(Score(quiz_id=quiz.id, user_id=user.id, total_scored=index % 5, total_questions=4,
+                             time_stamp_of_attempt=start + timedelta(hours=index)))
+    db.session.commit()
+
+def record_count(user):
+    return os.path.getsize(series.series_path(user.id)) // series.RECORD_SIZE
+
+def test_lttb_keeps_the_ends_and_the_extremes():
+    xs = [float(x) for x in range(1000)]
+    ys = [0.0] * 1000
+    ys[500] = 100.0
+    chosen = series._lttb_python(xs, ys, 50)
+
+    assert len(chosen) == 50 and chosen[0] == 0 and chosen[-1] == 999
+    assert 500 in chosen
+    assert series._lttb_python(xs[:30], ys[:30], 50) == list(range(30))
+    if series.np is not None:
+        assert list(series._lttb_numpy(series.np.array(xs), series.np.array(ys), 50)) == chosen
+
+def test_attempts_before_the_first_read_are_built_in(make_chapter, make_quiz, make_user):
+    quiz, user = make_quiz(make_chapter(), questions=4), make_user()
+    add_scores(user, quiz, 3, datetime.utcnow() - timedelta(days=3))
+    assert not os.path.exists(series.series_path(user.id))
+
+    times, percentages, _ = series.load(user.id)
+    assert len(times) == 3
+
+    add_scores(user, quiz, 2, datetime.utcnow())
+    assert record_count(user) == 5
+
+def test_append_skips_attempts_a_newer_build_already_has(make_chapter, make_quiz, make_user):
+    quiz, user = make_quiz(make_chapter(), questions=4), make_user()
+    attempted_at = datetime.utcnow()
+    flushed_at = time.time()
+    add_scores(user, quiz, 1, attempted_at)
+    series.delete_user(user.id)
+
+    # A build that read the database after the commit, then the commit's append
+    series.build(user.id)
+    point = series._point(attempted_at, 0, 4, quiz.id)
+    series.append(user.id, [point], since=flushed_at)
+    assert record_count(user) == 1
+
+    # Appends older than the build's read that it did not see still go in
+    later = series._point(attempted_at + timedelta(minutes=5), 3, 4, quiz.id)
+    series.append(user.id, [later], since=flushed_at)
+    assert record_count(user) == 2
+
+@pytest.mark.parametrize('points', [3, 50])
+def test_chart_downsamples_to_the_requested_points(app, make_chapter, make_quiz, make_user, points):
+    quiz, user = make_quiz(make_chapter(), questions=4), make_user()
+    add_scores(user, quiz, 120, datetime.utcnow() - timedelta(days=10))
+
+    with app.test_request_context():
+        chart = series.chart(user.id, points=points)
+    assert chart['total'] == 120
+    assert len(chart['points']) == points
+    assert [row[0] for row in chart['points']] == sorted(row[0] for row in chart['points'])
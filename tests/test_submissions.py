@@ -0,0 +1,122 @@
+import re
+from models import db
+from models.score import Score
+from services import submissions
+
+def start(client, quiz):
+    page = client.get(f'/user/quiz/{quiz.id}/start').get_data(as_text=True)
+    ids = dict.fromkeys(re.findall(r'name="question_(\d+)"', page))
+    token = re.search(r'name="submission_token" value="(\w+)"', page).group(1)
+    return {f'question_{question_id}': '1' for question_id in ids}, token
+
+def test_token_for_attempt_is_stable():
+    assert submissions.token_for_attempt('abc') == submissions.token_for_attempt('abc')
+    assert submissions.token_for_attempt('abc') != submissions.token_for_attempt('abd')
+    assert len(submissions.token_for_attempt('abc')) == 32
+
+def test_double_submit_records_one_score(make_chapter, make_quiz, make_user, login):
+    quiz, user = make_quiz(make_chapter(), questions=3), make_user()
+    client = login(user)
+    answers, token = start(client, quiz)
+
+    first = client.post(f'/user/quiz/{quiz.id}/submit', data=dict(answers, submission_token=token))
+    again = client.post(f'/user/quiz/{quiz.id}/submit', data=dict(answers, submission_token=token))
+    submissions._recent.clear()  # the same, answered from the database
+    third = client.post(f'/user/quiz/{quiz.id}/submit', data=dict(answers, submission_token=token))
+
+    assert first.location == again.location == third.location
+    assert Score.query.filter_by(user_id=user.id, quiz_id=quiz.id).count() == 1
+
+def test_tokens_only_match_their_own_user(make_chapter, make_quiz, make_user):
+    quiz, owner, other = make_quiz(make_chapter(), questions=1), make_user(), make_user()
+    db.session.add(Score(quiz_id=quiz.id, user_id=owner.id, total_scored=1, total_questions=1,
+                         submission_token='t' * 32))
+    db.session.commit()
+
+    assert submissions.find('t' * 32, other.id) is None
+    assert submissions.find('t' * 32, owner.id).user_id == owner.id
+    assert submissions.find(None, owner.id) is None
+
+def test_losing_the_race_returns_the_first_score(make_chapter, make_quiz, make_user):
+    quiz, user = make_quiz(make_chapter(), questions=2), make_user()
+    token = submissions.new_token()
+    db.session.add(Score(quiz_id=quiz.id, user_id=user.id, total_scored=2, total_questions=2, submission_token=token))
+    db.session.commit()
+    submissions._recent.clear()
+
+    late = Score(quiz_id=quiz.id, user_id=user.id, total_scored=0, total_questions=2, submission_token=token)
+    db.session.add(late)
+    recorded, duplicate = submissions.commit(late)
+
+    assert duplicate and recorded.total_scored == 2
+    assert Score.query.filter_by(user_id=user.id).count() == 1
+
+def test_api_resubmission_is_flagged_duplicate(make_chapter, make_quiz, make_user, app, api_headers):
+    quiz = make_quiz(make_chapter(), questions=2)
+    headers = api_headers(make_user())
+    client = app.test_client()
+    attempt = client.get(f'/api/v1/quizzes/{quiz.id}', headers=headers).get_json()['attempt']
+    body = {'attempt': attempt, 'answers': [1, 1]}
+
+    first = client.post(f'/api/v1/quizzes/{quiz.id}/submissions', headers=headers, json=body)
+    again = client.post(f'/api/v1/quizzes/{quiz.id}/submissions', headers=headers, json=body)
+
+    assert (first.status_code, again.status_code) == (201, 200)
+    assert again.get_json()['duplicate'] and again.get_json()['score_id'] == first.get_json()['score_id']
+
+def test_batch_retries_when_a_copy_commits_first(make_chapter, make_quiz, make_user, app, api_headers, monkeypatch):
+    quiz = make_quiz(make_chapter(), questions=2)
+    headers = api_headers(make_user())
+    client = app.test_client()
+    items, firsts = [], []
+    for answers in ([1, 2], [1, 1]):
+        attempt = client.get(f'/api/v1/quizzes/{quiz.id}', headers=headers).get_json()['attempt']
+        items.append({'quiz_id': quiz.id, 'attempt': attempt, 'answers': answers})
+        firsts.append(client.post(f'/api/v1/quizzes/{quiz.id}/submissions', headers=headers,
+                                  json=items[-1]).get_json())
+
+    # The first pass misses the first item's copy, as if it committed in
+    # another worker just after the lookup; looking up the second item must
+    # not flush the first into the unique index
+    find, missed = submissions.find, []
+
+    def late_find(token, user_id):
+        if token == submissions.token_for_attempt(items[0]['attempt']) and not missed:
+            missed.append(token)
+            return None
+        return find(token, user_id)
+    monkeypatch.setattr(submissions, 'find', late_find)
+    submissions._recent.clear()
+    duplicates = submissions._totals['duplicates']
+    response = client.post('/api/v1/submissions/batch', headers=headers, json={'submissions': items})
+
+    assert response.status_code == 200 and missed
+    assert response.get_json()['results'] == [dict(first, duplicate=True) for first in firsts]
+    assert submissions._totals['duplicates'] == duplicates + 2
+
+def test_batch_answers_a_repeated_item_from_the_same_batch(make_chapter, make_quiz, make_user, app, api_headers):
+    quiz, user = make_quiz(make_chapter(), questions=2), make_user()
+    headers = api_headers(user)
+    client = app.test_client()
+    attempt = client.get(f'/api/v1/quizzes/{quiz.id}', headers=headers).get_json()['attempt']
+    item = {'quiz_id': quiz.id, 'attempt': attempt, 'answers': [1, 1]}
+
+    results = client.post('/api/v1/submissions/batch', headers=headers,
+                          json={'submissions': [item, item]}).get_json()['results']
+
+    assert [result['duplicate'] for result in results] == [False, True]
+    assert results[0]['score_id'] == results[1]['score_id'] is not None
+    assert Score.query.filter_by(user_id=user.id).count() == 1
+
+def test_another_users_token_is_rejected(make_chapter, make_quiz, make_user, login):
+    quiz, owner, other = make_quiz(make_chapter(), questions=1), make_user(), make_user()
+    db.session.add(Score(quiz_id=quiz.id, user_id=owner.id, total_scored=1, total_questions=1,
+                         submission_token='u' * 32))
+    db.session.commit()
+    client = login(other)
+    answers, _ = start(client, quiz)
+
+    response = client.post(f'/user/quiz/{quiz.id}/submit', data=dict(answers, submission_token='u' * 32))
+
+    assert response.status_code == 400
+    assert Score.query.filter_by(user_id=other.id).count() == 0
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+from models import db
+from models.quiz_warmup import QuizWarmup
+from services import catalog, warmup
+
+class Context:
+    def progress(self, percent, message=None):
+        pass
+
+def test_quizzes_without_steps_are_not_warmed(make_chapter, make_quiz):
+    quiz = make_quiz(make_chapter(), questions=2)
+    quiz.warmup_steps = ''
+    db.session.commit()
+
+    assert warmup.steps_of(quiz) == ()
+    assert warmup.warmup_job(Context(), quiz_ids=[quiz.id])['quizzes'] == 0
+    assert db.session.get(QuizWarmup, quiz.id) is None
+
+def test_runs_of_past_quizzes_are_pruned(make_chapter, make_quiz):
+    chapter = make_chapter()
+    today = datetime.utcnow().date()
+    past = make_quiz(chapter, questions=1, day=today - timedelta(days=1))
+    upcoming = make_quiz(chapter, questions=1, day=today)
+    tree = catalog.current()
+    for quiz in (past, upcoming):
+        warmup.warm(tree.quiz(quiz.id), tree)
+
+    assert warmup.prune(today) >= 1
+    assert db.session.get(QuizWarmup, past.id) is None
+    assert db.session.get(QuizWarmup, upcoming.id).rows >= 1
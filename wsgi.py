@@ -0,0 +1,14 @@
+"""
+WSGI entry point for production servers, e.g.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+from services.health import warm_up
+
+app = create_app()
+
+# With preload_app the master warms up once before forking, so workers
+# inherit compiled templates and only need to reconnect (see gunicorn.conf.py)
+warm_up(app)